@@ -0,0 +1,112 @@
+"""
+Caching of the gradebook read queries. Cached results are keyed on a per-course generation
+counter, which is bumped whenever the gradebook of the course changes, so every entry of the
+course is invalidated at once without having to track individual keys.
+"""
+import hashlib
+import inspect
+import time
+from functools import wraps
+
+from dogapi import dog_stats_api
+from django.conf import settings
+from django.core.cache import caches
+
+
+def _get_cache():
+    """
+    Returns the cache backend configured for gradebook queries
+    """
+    return caches[getattr(settings, 'GRADEBOOK_CACHE_ALIAS', 'default')]
+
+
+def _generation_cache_key(course_key):
+    """
+    Returns the cache key of the course generation counter
+    """
+    return u'gradebook.generation.{}'.format(course_key)
+
+
+def _new_generation():
+    """
+    Seeds a generation counter. Time based, so that a counter evicted from the cache never
+    restarts at a value used by entries still cached.
+    """
+    return int(time.time() * 1000)
+
+
+def get_course_generation(course_key):
+    """
+    Returns the current generation of the course gradebook
+    """
+    cache = _get_cache()
+    cache_key = _generation_cache_key(course_key)
+    generation = cache.get(cache_key)
+    if generation is None:
+        generation = _new_generation()
+        if not cache.add(cache_key, generation, None):
+            generation = cache.get(cache_key, generation)
+    return generation
+
+
+def invalidate_course_cache(course_key):
+    """
+    Invalidates every cached gradebook query of the course. Called within a transaction, a
+    concurrent reader can still cache the data committed before it: writers call it again once
+    their outermost transaction is over (Django 1.8 has no on_commit hook).
+    """
+    cache = _get_cache()
+    cache_key = _generation_cache_key(course_key)
+    try:
+        cache.incr(cache_key)
+    except ValueError:
+        cache.set(cache_key, _new_generation(), None)
+
+
+def _normalize(value):
+    """
+    Turns lists and sets into sorted tuples, so that equivalent arguments share a cache key
+    """
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return tuple(sorted(value))
+    return value
+
+
+def cached_course_query(query_name):
+    """
+    Decorator caching the result of a classmethod whose first argument is a course key.
+    Apply it below @classmethod. The cache key covers every argument of the call, with
+    list arguments (e.g. exclude_users) compared as sets.
+    """
+    def decorator(func):
+        """
+        Wraps the query function
+        """
+        @wraps(func)
+        def wrapper(cls, course_key, *args, **kwargs):
+            """
+            Serves the query from the cache when the course generation is unchanged
+            """
+            call_args = inspect.getcallargs(func, cls, course_key, *args, **kwargs)
+            call_args.pop(inspect.getargspec(func).args[0])
+            arguments = sorted((name, _normalize(value)) for name, value in call_args.iteritems())
+            cache_key = u'gradebook.{}.{}.{}.{}'.format(
+                query_name,
+                course_key,
+                get_course_generation(course_key),
+                hashlib.md5(repr(arguments)).hexdigest()
+            )
+
+            cache = _get_cache()
+            result = cache.get(cache_key)
+            tags = [u'query:{}'.format(query_name)]
+            if result is not None:
+                dog_stats_api.increment('gradebook.cache.hit', tags=tags)
+                return result
+
+            dog_stats_api.increment('gradebook.cache.miss', tags=tags)
+            result = func(cls, course_key, *args, **kwargs)
+            cache.set(cache_key, result, getattr(settings, 'GRADEBOOK_CACHE_TIMEOUT', 300))
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,116 @@
+"""
+Framework for gradebook data migrations. Rows are streamed in bounded, primary key ordered
+batches (keyset pagination), so memory stays flat whatever the table size, and rewritten with
+one queryset update per distinct new value, so no model save() or post_save receiver runs.
+"""
+import logging
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+
+log = logging.getLogger(__name__)
+
+MODEL_SIGNALS = (pre_save, post_save, pre_delete, post_delete)
+
+
+@contextmanager
+def suppress_model_signals(*models):
+    """
+    Context manager detaching the pre/post save and delete receivers of the given models,
+    e.g. the history and leaderboard maintenance of StudentGradebook, while data is migrated
+    """
+    sender_ids = set(id(model) for model in models)
+    detached = []
+    for signal in MODEL_SIGNALS:
+        with signal.lock:
+            kept = [entry for entry in signal.receivers if entry[0][1] not in sender_ids]
+            detached.append((signal, [entry for entry in signal.receivers if entry[0][1] in sender_ids]))
+            signal.receivers = kept
+            signal.sender_receivers_cache.clear()
+    try:
+        yield
+    finally:
+        for signal, entries in detached:
+            with signal.lock:
+                signal.receivers.extend(entries)
+                signal.sender_receivers_cache.clear()
+
+
+def iterate_in_batches(queryset, fields, batch_size):
+    """
+    Yields the rows of the queryset as lists of value dicts of at most batch_size rows,
+    paginating on the primary key rather than with offsets
+    """
+    last_pk = None
+    while True:
+        batch_queryset = queryset.order_by('pk')
+        if last_pk is not None:
+            batch_queryset = batch_queryset.filter(pk__gt=last_pk)
+        rows = list(batch_queryset.values('pk', *fields)[:batch_size])
+        if not rows:
+            return
+        last_pk = rows[-1]['pk']
+        yield rows
+
+
+class BatchedMigration(object):
+    """
+    Base class of a gradebook data migration. Subclasses set the model and the fields read for
+    each row, and implement transform() returning the new field values of a row (or None when
+    the row is already migrated).
+    """
+    model = None
+    fields = ()
+
+    def __init__(self, batch_size=1000, dry_run=False):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+
+    def get_queryset(self):
+        """
+        Returns the rows to migrate
+        """
+        return self.model.objects.all()
+
+    def transform(self, row):
+        """
+        Returns a dict of the changed field values of the row, or None
+        """
+        raise NotImplementedError
+
+    def run(self):
+        """
+        Migrates the rows and returns how many changed (or would change, on a dry run)
+        """
+        name = self.model.__name__
+        total = self.get_queryset().count()
+        processed = changed = 0
+        start_time = time.time()
+        log.warning('%s %s: %s rows to scan', 'Checking' if self.dry_run else 'Migrating', name, total)
+
+        with suppress_model_signals(self.model):
+            for rows in iterate_in_batches(self.get_queryset(), self.fields, self.batch_size):
+                updates = defaultdict(list)
+                for row in rows:
+                    values = self.transform(row)
+                    if values:
+                        updates[tuple(sorted(values.items()))].append(row['pk'])
+
+                if not self.dry_run:
+                    with transaction.atomic():
+                        for values, pks in updates.iteritems():
+                            self.model.objects.filter(pk__in=pks).update(**dict(values))
+
+                processed += len(rows)
+                changed += sum(len(pks) for pks in updates.itervalues())
+                elapsed = time.time() - start_time
+                log.info(
+                    '%s: %s/%s rows scanned, %s changed (%.1f rows/s)',
+                    name, processed, total, changed, processed / elapsed if elapsed else 0
+                )
+
+        log.warning('Complete! %s: %s rows %s', name, changed, 'to change' if self.dry_run else 'changed')
+        return changed
@@ -0,0 +1,81 @@
+"""
+Streaming serialization of gradebook and history rows as CSV or newline-delimited JSON (NDJSON),
+shared by the export_gradebook and import_gradebook management commands. Rows are written and
+read one at a time, so files of any size are processed in constant memory.
+"""
+import csv
+import json
+
+from django.utils.dateparse import parse_datetime
+from opaque_keys.edx.keys import CourseKey
+
+FORMATS = ('csv', 'ndjson')
+GRADEBOOK_COLUMNS = ('user_id', 'course_id', 'grade', 'proforma_grade', 'is_complete', 'created', 'modified')
+HISTORY_COLUMNS = ('user_id', 'course_id', 'grade', 'proforma_grade', 'created', 'modified')
+SUMMARY_COLUMNS = ('progress_summary', 'grade_summary', 'grading_policy')
+
+
+def _export_value(value):
+    """
+    Returns the JSON compatible form of a column value
+    """
+    if value is None or isinstance(value, (bool, int, long, float)):
+        return value
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return unicode(value)
+
+
+def write_rows(stream, rows, columns, file_format):
+    """
+    Writes the given row dicts to the stream, with a header line for CSV, and returns how many
+    were written
+    """
+    count = 0
+    if file_format == 'csv':
+        writer = csv.writer(stream)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow([
+                '' if row[column] is None else unicode(_export_value(row[column])).encode('utf-8')
+                for column in columns
+            ])
+            count += 1
+    else:
+        for row in rows:
+            stream.write(json.dumps({column: _export_value(row[column]) for column in columns}))
+            stream.write('\n')
+            count += 1
+    return count
+
+
+def _import_row(row):
+    """
+    Converts the column values of a read row to their Python types
+    """
+    values = {}
+    for column, value in row.iteritems():
+        if column == 'user_id':
+            values[column] = int(value)
+        elif column == 'course_id':
+            values[column] = CourseKey.from_string(value)
+        elif column in ('grade', 'proforma_grade'):
+            values[column] = float(value)
+        elif column in ('created', 'modified'):
+            values[column] = parse_datetime(value) if value else None
+        elif column in SUMMARY_COLUMNS:
+            values[column] = value or u''
+    return values
+
+
+def read_rows(stream, file_format):
+    """
+    Yields the rows of the stream as dicts of typed column values. Unknown columns are ignored.
+    """
+    if file_format == 'csv':
+        for row in csv.DictReader(stream):
+            yield _import_row({column: value.decode('utf-8') for column, value in row.iteritems()})
+    else:
+        for line in stream:
+            if line.strip():
+                yield _import_row(json.loads(line))
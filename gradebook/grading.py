@@ -0,0 +1,193 @@
+"""
+Compiled grading policies. The grading policy of a course is interpreted once per published
+course version, instead of once per graded learner, and kept in a bounded in-process LRU cache.
+
+Compiled policies also grade many learners at once from the section scores stored in their
+progress summaries, evaluating the policy as NumPy array operations.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy
+from django.conf import settings
+from courseware import grades
+from xmodule.graders import Score
+
+from gradebook.utils import blob_hash, serialize_blob
+
+_compiled_policies = OrderedDict()
+_compiled_policies_lock = threading.Lock()
+
+
+class CompiledGradingPolicy(object):
+    """
+    Grading policy of a course version, flattened for repeated evaluation: assignment types with
+    their weights, drop and minimum counts, letter grades ordered by descending cutoff, the
+    course grader and the serialized policy stored on gradebook entries.
+    """
+
+    def __init__(self, grading_policy, grader, grade_cutoffs):
+        self.grading_policy = grading_policy
+        self.grading_policy_json = serialize_blob(grading_policy)
+        self.grading_policy_hash = blob_hash(self.grading_policy_json)
+        self.grader = grader
+
+        assignment_types = grading_policy.get('GRADER', [])
+        self.types = tuple(assignment_type.get('type') for assignment_type in assignment_types)
+        self.weights = tuple(float(assignment_type.get('weight', 0)) for assignment_type in assignment_types)
+        self.drop_counts = tuple(int(assignment_type.get('drop_count', 0)) for assignment_type in assignment_types)
+        self.min_counts = tuple(int(assignment_type.get('min_count', 0)) for assignment_type in assignment_types)
+
+        descending_cutoffs = sorted(grade_cutoffs.items(), key=lambda item: item[1], reverse=True)
+        self.letter_grades = tuple(letter_grade for letter_grade, __ in descending_cutoffs)
+        self.cutoffs = tuple(cutoff for __, cutoff in descending_cutoffs)
+
+    def letter_grade(self, percent):
+        """
+        Returns the letter grade of the percent, or None when it is below every cutoff
+        """
+        for letter_grade, cutoff in zip(self.letter_grades, self.cutoffs):
+            if percent >= cutoff:
+                return letter_grade
+        return None
+
+    def grade(self, totaled_scores):
+        """
+        Grades the per-format section totals of a learner, the way courseware.grades.grade does
+        """
+        grade_summary = self.grader.grade(totaled_scores)
+        grade_summary['percent'] = round(grade_summary['percent'] * 100 + 0.05) / 100
+        grade_summary['grade'] = self.letter_grade(grade_summary['percent'])
+        grade_summary['totaled_scores'] = totaled_scores
+        return grade_summary
+
+    def proforma_grade(self, grade_summary):
+        """
+        Returns the proforma grade of a grade summary
+        """
+        return grades.calculate_proforma_grade(grade_summary, self.grading_policy)
+
+    def grade_arrays(self, section_scores, learners):
+        """
+        Grades many learners at once. section_scores maps assignment types to pairs of
+        (learners x sections) arrays of earned and possible points. Returns the arrays of
+        the percents and proforma grades, as grade() and proforma_grade() compute them:
+        sections missing up to the minimum count score zero, the lowest drop_count section
+        percents are dropped, and the proforma grade projects the average of the attempted
+        assignment types over the weight of the unattempted ones.
+        """
+        percents = numpy.zeros(learners)
+        proforma_grades = numpy.zeros(learners)
+        attempted_weights = numpy.zeros(learners)
+        attempted_percents = numpy.zeros(learners)
+        attempted_types = numpy.zeros(learners)
+        for assignment_type, weight, drop_count, min_count in zip(
+                self.types, self.weights, self.drop_counts, self.min_counts):
+            earned, possible = section_scores.get(assignment_type, (numpy.zeros((learners, 0)),) * 2)
+            section_percents = numpy.where(possible > 0, earned / numpy.where(possible > 0, possible, 1), 0)
+
+            padding = numpy.zeros((learners, max(min_count - section_percents.shape[1], 0)))
+            kept_percents = numpy.sort(numpy.hstack([section_percents, padding]), axis=1)[:, drop_count:]
+            if kept_percents.shape[1]:
+                percents += weight * kept_percents.sum(axis=1) / kept_percents.shape[1]
+
+            attempted = earned > 0
+            attempted_counts = attempted.sum(axis=1)
+            type_percents = (section_percents * attempted).sum(axis=1) / numpy.maximum(attempted_counts, 1)
+            proforma_grades += weight * type_percents
+            attempted_weights += weight * (attempted_counts > 0)
+            attempted_percents += type_percents
+            attempted_types += attempted_counts > 0
+
+        # round(percent * 100 + 0.05) / 100, with round() halves going away from zero
+        percents = numpy.floor(percents * 100 + 0.05 + 0.5) / 100
+        remaining_weights = 1.0 - attempted_weights
+        projected_percents = attempted_percents / numpy.maximum(attempted_types, 1)
+        proforma_grades += numpy.where(remaining_weights > 0, remaining_weights * projected_percents, 0)
+        return percents, proforma_grades
+
+
+def graded_sections(progress_summary):
+    """
+    Yields the graded sections of a stored progress summary, in course order, along with the
+    earned and possible points of their graded scores. Like courseware.grades, sections without
+    possible points are left out.
+    """
+    for chapter in progress_summary:
+        for section in chapter.get('sections', []):
+            if section.get('graded'):
+                graded_scores = [score for score in section['scores'] if score[2]]
+                possible = float(sum(score[1] for score in graded_scores))
+                if possible > 0:
+                    yield section, float(sum(score[0] for score in graded_scores)), possible
+
+
+def totaled_scores(progress_summary):
+    """
+    Rebuilds the per-format graded section totals fed to the course grader
+    """
+    section_totals = {}
+    for section, earned, possible in graded_sections(progress_summary):
+        section_totals.setdefault(section['format'], []).append(
+            Score(*([earned, possible, True] + list(section['section_total'][3:])))
+        )
+    return section_totals
+
+
+def section_score_arrays(progress_summaries):
+    """
+    Turns the stored progress summaries of several learners, which must share the same graded
+    sections, into the per-assignment type arrays of earned and possible points read by
+    CompiledGradingPolicy.grade_arrays
+    """
+    section_scores = {}
+    for row, progress_summary in enumerate(progress_summaries):
+        for section, earned, possible in graded_sections(progress_summary):
+            section_scores.setdefault(section['format'], {}).setdefault(row, []).append((earned, possible))
+    arrays = {}
+    for assignment_type, rows in section_scores.iteritems():
+        scores = numpy.array([rows[row] for row in xrange(len(progress_summaries))], dtype=float)
+        arrays[assignment_type] = (scores[:, :, 0], scores[:, :, 1])
+    return arrays
+
+
+def _course_version(course_descriptor):
+    """
+    Returns an identifier of the published version of the course
+    """
+    return getattr(course_descriptor, 'course_version', None) or getattr(course_descriptor, 'subtree_edited_on', None)
+
+
+def get_compiled_grading_policy(course_descriptor):
+    """
+    Returns the compiled grading policy of the course, compiling it on the first use of the
+    course version. GRADEBOOK_GRADING_POLICY_CACHE_SIZE bounds the number of cached versions.
+    """
+    version = _course_version(course_descriptor)
+    if version is None:
+        # Without a version identifier, the policy content has to tell versions apart
+        version = blob_hash(serialize_blob(course_descriptor.grading_policy))
+    cache_key = (unicode(course_descriptor.id), unicode(version))
+
+    with _compiled_policies_lock:
+        compiled_policy = _compiled_policies.pop(cache_key, None)
+        if compiled_policy is not None:
+            _compiled_policies[cache_key] = compiled_policy
+            return compiled_policy
+
+    compiled_policy = CompiledGradingPolicy(
+        course_descriptor.grading_policy, course_descriptor.grader, course_descriptor.grade_cutoffs
+    )
+    with _compiled_policies_lock:
+        _compiled_policies[cache_key] = compiled_policy
+        while len(_compiled_policies) > getattr(settings, 'GRADEBOOK_GRADING_POLICY_CACHE_SIZE', 128):
+            _compiled_policies.popitem(last=False)
+    return compiled_policy
+
+
+def clear_compiled_grading_policies():
+    """
+    Empties the compiled grading policy cache
+    """
+    with _compiled_policies_lock:
+        _compiled_policies.clear()
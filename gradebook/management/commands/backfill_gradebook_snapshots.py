@@ -0,0 +1,58 @@
+"""
+Populates the gradebook grade snapshots (StudentGradebookSnapshot) from the history entries
+recorded before the snapshots were introduced, in bounded batches
+"""
+import logging
+from optparse import make_option
+
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from gradebook.data_migration import iterate_in_batches
+from gradebook.models import StudentGradebookHistory, StudentGradebookSnapshot
+
+log = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Copies the grades of the gradebook history entries older than the first snapshot
+    """
+    help = "Command to backfill the gradebook grade snapshots from the gradebook history"
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            "-b",
+            "--batch_size",
+            dest="batch_size",
+            type="int",
+            default=1000,
+            help="Number of history entries copied per transaction",
+        ),
+    )
+
+    def handle(self, *args, **options):
+        batch_size = options.get('batch_size') or 1000
+        history_entries = StudentGradebookHistory.objects.all()
+        first_snapshot = StudentGradebookSnapshot.objects.order_by('created').values_list('created', flat=True).first()
+        if first_snapshot is not None:
+            # Later history entries already have their snapshot
+            history_entries = history_entries.filter(created__lt=first_snapshot)
+
+        copied = 0
+        fields = ('user', 'course_id', 'grade', 'proforma_grade', 'created')
+        for rows in iterate_in_batches(history_entries, fields, batch_size):
+            with transaction.atomic():
+                StudentGradebookSnapshot.objects.bulk_create([
+                    StudentGradebookSnapshot(
+                        user_id=row['user'],
+                        course_id=row['course_id'],
+                        grade=row['grade'],
+                        proforma_grade=row['proforma_grade'],
+                        created=row['created']
+                    )
+                    for row in rows
+                ])
+            copied += len(rows)
+            log.info('%s gradebook snapshots copied', copied)
+        log.warning('Complete! %s gradebook snapshots copied', copied)
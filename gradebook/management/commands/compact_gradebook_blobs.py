@@ -0,0 +1,91 @@
+"""
+Moves the serialized blobs of existing gradebook and history entries into the content-addressed
+GradebookBlob store, in bounded batches, then removes the stored blobs no longer referenced by any
+entry
+"""
+import logging
+from optparse import make_option
+
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from gradebook.models import GradebookBlob, StudentGradebook, StudentGradebookHistory
+from gradebook.utils import blob_hash
+
+log = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Converts inline gradebook and history blobs into GradebookBlob references
+    """
+    help = "Command to move gradebook blobs into the compressed blob store"
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            "-b",
+            "--batch_size",
+            dest="batch_size",
+            type="int",
+            default=500,
+            help="Number of rows converted per transaction",
+        ),
+        make_option(
+            "--skip_gc",
+            dest="skip_gc",
+            action="store_true",
+            default=False,
+            help="Don't remove the blobs no longer referenced by any gradebook or history entry",
+        ),
+    )
+
+    def handle(self, *args, **options):
+        batch_size = options.get('batch_size') or 500
+        for model in [StudentGradebook, StudentGradebookHistory]:
+            log.warning('Compacting %s blobs...', model.__name__)
+            converted = self._compact_model(model, batch_size)
+            log.warning('Complete! %s rows converted', converted)
+        if not options.get('skip_gc', False):
+            log.warning('Removing unreferenced blobs...')
+            removed = GradebookBlob.collect_garbage(batch_size=batch_size)
+            log.warning('Complete! %s blobs removed', removed)
+
+    @staticmethod
+    def _compact_model(model, batch_size):
+        """
+        Converts the rows of the given model still holding inline blobs
+        """
+        fields = ['id']
+        for name in model.BLOB_FIELDS:
+            fields.extend([name, '{}_hash'.format(name)])
+
+        converted = 0
+        last_id = 0
+        while True:
+            rows = list(
+                model.objects.filter(id__gt=last_id).order_by('id').values(*fields)[:batch_size]
+            )
+            if not rows:
+                break
+            last_id = rows[-1]['id']
+
+            updates = []
+            for row in rows:
+                values = {}
+                for name in model.BLOB_FIELDS:
+                    if row[name]:
+                        values[name] = ''
+                        values['{}_hash'.format(name)] = blob_hash(row[name])
+                if values:
+                    updates.append((row, values))
+
+            with transaction.atomic():
+                GradebookBlob.store_many(
+                    row[name] for row, __ in updates for name in model.BLOB_FIELDS if row[name]
+                )
+                # Queryset updates, so that no post_save receiver runs for the converted rows
+                for row, values in updates:
+                    model.objects.filter(id=row['id']).update(**values)
+            converted += len(updates)
+            log.info('%s: %s rows converted (last id %s)', model.__name__, converted, last_id)
+        return converted
@@ -0,0 +1,64 @@
+"""
+Trims the gradebook change log: changes superseded by a later change of the same entry are
+removed once they are older than the compaction window, and all changes once they are older than
+the optional retention period
+"""
+import logging
+from datetime import timedelta
+from optparse import make_option
+
+from django.core.management import BaseCommand, CommandError
+from django.utils import timezone
+
+from gradebook.models import StudentGradebookChange
+
+log = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Compacts and expires StudentGradebookChange rows
+    """
+    help = "Command to compact the gradebook change log"
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            "-d",
+            "--days",
+            dest="days",
+            type="int",
+            default=7,
+            help="Age, in days, after which superseded changes are removed (defaults to 7)",
+        ),
+        make_option(
+            "-r",
+            "--retention_days",
+            dest="retention_days",
+            type="int",
+            help="Age, in days, after which all changes are removed (changes are kept by default)",
+        ),
+        make_option(
+            "-b",
+            "--batch_size",
+            dest="batch_size",
+            type="int",
+            default=1000,
+            help="Number of rows read and removed per query",
+        ),
+    )
+
+    def handle(self, *args, **options):
+        days = options.get('days')
+        if days is None:
+            days = 7
+        retention_days = options.get('retention_days')
+        if days < 0 or (retention_days is not None and retention_days < 0):
+            raise CommandError('The number of days must not be negative')
+        batch_size = options.get('batch_size') or 1000
+        now = timezone.now()
+
+        if retention_days is not None:
+            expired = StudentGradebookChange.expire(now - timedelta(days=retention_days), batch_size=batch_size)
+            log.warning('%s expired changes removed', expired)
+        compacted = StudentGradebookChange.compact(now - timedelta(days=days), batch_size=batch_size)
+        log.warning('Complete! %s superseded changes removed', compacted)
@@ -0,0 +1,142 @@
+"""
+Exports gradebook entries, or their history, as CSV or NDJSON. Rows are read in primary key
+ordered batches and written as they are read, so memory stays flat whatever the course size.
+"""
+import logging
+import sys
+from optparse import make_option
+
+from django.core.management import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from gradebook.data_migration import iterate_in_batches
+from gradebook.exchange import FORMATS, GRADEBOOK_COLUMNS, HISTORY_COLUMNS, SUMMARY_COLUMNS, write_rows
+from gradebook.models import GradebookBlob, StudentGradebook, StudentGradebookHistory
+from opaque_keys.edx.keys import CourseKey
+
+log = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Streams the gradebook entries (or history entries) of the selected courses to a file
+    """
+    help = "Command to export gradebook entries as CSV or NDJSON"
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            "-c",
+            "--course_ids",
+            dest="course_ids",
+            help="List of courses to export",
+            metavar="first/course/id,second/course/id"
+        ),
+        make_option(
+            "--org",
+            dest="org",
+            help="Only export the courses of this organization",
+        ),
+        make_option(
+            "-m",
+            "--modified_since",
+            dest="modified_since",
+            help="Only export the rows modified since this ISO 8601 date and time",
+            metavar="2016-01-31T00:00:00Z"
+        ),
+        make_option(
+            "-f",
+            "--format",
+            dest="format",
+            default="csv",
+            help="Output format: csv (default) or ndjson",
+        ),
+        make_option(
+            "-o",
+            "--output",
+            dest="output",
+            help="File to write to (defaults to the standard output)",
+        ),
+        make_option(
+            "--history",
+            dest="history",
+            action="store_true",
+            default=False,
+            help="Export the gradebook history instead of the current gradebook entries",
+        ),
+        make_option(
+            "--with_summaries",
+            dest="with_summaries",
+            action="store_true",
+            default=False,
+            help="Include the serialized progress summaries, grade summaries and grading policies",
+        ),
+        make_option(
+            "-b",
+            "--batch_size",
+            dest="batch_size",
+            type="int",
+            default=1000,
+            help="Number of rows read per query",
+        ),
+    )
+
+    def handle(self, *args, **options):
+        file_format = options.get('format') or 'csv'
+        if file_format not in FORMATS:
+            raise CommandError('Unknown format: {}'.format(file_format))
+        model = StudentGradebookHistory if options.get('history') else StudentGradebook
+        columns = HISTORY_COLUMNS if options.get('history') else GRADEBOOK_COLUMNS
+        with_summaries = options.get('with_summaries', False)
+        if with_summaries:
+            columns += SUMMARY_COLUMNS
+
+        queryset = model.objects.all()
+        course_ids = options.get('course_ids')
+        if course_ids:
+            queryset = queryset.filter(
+                course_id__in=[CourseKey.from_string(course_id) for course_id in course_ids.split(',')]
+            )
+        org = options.get('org')
+        if org:
+            queryset = queryset.filter(course_id__in=[
+                course_key for course_key in queryset.values_list('course_id', flat=True).distinct()
+                if course_key.org == org
+            ])
+        modified_since = options.get('modified_since')
+        if modified_since:
+            modified_since_datetime = parse_datetime(modified_since)
+            if modified_since_datetime is None:
+                raise CommandError('Invalid date and time: {}'.format(modified_since))
+            queryset = queryset.filter(modified__gte=modified_since_datetime)
+
+        output = options.get('output')
+        stream = open(output, 'wb') if output else sys.stdout
+        try:
+            rows = self._iter_rows(queryset, columns, with_summaries, options.get('batch_size') or 1000)
+            count = write_rows(stream, rows, columns, file_format)
+        finally:
+            if output:
+                stream.close()
+        log.warning('Complete! %s %s rows exported', count, model.__name__)
+
+    @staticmethod
+    def _iter_rows(queryset, columns, with_summaries, batch_size):
+        """
+        Yields the exported rows of the queryset, batch_size rows per query
+        """
+        fields = ['user' if column == 'user_id' else column for column in columns]
+        if with_summaries:
+            fields.extend('{}_hash'.format(name) for name in SUMMARY_COLUMNS)
+        for rows in iterate_in_batches(queryset, fields, batch_size):
+            offloaded_blobs = {}
+            if with_summaries:
+                offloaded_blobs = GradebookBlob.fetch_many(
+                    row['{}_hash'.format(name)] for row in rows for name in SUMMARY_COLUMNS
+                    if not row[name] and row['{}_hash'.format(name)]
+                )
+            for row in rows:
+                row['user_id'] = row.pop('user')
+                if with_summaries:
+                    for name in SUMMARY_COLUMNS:
+                        row[name] = row[name] or offloaded_blobs.get(row['{}_hash'.format(name)], u'')
+                yield row
@@ -1,21 +1,124 @@
 """
-One-time data migration script -- shouldn't need to run it again
+Creates or updates gradebook entries, shards the work into (course, user chunk) units which
+are graded in-process, across a process pool or by Celery workers. Progress of in-process and
+pool runs is checkpointed so an interrupted run can be resumed.
 """
+import hashlib
 import json
 import logging
+import os
+import time
+from multiprocessing import Pool
 from optparse import make_option
 
-from django.core.management import BaseCommand
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand, CommandError
+from django.db import connections
 
-from courseware import grades
+from gradebook.caching import invalidate_course_cache
 from gradebook.models import StudentGradebook
+from gradebook.tasks import (
+    _generate_users_gradebook, _get_course_descriptor, _regrade_course_from_summaries, update_users_gradebook
+)
+from opaque_keys.edx.keys import CourseKey
 from student.models import CourseEnrollment
-from xmodule.modulestore.django import modulestore
-from xmodule.modulestore import EdxJSONEncoder
+from xmodule.modulestore.django import modulestore, clear_existing_modulestores
 
 log = logging.getLogger(__name__)
 
 
+def _init_worker():
+    """
+    Drops the database and modulestore connections inherited from the parent process
+    """
+    connections.close_all()
+    clear_existing_modulestores()
+
+
+def _process_work_unit(work_unit):
+    """
+    Grades a (course id, user ids) work unit in a pool worker
+    """
+    course_id, user_ids = work_unit
+    _generate_users_gradebook(
+        CourseKey.from_string(course_id), User.objects.filter(id__in=user_ids), refresh_course=False
+    )
+    return work_unit
+
+
+class Checkpoint(object):
+    """
+    Records the completed work units in a JSON file, so an interrupted run can skip them. Units
+    are identified by their course and full list of users: when enrollments changed in between,
+    the shifted units no longer match and are graded again rather than skipped.
+    """
+
+    def __init__(self, path, chunk_size):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.completed = set()
+        if path and os.path.exists(path):
+            with open(path) as checkpoint_file:
+                checkpoint = json.load(checkpoint_file)
+            if checkpoint.get('chunk_size') != chunk_size:
+                raise CommandError('The checkpoint was recorded with a chunk size of {}, not {}'.format(
+                    checkpoint.get('chunk_size'), chunk_size
+                ))
+            self.completed = set(checkpoint['completed'])
+
+    @staticmethod
+    def _unit_key(work_unit):
+        """
+        Identifies a work unit by its course and the hash of its user ids
+        """
+        course_id, user_ids = work_unit
+        return u'{}:{}'.format(course_id, hashlib.sha1(','.join(str(user_id) for user_id in user_ids)).hexdigest())
+
+    def is_completed(self, work_unit):
+        """
+        Returns whether the work unit was completed by a previous run
+        """
+        return self._unit_key(work_unit) in self.completed
+
+    def mark_completed(self, work_unit):
+        """
+        Records the work unit as completed
+        """
+        self.completed.add(self._unit_key(work_unit))
+        if self.path:
+            temp_path = '{}.tmp'.format(self.path)
+            with open(temp_path, 'w') as checkpoint_file:
+                json.dump({'chunk_size': self.chunk_size, 'completed': sorted(self.completed)}, checkpoint_file)
+            os.rename(temp_path, self.path)
+
+
+class Progress(object):
+    """
+    Reports the throughput and estimated remaining time of a run
+    """
+
+    def __init__(self, total_users):
+        self.total_users = total_users
+        self.processed_users = 0
+        self.start_time = time.time()
+
+    def update(self, work_unit, action):
+        """
+        Accounts for a processed work unit and reports the progress
+        """
+        course_id, user_ids = work_unit
+        self.processed_users += len(user_ids)
+        elapsed = time.time() - self.start_time
+        rate = self.processed_users / elapsed if elapsed else 0
+        eta = (self.total_users - self.processed_users) / rate if rate else 0
+        log_msg = 'Gradebook entries {} -- Course: {}, Users: {}-{}  ({}/{} users, {:.1f} users/s, ETA {:.0f}s)'.format(
+            action, course_id, user_ids[0], user_ids[-1], self.processed_users, self.total_users, rate, eta
+        )
+        print log_msg
+        log.info(log_msg)
+
+
 class Command(BaseCommand):
     """
     Creates (or updates) gradebook entries for the specified course(s) and/or user(s)
@@ -37,12 +140,54 @@ class Command(BaseCommand):
             help="List of users for which to Recalculate progress",
             metavar="1234,2468,3579"
         ),
+        make_option(
+            "-w",
+            "--workers",
+            dest="workers",
+            type="int",
+            default=1,
+            help="Number of worker processes grading the work units",
+        ),
+        make_option(
+            "--celery",
+            dest="celery",
+            action="store_true",
+            default=False,
+            help="Dispatch the work units as update_users_gradebook Celery tasks, each rebuilding the course "
+                 "leaderboard and aggregates (can't be checkpointed, as dispatched units may still fail)",
+        ),
+        make_option(
+            "--chunk_size",
+            dest="chunk_size",
+            type="int",
+            help="Number of users per work unit (defaults to GRADEBOOK_BATCH_SIZE)",
+        ),
+        make_option(
+            "--from_summaries",
+            dest="from_summaries",
+            action="store_true",
+            default=False,
+            help="Regrade existing entries from their stored progress summaries (e.g. after a grading "
+                 "policy change); only users without a usable summary are graded in full",
+        ),
+        make_option(
+            "--checkpoint",
+            dest="checkpoint",
+            help="File recording the completed work units, used to resume an interrupted run with the "
+                 "same chunk size (not available with --celery)",
+            metavar="/tmp/gradebook_checkpoint.json"
+        ),
     )
 
     def handle(self, *args, **options):
 
         course_ids = options.get('course_ids')
         user_ids = options.get('user_ids')
+        workers = options.get('workers') or 1
+        chunk_size = options.get('chunk_size') or getattr(settings, 'GRADEBOOK_BATCH_SIZE', 100)
+        if options.get('celery') and options.get('checkpoint'):
+            raise CommandError('Celery runs are not checkpointed: dispatched work units may still fail')
+        checkpoint = Checkpoint(options.get('checkpoint'), chunk_size)
 
         # Get the list of courses from the system
         courses = modulestore().get_courses()
@@ -55,46 +200,64 @@ class Command(BaseCommand):
                     filtered_courses.append(course)
             courses = filtered_courses
 
+        work_units = []
+        # Courses whose leaderboard and aggregates are rebuilt once all of their units are graded,
+        # including the units graded by an interrupted run
+        graded_course_keys = []
         for course in courses:
             users = CourseEnrollment.objects.users_enrolled_in(course.id)
             # If one or more users were specified by the caller, just use those ones...
             if user_ids is not None:
-                filtered_users = []
-                for user in users:
-                    if str(user.id) in user_ids.split(','):
-                        filtered_users.append(user)
-                users = filtered_users
-
-            # For each user...
-            for user in users:
-                grade_data = grades.grade(user, course)
-                grade = grade_data['percent']
-                grading_policy = course.grading_policy
-                proforma_grade = grades.calculate_proforma_grade(grade_data, grading_policy)
-                progress_summary = grades.progress_summary(user, course)
-                try:
-                    gradebook_entry = StudentGradebook.objects.get(user=user, course_id=course.id)
-                    if (gradebook_entry.grade != grade or
-                            gradebook_entry.proforma_grade != proforma_grade or
-                            gradebook_entry.progress_summary != progress_summary or
-                            gradebook_entry.grade_summary != grade_data or
-                            gradebook_entry.grading_policy != grading_policy):
-                        gradebook_entry.grade = grade
-                        gradebook_entry.proforma_grade = proforma_grade
-                        gradebook_entry.progress_summary = json.dumps(progress_summary, cls=EdxJSONEncoder)
-                        gradebook_entry.grade_summary = json.dumps(grade_data, cls=EdxJSONEncoder)
-                        gradebook_entry.grading_policy = json.dumps(grading_policy, cls=EdxJSONEncoder)
-                        gradebook_entry.save()
-                except StudentGradebook.DoesNotExist:
-                    StudentGradebook.objects.create(
-                        user=user,
-                        course_id=course.id,
-                        grade=grade,
-                        proforma_grade=proforma_grade,
-                        progress_summary=json.dumps(progress_summary, cls=EdxJSONEncoder),
-                        grade_summary=json.dumps(grade_data, cls=EdxJSONEncoder),
-                        grading_policy=json.dumps(grading_policy, cls=EdxJSONEncoder)
-                    )
-                log_msg = 'Gradebook entry created -- Course: {}, User: {}  (grade: {}, proforma_grade: {})'.format(course.id, user.id, grade, proforma_grade)
-                print log_msg
-                log.info(log_msg)
+                users = users.filter(id__in=user_ids.split(','))
+            course_user_ids = list(users.order_by('id').values_list('id', flat=True))
+            if options.get('from_summaries'):
+                unusable_user_ids = _regrade_course_from_summaries(
+                    course.id, course_user_ids if user_ids is not None else None
+                )
+                regraded_user_ids = set(
+                    StudentGradebook.objects.filter(course_id=course.id).values_list('user_id', flat=True)
+                ) - set(unusable_user_ids)
+                course_user_ids = [user_id for user_id in course_user_ids if user_id not in regraded_user_ids]
+            if course_user_ids:
+                graded_course_keys.append(course.id)
+            for index in xrange(0, len(course_user_ids), chunk_size):
+                work_unit = (unicode(course.id), course_user_ids[index:index + chunk_size])
+                if not checkpoint.is_completed(work_unit):
+                    work_units.append(work_unit)
+
+        progress = Progress(sum(len(unit_user_ids) for __, unit_user_ids in work_units))
+        if options.get('celery'):
+            for work_unit in work_units:
+                update_users_gradebook.delay(*work_unit)
+                progress.update(work_unit, 'dispatched')
+        elif workers > 1:
+            connections.close_all()
+            pool = Pool(workers, initializer=_init_worker)
+            try:
+                for work_unit in pool.imap_unordered(_process_work_unit, work_units):
+                    checkpoint.mark_completed(work_unit)
+                    progress.update(work_unit, 'graded')
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            course_descriptors = {}
+            for work_unit in work_units:
+                course_id, unit_user_ids = work_unit
+                # Consecutive units of a course share the loaded course tree
+                if course_id not in course_descriptors:
+                    course_descriptors.clear()
+                    course_descriptors[course_id] = _get_course_descriptor(CourseKey.from_string(course_id))
+                course = course_descriptors[course_id]
+                _generate_users_gradebook(
+                    course.id, User.objects.filter(id__in=unit_user_ids), course, refresh_course=False
+                )
+                checkpoint.mark_completed(work_unit)
+                progress.update(work_unit, 'graded')
+
+        if not options.get('celery'):
+            for course_key in graded_course_keys:
+                StudentGradebook.rebuild_courses([course_key])
+                invalidate_course_cache(course_key)
+            log.info('Leaderboards and aggregates rebuilt for %s courses', len(graded_course_keys))
+
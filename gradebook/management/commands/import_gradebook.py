@@ -0,0 +1,103 @@
+"""
+Imports gradebook entries, or history entries, from a CSV or NDJSON file written by
+export_gradebook. Rows are read and written in batches: gradebook entries are upserted by user
+and course, history entries appended, without sending model signals. The leaderboards and
+aggregates of the imported courses are rebuilt once at the end.
+"""
+import logging
+from itertools import islice
+from optparse import make_option
+
+from django.core.management import BaseCommand, CommandError
+
+from gradebook.caching import invalidate_course_cache
+from gradebook.exchange import FORMATS, SUMMARY_COLUMNS, read_rows
+from gradebook.models import CourseGradebookAggregate, StudentGradebook, StudentGradebookHistory, StudentGradebookRank
+
+log = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Loads gradebook entries (or history entries) from a file
+    """
+    help = "Command to import gradebook entries from CSV or NDJSON"
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            "-i",
+            "--input",
+            dest="input",
+            help="File to read from",
+        ),
+        make_option(
+            "-f",
+            "--format",
+            dest="format",
+            default="csv",
+            help="Input format: csv (default) or ndjson",
+        ),
+        make_option(
+            "--history",
+            dest="history",
+            action="store_true",
+            default=False,
+            help="Import gradebook history entries instead of current gradebook entries",
+        ),
+        make_option(
+            "-b",
+            "--batch_size",
+            dest="batch_size",
+            type="int",
+            default=1000,
+            help="Number of rows written per transaction",
+        ),
+    )
+
+    def handle(self, *args, **options):
+        file_format = options.get('format') or 'csv'
+        if file_format not in FORMATS:
+            raise CommandError('Unknown format: {}'.format(file_format))
+        if not options.get('input'):
+            raise CommandError('An input file is required')
+        history = options.get('history', False)
+        batch_size = options.get('batch_size') or 1000
+
+        imported = 0
+        course_keys = set()
+        with open(options['input'], 'rb') as stream:
+            rows = read_rows(stream, file_format)
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                if history:
+                    StudentGradebookHistory.bulk_create_entries([
+                        StudentGradebookHistory(**self._model_values(row)) for row in batch
+                    ])
+                else:
+                    update_fields = ['grade', 'proforma_grade']
+                    update_fields.extend(name for name in SUMMARY_COLUMNS if name in batch[0])
+                    course_keys.update(StudentGradebook.bulk_upsert_entries(
+                        [StudentGradebook(**self._model_values(row)) for row in batch],
+                        update_fields=update_fields
+                    ))
+                imported += len(batch)
+                log.info('%s rows imported', imported)
+
+        for course_key in course_keys:
+            StudentGradebookRank.rebuild(course_key)
+            CourseGradebookAggregate.refresh(course_key)
+            invalidate_course_cache(course_key)
+        log.warning('Complete! %s %s rows imported', imported, 'history' if history else 'gradebook')
+
+    @staticmethod
+    def _model_values(row):
+        """
+        Returns the model field values of an imported row. The modified time is the time of the import.
+        """
+        values = dict(row)
+        values.pop('modified', None)
+        if values.get('created') is None:
+            values.pop('created', None)
+        return values
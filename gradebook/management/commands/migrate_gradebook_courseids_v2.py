@@ -2,11 +2,14 @@
 One-time data migration script -- shoulen't need to run it again
 """
 import logging
+from optparse import make_option
 
 from django.core.management.base import BaseCommand
 
 from opaque_keys.edx.keys import CourseKey
 from gradebook import models
+from gradebook.caching import invalidate_course_cache
+from gradebook.data_migration import BatchedMigration
 
 log = logging.getLogger(__name__)
 
@@ -31,26 +34,79 @@ def _migrate_content_id(old_content_id):
     return new_content_id
 
 
+class CourseIdMigration(BatchedMigration):
+    """
+    Rewrites the legacy course identifiers of a gradebook model
+    """
+    fields = ('course_id',)
+
+    def __init__(self, model, **kwargs):
+        super(CourseIdMigration, self).__init__(**kwargs)
+        self.model = model
+        self.migrated_course_ids = {}
+
+    def transform(self, row):
+        old_course_id = unicode(row['course_id'])
+        course_id = _migrate_course_id(old_course_id)
+        if course_id == old_course_id:
+            return None
+        self.migrated_course_ids[old_course_id] = course_id
+        return {'course_id': CourseKey.from_string(course_id)}
+
+
 class Command(BaseCommand):
     """
     Migrates legacy course/content identifiers across several models to the new format
     """
+    help = "Command to migrate legacy course identifiers of gradebook entries"
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            "-b",
+            "--batch_size",
+            dest="batch_size",
+            type="int",
+            default=1000,
+            help="Number of rows read and updated per batch",
+        ),
+        make_option(
+            "--dry_run",
+            dest="dry_run",
+            action="store_true",
+            default=False,
+            help="Only count the rows which would be migrated",
+        ),
+    )
 
     def handle(self, *args, **options):
+        batch_size = options.get('batch_size') or 1000
+        dry_run = options.get('dry_run', False)
+
+        migrated_course_ids = {}
+        for model in [models.StudentGradebook, models.StudentGradebookHistory, models.StudentGradebookSnapshot,
+                      models.StudentGradebookChange]:
+            migration = CourseIdMigration(model, batch_size=batch_size, dry_run=dry_run)
+            migration.run()
+            migrated_course_ids.update(migration.migrated_course_ids)
+        if dry_run:
+            return
 
-        log.warning('Migrating Student Gradebook Entries...')
-        gradebook_entries = models.StudentGradebook.objects.all()
-        for gbe in gradebook_entries:
-            course_id = _migrate_course_id(unicode(gbe.course_id))
-            print course_id
-            gbe.course_id = CourseKey.from_string(course_id)
-            gbe.save()
-        log.warning('Complete!')
-
-        log.warning('Migrating Student Gradebook History Entries...')
-        history_entries = models.StudentGradebookHistory.objects.all()
-        for he in history_entries:
-            course_id = _migrate_course_id(unicode(he.course_id))
-            he.course_id = CourseKey.from_string(course_id)
-            he.save()
-        log.warning('Complete!')
+        # The enrollment flags, leaderboard and aggregates are not maintained while signals are suppressed
+        for old_course_id, course_id in migrated_course_ids.iteritems():
+            models.StudentGradebookRank.objects.filter(course_id=old_course_id).delete()
+            models.CourseGradebookAggregate.objects.filter(course_id=old_course_id).delete()
+            models.GradebookExclusion.objects.filter(course_id=old_course_id).delete()
+            invalidate_course_cache(old_course_id)
+        for course_id in set(migrated_course_ids.itervalues()):
+            course_key = CourseKey.from_string(course_id)
+            models.StudentGradebook.refresh_enrollment_flags(course_key=course_key)
+            # The migrated entries carry the exclusion flags of the legacy course identifier
+            models.GradebookExclusion.sync_course(course_key)
+            excluded_user_ids = models.GradebookExclusion.objects.filter(course_id=course_key)\
+                .values_list('user_id', flat=True)
+            course_entries = models.StudentGradebook.objects.filter(course_id=course_key)
+            course_entries.filter(user__in=excluded_user_ids).update(exclude_from_aggregates=True)
+            course_entries.exclude(user__in=excluded_user_ids).update(exclude_from_aggregates=False)
+            models.StudentGradebookRank.rebuild(course_key)
+            models.CourseGradebookAggregate.refresh(course_key)
+            invalidate_course_cache(course_key)
@@ -1,17 +1,17 @@
 """
 One-time data migration script -- shouldn't need to run it again
 """
-import json
 import logging
 from optparse import make_option
 
 from django.core.management import BaseCommand
 
 from courseware import grades
-from gradebook.models import StudentGradebook
+from gradebook.grading import get_compiled_grading_policy
+from gradebook.models import EMPTY_BLOB_HASH, StudentGradebook
+from gradebook.utils import serialize_blob
 from student.models import CourseEnrollment
 from xmodule.modulestore.django import modulestore
-from xmodule.modulestore import EdxJSONEncoder
 from util.request import RequestMockWithoutMiddleware
 from opaque_keys.edx.keys import CourseKey
 
@@ -42,33 +42,42 @@ class Command(BaseCommand):
         if course_id:
             course_ids.append(course_id)
         else:
-            course_ids = StudentGradebook.objects.filter(grade_summary='').values_list('course_id', flat=True)
+            # Offloaded summaries are stored empty too: only their hash tells them apart
+            course_ids = StudentGradebook.objects.filter(
+                grade_summary='',
+                grade_summary_hash__in=('', EMPTY_BLOB_HASH)
+            ).values_list('course_id', flat=True).distinct()
 
         for course_id in course_ids:
-            course_key = CourseKey.from_string(course_id)
+            course_key = CourseKey.from_string(unicode(course_id))
             users = CourseEnrollment.objects.users_enrolled_in(course_key)
             course = modulestore().get_course(course_key, depth=None)
             if course:
+                grading_policy = get_compiled_grading_policy(course)
                 # For each user...
                 for user in users:
+                    try:
+                        gradebook_entry = StudentGradebook.deferred.get(user=user, course_id=course.id)
+                    except StudentGradebook.DoesNotExist:
+                        continue
+                    # Only learners actually missing their summary are regraded
+                    if gradebook_entry.get_blob_text('grade_summary'):
+                        continue
                     request = RequestMockWithoutMiddleware().get('/')
                     request.user = user
                     grade_data = grades.grade(user, course)
                     grade = grade_data['percent']
-                    grading_policy = course.grading_policy
-                    proforma_grade = grades.calculate_proforma_grade(grade_data, grading_policy)
+                    proforma_grade = grading_policy.proforma_grade(grade_data)
                     progress_summary = grades.progress_summary(user, course)
-                    try:
-                        gradebook_entry = StudentGradebook.objects.get(user=user, course_id=course.id)
-                        if not gradebook_entry.grade_summary:
-                            gradebook_entry.grade = grade
-                            gradebook_entry.proforma_grade = proforma_grade
-                            gradebook_entry.progress_summary = json.dumps(progress_summary, cls=EdxJSONEncoder)
-                            gradebook_entry.grade_summary = json.dumps(grade_data, cls=EdxJSONEncoder)
-                            gradebook_entry.grading_policy = json.dumps(grading_policy, cls=EdxJSONEncoder)
-                            gradebook_entry.save()
-                    except StudentGradebook.DoesNotExist:
-                       pass
+                    values = {
+                        'grade': grade,
+                        'proforma_grade': proforma_grade,
+                        'progress_summary': serialize_blob(progress_summary),
+                        'grade_summary': serialize_blob(grade_data),
+                        'grading_policy': grading_policy.grading_policy_json,
+                    }
+                    if gradebook_entry.update_values(values):
+                        gradebook_entry.save()
 
                     log_msg = 'Gradebook entry created -- Course: {}, User: {}  (grade: {}, proforma_grade: {})'.format(course.id, user.id, grade, proforma_grade)
                     log.info(log_msg)
@@ -0,0 +1,43 @@
+"""
+Recounts the grade histograms of the course aggregates from the gradebook entries, e.g. after
+GRADEBOOK_GRADE_HISTOGRAM_BUCKETS changed or to fill them in for existing courses
+"""
+import logging
+from optparse import make_option
+
+from django.core.management import BaseCommand
+
+from gradebook.caching import invalidate_course_cache
+from gradebook.models import CourseGradebookAggregate, StudentGradebook
+from opaque_keys.edx.keys import CourseKey
+
+log = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Rebuilds the grade histograms for the specified course(s) or all gradebook courses
+    """
+    help = "Command to rebuild the course grade histograms"
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            "-c",
+            "--course_ids",
+            dest="course_ids",
+            help="List of courses for which to rebuild the grade histogram",
+            metavar="first/course/id,second/course/id"
+        ),
+    )
+
+    def handle(self, *args, **options):
+        course_ids = options.get('course_ids')
+        if course_ids is not None:
+            course_keys = [CourseKey.from_string(course_id) for course_id in course_ids.split(',')]
+        else:
+            course_keys = StudentGradebook.objects.values_list('course_id', flat=True).distinct()
+
+        for course_key in course_keys:
+            histogram = CourseGradebookAggregate.refresh_histogram(course_key)
+            invalidate_course_cache(course_key)
+            log.info('Gradebook histogram rebuilt -- Course: %s, entries: %s', course_key, sum(histogram))
@@ -0,0 +1,41 @@
+"""
+Rebuilds the denormalized leaderboard positions (StudentGradebookRank) from the gradebook entries
+"""
+import logging
+from optparse import make_option
+
+from django.core.management import BaseCommand
+
+from gradebook.models import StudentGradebook, StudentGradebookRank
+from opaque_keys.edx.keys import CourseKey
+
+log = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Rebuilds the leaderboard positions for the specified course(s) or all courses with gradebook entries
+    """
+    help = "Command to rebuild course leaderboard positions"
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            "-c",
+            "--course_ids",
+            dest="course_ids",
+            help="List of courses for which to rebuild the leaderboard",
+            metavar="first/course/id,second/course/id"
+        ),
+    )
+
+    def handle(self, *args, **options):
+        course_ids = options.get('course_ids')
+
+        if course_ids is not None:
+            course_keys = [CourseKey.from_string(course_id) for course_id in course_ids.split(',')]
+        else:
+            course_keys = StudentGradebook.objects.values_list('course_id', flat=True).distinct()
+
+        for course_key in course_keys:
+            StudentGradebookRank.rebuild(course_key)
+            log.info('Leaderboard rebuilt -- Course: %s', course_key)
@@ -0,0 +1,45 @@
+"""
+Recomputes the stored completion of the gradebook entries (StudentGradebook.is_complete) and the
+course completion counters, e.g. after GRADEBOOK_GRADE_COMPLETE_PROFORMA_MATCH_RANGE changed
+"""
+import logging
+from optparse import make_option
+
+from django.core.management import BaseCommand
+
+from gradebook.caching import invalidate_course_cache
+from gradebook.models import CourseGradebookAggregate, StudentGradebook
+from opaque_keys.edx.keys import CourseKey
+
+log = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Recomputes the gradebook completions for the specified course(s) or all gradebook courses
+    """
+    help = "Command to recompute the gradebook completion flags and counters"
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            "-c",
+            "--course_ids",
+            dest="course_ids",
+            help="List of courses for which to recompute the completions",
+            metavar="first/course/id,second/course/id"
+        ),
+    )
+
+    def handle(self, *args, **options):
+        course_ids = options.get('course_ids')
+        if course_ids is not None:
+            course_keys = [CourseKey.from_string(course_id) for course_id in course_ids.split(',')]
+        else:
+            course_keys = StudentGradebook.objects.values_list('course_id', flat=True).distinct()
+
+        for course_key in course_keys:
+            changed = StudentGradebook.refresh_completion_flags(course_key)
+            if changed:
+                CourseGradebookAggregate.refresh(course_key)
+                invalidate_course_cache(course_key)
+                log.info('Gradebook completions updated -- Course: %s, entries: %s', course_key, changed)
@@ -0,0 +1,34 @@
+"""
+Recomputes the course gradebook aggregates (CourseGradebookAggregate) from the gradebook entries
+"""
+import logging
+from optparse import make_option
+
+from django.core.management import BaseCommand
+
+from gradebook.tasks import reconcile_gradebook_aggregates
+
+log = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Reconciles the gradebook aggregates for the specified course(s) or all courses
+    """
+    help = "Command to reconcile course gradebook aggregates"
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            "-c",
+            "--course_ids",
+            dest="course_ids",
+            help="List of courses for which to reconcile the aggregates",
+            metavar="first/course/id,second/course/id"
+        ),
+    )
+
+    def handle(self, *args, **options):
+        course_ids = options.get('course_ids')
+        if course_ids is not None:
+            course_ids = course_ids.split(',')
+        reconcile_gradebook_aggregates(course_ids)
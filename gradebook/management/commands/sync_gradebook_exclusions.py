@@ -0,0 +1,41 @@
+"""
+Populates the per-course gradebook exclusion membership (GradebookExclusion) from the course
+access roles, e.g. once after upgrading, or to repair it
+"""
+import logging
+from optparse import make_option
+
+from django.core.management import BaseCommand
+
+from gradebook.models import GradebookExclusion, StudentGradebook
+from opaque_keys.edx.keys import CourseKey
+
+log = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Synchronizes the gradebook exclusions for the specified course(s) or all gradebook courses
+    """
+    help = "Command to synchronize the gradebook aggregate exclusions with the course access roles"
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            "-c",
+            "--course_ids",
+            dest="course_ids",
+            help="List of courses for which to synchronize the exclusions",
+            metavar="first/course/id,second/course/id"
+        ),
+    )
+
+    def handle(self, *args, **options):
+        course_ids = options.get('course_ids')
+        if course_ids is not None:
+            course_keys = [CourseKey.from_string(course_id) for course_id in course_ids.split(',')]
+        else:
+            course_keys = StudentGradebook.objects.values_list('course_id', flat=True).distinct()
+
+        for course_key in course_keys:
+            if GradebookExclusion.sync_course(course_key):
+                log.info('Gradebook exclusions updated -- Course: %s', course_key)
@@ -0,0 +1,93 @@
+"""
+Run these tests @ Devstack:
+    paver test_system -s lms --test_id=lms/djangoapps/gradebook/management/commands/tests/test_compact_gradebook_blobs.py
+"""
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django.test.utils import override_settings
+
+from gradebook.management.commands import compact_gradebook_blobs
+from gradebook.models import GradebookBlob, StudentGradebook, StudentGradebookHistory
+from student.tests.factories import UserFactory
+from xmodule.modulestore.tests.django_utils import ModuleStoreTestCase, mixed_store_config
+from xmodule.modulestore.tests.factories import CourseFactory
+
+
+MODULESTORE_CONFIG = mixed_store_config(settings.COMMON_TEST_DATA_ROOT, {}, include_xml=False)
+
+
+@override_settings(MODULESTORE=MODULESTORE_CONFIG)
+class CompactGradebookBlobsTests(ModuleStoreTestCase):
+    """
+    Test suite for the blob compaction script
+    """
+
+    def setUp(self):
+        super(CompactGradebookBlobsTests, self).setUp()
+        self.course = CourseFactory.create()
+        self.grading_policy = json.dumps({'GRADER': [], 'GRADE_CUTOFFS': {'Pass': 0.5}})
+        self.users = [UserFactory() for __ in xrange(3)]
+        for user in self.users:
+            StudentGradebook.objects.create(
+                user=user,
+                course_id=self.course.id,
+                grade=0.5,
+                proforma_grade=0.5,
+                progress_summary=json.dumps({'progress': user.id}),
+                grade_summary='',
+                grading_policy=self.grading_policy
+            )
+
+    def test_compact_gradebook_blobs(self):
+        """
+        Test the inline blobs are moved into the blob store in batches
+        """
+        self.assertEqual(GradebookBlob.objects.count(), 0)
+
+        compact_gradebook_blobs.Command().handle(batch_size=2)
+
+        # Three progress summaries and a single grading policy
+        self.assertEqual(GradebookBlob.objects.count(), 4)
+        for user in self.users:
+            for model in [StudentGradebook, StudentGradebookHistory]:
+                entry = model.objects.get(user=user, course_id=self.course.id)
+                self.assertEqual(entry.progress_summary, '')
+                self.assertEqual(entry.grading_policy, '')
+                self.assertEqual(json.loads(entry.get_blob_text('progress_summary')), {'progress': user.id})
+                self.assertEqual(entry.get_blob_text('grading_policy'), self.grading_policy)
+                self.assertEqual(entry.get_blob_text('grade_summary'), '')
+        self.assertEqual(StudentGradebookHistory.objects.count(), 3)
+
+    def test_collect_unreferenced_blobs(self):
+        """
+        Test the blobs of deleted entries are removed, and the referenced ones kept
+        """
+        compact_gradebook_blobs.Command().handle(batch_size=2)
+        StudentGradebook.objects.filter(user=self.users[0]).delete()
+        StudentGradebookHistory.objects.filter(user__in=self.users[:2]).delete()
+
+        # Unreferenced blobs are kept for the grace period
+        compact_gradebook_blobs.Command().handle(batch_size=2)
+        self.assertEqual(GradebookBlob.objects.count(), 4)
+
+        # Storing a blob again restarts its grace period
+        GradebookBlob.objects.update(last_stored=timezone.now() - timedelta(days=2))
+        GradebookBlob.store_many([json.dumps({'progress': self.users[0].id})])
+        compact_gradebook_blobs.Command().handle(batch_size=2)
+        self.assertEqual(GradebookBlob.objects.count(), 4)
+
+        GradebookBlob.objects.update(last_stored=timezone.now() - timedelta(days=2))
+        compact_gradebook_blobs.Command().handle(batch_size=2)
+
+        # The first user's progress summary is gone, the second one's still used by its gradebook entry
+        self.assertEqual(GradebookBlob.objects.count(), 3)
+        for user in self.users[1:]:
+            entry = StudentGradebook.objects.get(user=user, course_id=self.course.id)
+            self.assertEqual(json.loads(entry.get_blob_text('progress_summary')), {'progress': user.id})
+            self.assertEqual(entry.get_blob_text('grading_policy'), self.grading_policy)
+
+        compact_gradebook_blobs.Command().handle(skip_gc=True)
+        self.assertEqual(GradebookBlob.objects.count(), 3)
@@ -0,0 +1,79 @@
+"""
+Run these tests @ Devstack:
+    paver test_system -s lms --test_id=lms/djangoapps/gradebook/management/commands/tests/test_export_gradebook.py
+"""
+import json
+import os
+import tempfile
+
+from django.conf import settings
+from django.test.utils import override_settings
+
+from gradebook.management.commands import export_gradebook, import_gradebook
+from gradebook.models import StudentGradebook, StudentGradebookHistory, StudentGradebookRank
+from student.tests.factories import CourseEnrollmentFactory, UserFactory
+from xmodule.modulestore.tests.django_utils import ModuleStoreTestCase, mixed_store_config
+from xmodule.modulestore.tests.factories import CourseFactory
+
+
+MODULESTORE_CONFIG = mixed_store_config(settings.COMMON_TEST_DATA_ROOT, {}, include_xml=False)
+
+
+@override_settings(MODULESTORE=MODULESTORE_CONFIG)
+class ExportImportGradebookTests(ModuleStoreTestCase):
+    """
+    Test suite for the gradebook export and import scripts
+    """
+
+    def setUp(self):
+        super(ExportImportGradebookTests, self).setUp()
+        self.course = CourseFactory.create()
+        self.other_course = CourseFactory.create()
+        self.users = [UserFactory() for __ in xrange(3)]
+        for index, user in enumerate(self.users):
+            CourseEnrollmentFactory.create(user=user, course_id=self.course.id)
+            StudentGradebook.objects.create(
+                user=user,
+                course_id=self.course.id,
+                grade=0.2 * (index + 1),
+                proforma_grade=0.2 * (index + 1),
+                progress_summary=json.dumps({'progress': user.id}),
+                grading_policy=json.dumps({'GRADER': []})
+            )
+        StudentGradebook.objects.create(user=self.users[0], course_id=self.other_course.id, grade=0.9, proforma_grade=0.9)
+        handle, self.path = tempfile.mkstemp()
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+
+    def _grades(self):
+        """ Returns the grades of the course, by user id """
+        return dict(StudentGradebook.objects.filter(course_id=self.course.id).values_list('user__id', 'grade'))
+
+    def test_export_import(self):
+        for file_format in ['csv', 'ndjson']:
+            grades = self._grades()
+            export_gradebook.Command().handle(
+                course_ids=unicode(self.course.id), format=file_format, output=self.path, with_summaries=True,
+                batch_size=2
+            )
+            StudentGradebook.objects.filter(user=self.users[0], course_id=self.course.id).delete()
+            StudentGradebook.objects.filter(user=self.users[1], course_id=self.course.id).update(grade=0)
+
+            import_gradebook.Command().handle(input=self.path, format=file_format, batch_size=2)
+
+            self.assertEqual(self._grades(), grades)
+            gradebook = StudentGradebook.objects.get(user=self.users[0], course_id=self.course.id)
+            self.assertEqual(gradebook.parsed_progress_summary, {'progress': self.users[0].id})
+            self.assertTrue(gradebook.is_active_enrolled)
+            self.assertEqual(StudentGradebookRank.objects.filter(course_id=self.course.id).count(), 3)
+            # Other courses are neither exported nor touched
+            self.assertEqual(StudentGradebook.objects.get(user=self.users[0], course_id=self.other_course.id).grade, 0.9)
+
+    def test_export_import_history(self):
+        export_gradebook.Command().handle(history=True, format='ndjson', output=self.path)
+        with open(self.path) as stream:
+            self.assertEqual(len(stream.readlines()), StudentGradebookHistory.objects.count())
+
+        history_count = StudentGradebookHistory.objects.count()
+        import_gradebook.Command().handle(input=self.path, format='ndjson', history=True)
+        self.assertEqual(StudentGradebookHistory.objects.count(), 2 * history_count)
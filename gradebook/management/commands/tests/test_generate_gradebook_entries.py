@@ -7,14 +7,17 @@ from django.test.utils import override_settings
 from mock import MagicMock, patch
 import uuid
 import json
+import os
+import tempfile
 
 from django.conf import settings
+from django.core.management import CommandError
 
 from capa.tests.response_xml_factory import StringResponseXMLFactory
 from courseware import module_render
 from courseware.model_data import FieldDataCache
 from gradebook.management.commands import generate_gradebook_entries
-from gradebook.models import StudentGradebook, StudentGradebookHistory
+from gradebook.models import CourseGradebookAggregate, StudentGradebook, StudentGradebookHistory, StudentGradebookRank
 from student.tests.factories import UserFactory, CourseEnrollmentFactory
 from xmodule.modulestore import EdxJSONEncoder
 from xmodule.modulestore.tests.factories import CourseFactory, ItemFactory
@@ -284,3 +287,57 @@ class GenerateGradebookEntriesTests(ModuleStoreTestCase):
         self.assertEqual(json.dumps({'progress': 'summary'}), user0_entry.progress_summary)
         self.assertEqual(json.dumps({"grade": "summary"}), user0_entry.grade_summary)
         self.assertEqual(json.dumps({'grading': "policy"}), user0_entry.grading_policy)
+
+    @patch.dict(settings.FEATURES, {
+        'ALLOW_STUDENT_STATE_UPDATES_ON_CLOSED_COURSE': False,
+        'SIGNAL_ON_SCORE_CHANGED': False
+    })
+    def test_generate_gradebook_entries_resume(self):
+        """
+        Test the gradebook entry generator skips the work units completed by a previous run
+        """
+        checkpoint_file = tempfile.NamedTemporaryFile(suffix='.json', delete=False)
+        checkpoint_file.close()
+        os.remove(checkpoint_file.name)
+        self.addCleanup(lambda: os.path.exists(checkpoint_file.name) and os.remove(checkpoint_file.name))
+        course_ids = '{}'.format(self.course.id)
+
+        generate_gradebook_entries.Command().handle(
+            course_ids=course_ids, chunk_size=2, checkpoint=checkpoint_file.name
+        )
+        self.assertEqual(StudentGradebook.objects.filter(course_id=self.course.id).count(), 3)
+        # The leaderboard and aggregates are rebuilt once the units of the course are graded
+        self.assertEqual(StudentGradebookRank.objects.filter(course_id=self.course.id).count(), 3)
+        self.assertEqual(CourseGradebookAggregate.objects.get(course_id=self.course.id).grade_count, 3)
+        with open(checkpoint_file.name) as checkpoint:
+            self.assertEqual(len(json.load(checkpoint)['completed']), 2)
+
+        # A rerun against the same checkpoint has nothing left to grade
+        StudentGradebook.objects.all().delete()
+        generate_gradebook_entries.Command().handle(
+            course_ids=course_ids, chunk_size=2, checkpoint=checkpoint_file.name
+        )
+        self.assertEqual(StudentGradebook.objects.filter(course_id=self.course.id).count(), 0)
+
+        # Resuming with another chunk size is refused
+        with self.assertRaises(CommandError):
+            generate_gradebook_entries.Command().handle(
+                course_ids=course_ids, chunk_size=3, checkpoint=checkpoint_file.name
+            )
+
+        # A new enrollment shifts the last unit, whose users are then graded rather than skipped
+        CourseEnrollmentFactory.create(user=UserFactory(), course_id=self.course.id)
+        generate_gradebook_entries.Command().handle(
+            course_ids=course_ids, chunk_size=2, checkpoint=checkpoint_file.name
+        )
+        self.assertEqual(StudentGradebook.objects.filter(course_id=self.course.id).count(), 2)
+        StudentGradebook.objects.all().delete()
+
+        with self.assertRaises(CommandError):
+            generate_gradebook_entries.Command().handle(
+                course_ids=course_ids, celery=True, checkpoint=checkpoint_file.name
+            )
+
+        # Without the checkpoint every enrolled user is graded again
+        generate_gradebook_entries.Command().handle(course_ids=course_ids, chunk_size=2)
+        self.assertEqual(StudentGradebook.objects.filter(course_id=self.course.id).count(), 4)
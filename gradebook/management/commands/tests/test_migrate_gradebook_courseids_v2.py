@@ -8,6 +8,8 @@ from django.conf import settings
 from django.test.utils import override_settings
 
 from gradebook import models as gradebook_models
+from opaque_keys.edx.keys import CourseKey
+from student.roles import CourseStaffRole
 from xmodule.modulestore.tests.django_utils import ModuleStoreTestCase, mixed_store_config
 from gradebook.management.commands import migrate_gradebook_courseids_v2
 
@@ -60,3 +62,66 @@ class MigrateCourseIdsTests(ModuleStoreTestCase):
         for entry in updated_history_entries:
             self.assertEqual(unicode(entry.course_id), self.good_style_course_id2)
         print "Student Gradebook History Data Migration Passed"
+
+    def test_migrate_courseids_batched(self):
+        """
+        Test the data migration across several batches, with a dry run first
+        """
+        users = [
+            User.objects.create(email='batch{}@edx.org'.format(index), username='batch_courseids{}'.format(index))
+            for index in xrange(5)
+        ]
+        for index, user in enumerate(users):
+            gradebook_models.StudentGradebook.objects.create(
+                user=user, course_id=self.bad_style_course_id, grade=0.1 * index, proforma_grade=0.1 * index
+            )
+        history_count = gradebook_models.StudentGradebookHistory.objects.count()
+
+        # A dry run leaves the data untouched
+        migrate_gradebook_courseids_v2.Command().handle(batch_size=2, dry_run=True)
+        self.assertEqual(
+            gradebook_models.StudentGradebook.objects.filter(course_id=self.bad_style_course_id).count(), 5
+        )
+
+        migrate_gradebook_courseids_v2.Command().handle(batch_size=2)
+        self.assertEqual(
+            gradebook_models.StudentGradebook.objects.filter(course_id=self.good_style_course_id).count(), 5
+        )
+        self.assertEqual(
+            gradebook_models.StudentGradebookHistory.objects.filter(course_id=self.good_style_course_id).count(),
+            history_count
+        )
+        self.assertFalse(
+            gradebook_models.StudentGradebookChange.objects.filter(course_id=self.bad_style_course_id).exists()
+        )
+        # The migration itself writes no history entries
+        self.assertEqual(gradebook_models.StudentGradebookHistory.objects.count(), history_count)
+
+    def test_migrate_courseids_exclusions(self):
+        """
+        Test that the exclusions follow the migrated courses
+        """
+        staff, learner = [
+            User.objects.create(email='exclusion{}@edx.org'.format(index), username='exclusion_courseids{}'.format(index))
+            for index in xrange(2)
+        ]
+        CourseStaffRole(CourseKey.from_string(self.good_style_course_id)).add_users(staff)
+        for user in [staff, learner]:
+            gradebook_models.StudentGradebook.objects.create(
+                user=user, course_id=self.bad_style_course_id, grade=0.5, proforma_grade=0.5
+            )
+        gradebook_models.GradebookExclusion.objects.create(user=learner, course_id=self.bad_style_course_id)
+        gradebook_models.StudentGradebook.objects.filter(user=learner).update(exclude_from_aggregates=True)
+
+        migrate_gradebook_courseids_v2.Command().handle()
+
+        self.assertFalse(
+            gradebook_models.GradebookExclusion.objects.filter(course_id=self.bad_style_course_id).exists()
+        )
+        self.assertEqual(
+            list(gradebook_models.GradebookExclusion.objects.filter(course_id=self.good_style_course_id)
+                 .values_list('user_id', flat=True)),
+            [staff.id]
+        )
+        self.assertTrue(gradebook_models.StudentGradebook.objects.get(user=staff).exclude_from_aggregates)
+        self.assertFalse(gradebook_models.StudentGradebook.objects.get(user=learner).exclude_from_aggregates)
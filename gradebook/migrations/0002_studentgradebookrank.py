@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import xmodule_django.models
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('gradebook', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentGradebookRank',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('course_id', xmodule_django.models.CourseKeyField(max_length=255, blank=True)),
+                ('grade', models.FloatField()),
+                ('modified', models.DateTimeField()),
+                ('rank', models.PositiveIntegerField()),
+                ('user', models.ForeignKey(to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='studentgradebookrank',
+            unique_together=set([('user', 'course_id')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='studentgradebookrank',
+            index_together=set([('course_id', 'rank'), ('course_id', 'grade', 'modified')]),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import model_utils.fields
+import xmodule_django.models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gradebook', '0003_studentgradebook_course_grade_modified_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseGradebookAggregate',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('course_id', xmodule_django.models.CourseKeyField(unique=True, max_length=255)),
+                ('grade_sum', models.FloatField(default=0)),
+                ('grade_count', models.PositiveIntegerField(default=0)),
+                ('grade_min', models.FloatField(null=True)),
+                ('grade_max', models.FloatField(null=True)),
+                ('enrolled_count', models.PositiveIntegerField(default=0)),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, verbose_name='modified', editable=False)),
+            ],
+        ),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gradebook', '0004_coursegradebookaggregate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentgradebook',
+            name='grade_summary_hash',
+            field=models.CharField(max_length=40, blank=True),
+        ),
+        migrations.AddField(
+            model_name='studentgradebook',
+            name='grading_policy_hash',
+            field=models.CharField(max_length=40, blank=True),
+        ),
+        migrations.AddField(
+            model_name='studentgradebook',
+            name='progress_summary_hash',
+            field=models.CharField(max_length=40, blank=True),
+        ),
+    ]
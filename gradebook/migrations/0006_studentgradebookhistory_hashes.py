@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gradebook', '0005_studentgradebook_blob_hashes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentgradebookhistory',
+            name='grade_summary_hash',
+            field=models.CharField(max_length=40, blank=True),
+        ),
+        migrations.AddField(
+            model_name='studentgradebookhistory',
+            name='grading_policy_hash',
+            field=models.CharField(max_length=40, blank=True),
+        ),
+        migrations.AddField(
+            model_name='studentgradebookhistory',
+            name='progress_summary_hash',
+            field=models.CharField(max_length=40, blank=True),
+        ),
+        migrations.AlterIndexTogether(
+            name='studentgradebookhistory',
+            index_together=set([('user', 'course_id', 'created')]),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import model_utils.fields
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gradebook', '0006_studentgradebookhistory_hashes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GradebookBlob',
+            fields=[
+                ('hash', models.CharField(max_length=40, serialize=False, primary_key=True)),
+                ('data', models.BinaryField()),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, verbose_name='created', editable=False)),
+            ],
+        ),
+    ]
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import xmodule_django.models
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('gradebook', '0007_gradebookblob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GradebookExclusion',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('course_id', xmodule_django.models.CourseKeyField(max_length=255, db_index=True)),
+                ('user', models.ForeignKey(to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='gradebookexclusion',
+            unique_together=set([('course_id', 'user')]),
+        ),
+        migrations.AddField(
+            model_name='studentgradebook',
+            name='exclude_from_aggregates',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterIndexTogether(
+            name='studentgradebook',
+            index_together=set([('course_id', 'grade', 'modified'), ('course_id', 'exclude_from_aggregates')]),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from gradebook.data_migration import iterate_in_batches
+
+
+def populate_is_active_enrolled(apps, schema_editor):
+    """
+    Flags the existing gradebook entries of the active users actively enrolled in their course
+    """
+    StudentGradebook = apps.get_model('gradebook', 'StudentGradebook')
+    CourseEnrollment = apps.get_model('student', 'CourseEnrollment')
+    for rows in iterate_in_batches(StudentGradebook.objects.all(), ('user', 'course_id'), 1000):
+        active_enrollments = set(CourseEnrollment.objects.filter(
+            user__in=set(row['user'] for row in rows),
+            user__is_active=True,
+            is_active=True
+        ).values_list('user', 'course_id'))
+        active_pks = [row['pk'] for row in rows if (row['user'], row['course_id']) in active_enrollments]
+        if active_pks:
+            StudentGradebook.objects.filter(pk__in=active_pks).update(is_active_enrolled=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('student', '0001_initial'),
+        ('gradebook', '0008_gradebookexclusion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentgradebook',
+            name='is_active_enrolled',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterIndexTogether(
+            name='studentgradebook',
+            index_together=set([
+                ('course_id', 'grade', 'modified'),
+                ('course_id', 'exclude_from_aggregates'),
+                ('course_id', 'is_active_enrolled', 'grade', 'modified'),
+            ]),
+        ),
+        migrations.RunPython(populate_is_active_enrolled, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F
+
+
+def populate_completions(apps, schema_editor):
+    """
+    Flags the existing completed gradebook entries and counts them in the course aggregates
+    """
+    StudentGradebook = apps.get_model('gradebook', 'StudentGradebook')
+    CourseGradebookAggregate = apps.get_model('gradebook', 'CourseGradebookAggregate')
+    grade_complete_match_range = getattr(settings, 'GRADEBOOK_GRADE_COMPLETE_PROFORMA_MATCH_RANGE', 0.01)
+    StudentGradebook.objects.filter(
+        proforma_grade__gt=0,
+        proforma_grade__lte=F('grade') + grade_complete_match_range
+    ).update(is_complete=True)
+    for course_id, completed_count in StudentGradebook.objects.filter(
+            is_active_enrolled=True,
+            is_complete=True
+    ).values_list('course_id').annotate(Count('id')).order_by():
+        CourseGradebookAggregate.objects.filter(course_id=course_id).update(completed_count=completed_count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gradebook', '0009_studentgradebook_is_active_enrolled'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentgradebook',
+            name='is_complete',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='coursegradebookaggregate',
+            name='completed_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterIndexTogether(
+            name='studentgradebook',
+            index_together=set([
+                ('course_id', 'grade', 'modified'),
+                ('course_id', 'exclude_from_aggregates'),
+                ('course_id', 'is_active_enrolled', 'grade', 'modified'),
+                ('course_id', 'is_active_enrolled', 'is_complete'),
+            ]),
+        ),
+        migrations.RunPython(populate_completions, migrations.RunPython.noop),
+    ]
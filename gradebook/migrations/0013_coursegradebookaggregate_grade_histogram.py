@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gradebook', '0012_studentgradebookchange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coursegradebookaggregate',
+            name='grade_histogram',
+            field=models.TextField(blank=True),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+def populate_ranks(apps, schema_editor):
+    """
+    Builds the leaderboard of every existing course, as StudentGradebookRank.rebuild does: the
+    entries of the active, enrolled users ordered by grade (descending), then modified and user id
+    """
+    StudentGradebook = apps.get_model('gradebook', 'StudentGradebook')
+    StudentGradebookRank = apps.get_model('gradebook', 'StudentGradebookRank')
+    enrolled_entries = StudentGradebook.objects.filter(is_active_enrolled=True)
+    course_keys = enrolled_entries.order_by().values_list('course_id', flat=True).distinct()
+    for course_key in list(course_keys):
+        StudentGradebookRank.objects.filter(course_id=course_key).delete()
+        rank_entries = []
+        ranked_entries = enrolled_entries.filter(course_id=course_key)\
+            .order_by('-grade', 'modified', 'user__id').values_list('user__id', 'grade', 'modified')
+        for rank, (user_id, grade, modified) in enumerate(ranked_entries.iterator(), start=1):
+            rank_entries.append(StudentGradebookRank(
+                user_id=user_id, course_id=course_key, grade=grade, modified=modified, rank=rank
+            ))
+            if len(rank_entries) == 1000:
+                StudentGradebookRank.objects.bulk_create(rank_entries)
+                rank_entries = []
+        StudentGradebookRank.objects.bulk_create(rank_entries)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gradebook', '0013_coursegradebookaggregate_grade_histogram'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_ranks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gradebook', '0014_populate_studentgradebookrank'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gradebookblob',
+            name='last_stored',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -1,11 +1,16 @@
 """
 Django database models supporting the gradebook app
 """
+import json
+import zlib
+from collections import Counter
+from datetime import timedelta
+
 from django.utils import timezone
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import models
-from django.db.models import Avg, Max, Min, Count, F
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import Max, Min, Count, Sum, F, Q, Case, When, Value
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.utils.translation import ugettext_lazy as _
@@ -13,10 +18,337 @@ from model_utils.fields import AutoCreatedField, AutoLastModifiedField
 
 from model_utils.models import TimeStampedModel
 from student.models import CourseEnrollment
+from student.roles import get_aggregate_exclusion_user_ids
 from xmodule_django.models import CourseKeyField
 
+from gradebook.caching import cached_course_query, invalidate_course_cache
+from gradebook.utils import (
+    blob_hash, decode_keyset_cursor, encode_keyset_cursor, grade_bucket, grade_bucket_bound, histogram_percentile
+)
+
+EMPTY_BLOB_HASH = blob_hash('')
+
+# Columns of a leaderboard row
+LEADERBOARD_FIELDS = (
+    'user__id',
+    'user__username',
+    'user__profile__title',
+    'user__profile__avatar_url',
+    'grade',
+    'modified',
+)
+
+
+def ranked_before(grade, modified, user_id):
+    """
+    Returns the filter of the gradebook or rank entries placed before the given grade, modified
+    time and user id on the leaderboard: by grade (descending), then modified and user id
+    (ascending)
+    """
+    return (
+        Q(grade__gt=grade) |
+        Q(grade=grade, modified__lt=modified) |
+        Q(grade=grade, modified=modified, user__id__lt=user_id)
+    )
+
+
+def counted_above(grade, time_scored):
+    """
+    Returns the filter of the gradebook or rank entries counted above a user holding the given
+    grade, scored at the given time, in leaderboard positions: the better grades, and the same
+    grade modified no later than the user's entry was created. Tied users may share a position.
+    """
+    return Q(grade__gt=grade) | Q(grade=grade, modified__lte=time_scored)
+
+
+class GradebookBlob(models.Model):
+    """
+    Content-addressed storage for the serialized gradebook blobs. Each distinct progress
+    summary, grade summary or grading policy is stored once, zlib compressed, and referenced
+    by its content hash from the gradebook and history entries.
+    """
+    hash = models.CharField(max_length=40, primary_key=True)
+    data = models.BinaryField()
+    created = AutoCreatedField(_('created'))
+    # When the blob was last stored, refreshed at most every half grace period, see collect_garbage
+    last_stored = models.DateTimeField(default=timezone.now)
+
+    @staticmethod
+    def gc_grace_period():
+        """
+        Returns how long a stored blob is kept even when nothing references it
+        """
+        return timedelta(seconds=getattr(settings, 'GRADEBOOK_BLOB_GC_GRACE_SECONDS', 86400))
+
+    @classmethod
+    def store_many(cls, texts):
+        """
+        Stores the given serialized blobs, skipping those already present, and returns their hashes.
+        The blobs already present whose last_stored time is older than half the garbage collection
+        grace period get it refreshed, so that collect_garbage keeps them until the rows referencing
+        them are committed, and those it removed in the meantime are stored again. Frequently stored
+        blobs, like the grading policy shared by a course, are thus written once per half grace
+        period instead of being locked by every writer.
+        """
+        blobs = {blob_hash(text): text for text in texts}
+        now = timezone.now()
+        with transaction.atomic():
+            last_stored = dict(cls.objects.filter(hash__in=blobs.keys()).values_list('hash', 'last_stored'))
+            existing_hashes = set(last_stored)
+            for text_hash in sorted(existing_hashes):
+                if last_stored[text_hash] < now - cls.gc_grace_period() / 2:
+                    if not cls.objects.filter(hash=text_hash).update(last_stored=now):
+                        # Removed by collect_garbage in the meantime
+                        existing_hashes.remove(text_hash)
+            new_blobs = [
+                cls(hash=text_hash, data=zlib.compress(text.encode('utf-8') if isinstance(text, unicode) else text))
+                for text_hash, text in blobs.iteritems() if text_hash not in existing_hashes
+            ]
+            if new_blobs:
+                try:
+                    with transaction.atomic():
+                        cls.objects.bulk_create(new_blobs)
+                except IntegrityError:
+                    # Another process stored some of them in the meantime
+                    for blob in new_blobs:
+                        if not cls.objects.filter(hash=blob.hash).exists():
+                            blob.save()
+        return blobs.keys()
+
+    @classmethod
+    def fetch_many(cls, hashes):
+        """
+        Returns the serialized blobs of the given hashes, keyed by hash
+        """
+        return {
+            text_hash: zlib.decompress(bytes(data)).decode('utf-8')
+            for text_hash, data in cls.objects.filter(hash__in=set(hashes)).values_list('hash', 'data')
+        }
+
+    @classmethod
+    def fetch(cls, text_hash):
+        """
+        Returns the serialized blob of the given hash
+        """
+        return cls.fetch_many([text_hash])[text_hash]
+
+    @staticmethod
+    def _referenced_hashes(hashes=None, prefix=None):
+        """
+        Returns the blob hashes referenced by the gradebook and history entries, among the given
+        hashes or those starting with the given prefix
+        """
+        referenced_hashes = set()
+        for model in [StudentGradebook, StudentGradebookHistory]:
+            hash_fields = ['{}_hash'.format(name) for name in model.BLOB_FIELDS]
+            lookup = '{}__in' if hashes is not None else '{}__startswith'
+            value = hashes if hashes is not None else prefix
+            condition = Q()
+            for name in hash_fields:
+                condition |= Q(**{lookup.format(name): value})
+            for row in model.objects.filter(condition).values_list(*hash_fields).iterator():
+                referenced_hashes.update(row)
+        return referenced_hashes
+
+    @classmethod
+    def collect_garbage(cls, batch_size=1000):
+        """
+        Removes the blobs no longer referenced by any gradebook or history entry, e.g. after course
+        deletions, and returns how many were removed. The hashes are swept one leading hex digit
+        at a time, so that only a sixteenth of the referenced hashes is held in memory. Only the
+        blobs not stored for GRADEBOOK_BLOB_GC_GRACE_SECONDS are candidates, and their references
+        are checked again right before their removal: a writer storing one of them again refreshes
+        its last_stored time (see store_many), which the deletion re-checks.
+        """
+        removed = 0
+        for prefix in '0123456789abcdef':
+            stored_before = timezone.now() - cls.gc_grace_period()
+            referenced_hashes = cls._referenced_hashes(prefix=prefix)
+            candidates = [
+                text_hash for text_hash in cls.objects.filter(hash__startswith=prefix, last_stored__lt=stored_before)
+                .values_list('hash', flat=True).iterator()
+                if text_hash not in referenced_hashes
+            ]
+            for index in xrange(0, len(candidates), batch_size):
+                batch = set(candidates[index:index + batch_size])
+                unreferenced_blobs = cls.objects.filter(
+                    hash__in=batch - cls._referenced_hashes(hashes=batch),
+                    last_stored__lt=stored_before
+                )
+                removed += unreferenced_blobs.count()
+                unreferenced_blobs.delete()
+        return removed
+
+
+class ParsedBlob(object):
+    """
+    Read-only attribute holding the parsed value of a serialized blob field, see GradebookBlobsMixin.get_blob
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return instance.get_blob(self.name)
+
+
+class GradebookBlobsQuerySet(models.QuerySet):
+    """
+    QuerySet of the models holding serialized blobs
+    """
+
+    def without_summaries(self):
+        """
+        Leaves the serialized blobs out of the fetched rows. Each blob read from a returned
+        instance costs a query of its own.
+        """
+        return self.defer(*self.model.BLOB_FIELDS)
+
+    def with_summaries(self, *names):
+        """
+        Fetches the given serialized blobs, or all of them, along with the other columns
+        """
+        queryset = self.defer(None)
+        if names:
+            queryset = queryset.defer(*[name for name in self.model.BLOB_FIELDS if name not in names])
+        return queryset
+
+
+class StudentGradebookQuerySet(GradebookBlobsQuerySet):
+    """
+    QuerySet of the gradebook entries, with the projections of their most frequent reads
+    """
+
+    def grades_only(self):
+        """
+        Fetches the grade, completion and timestamp columns of the entries only. The returned
+        instances are meant to be read: save entries fetched with all their columns.
+        """
+        return self.only('user', 'course_id', 'grade', 'proforma_grade', 'is_complete', 'created', 'modified')
+
+    def ranking(self):
+        """
+        Returns the leaderboard rows of the entries, best first
+        """
+        return self.values(*LEADERBOARD_FIELDS).order_by('-grade', 'modified', 'user__id')
+
+    def grade_histogram(self, bucket_count):
+        """
+        Returns the number of entries per grade bucket (see utils.grade_bucket), counted by the
+        database in a single aggregate query
+        """
+        buckets = {}
+        for index in xrange(bucket_count):
+            bounds = {}
+            if index > 0:
+                bounds['grade__gte'] = grade_bucket_bound(index, bucket_count)
+            if index < bucket_count - 1:
+                bounds['grade__lt'] = grade_bucket_bound(index + 1, bucket_count)
+            buckets['bucket_{}'.format(index)] = Sum(Case(
+                When(then=Value(1), **bounds) if bounds else When(grade__isnull=False, then=Value(1)),
+                default=Value(0),
+                output_field=models.IntegerField()
+            ))
+        counts = self.aggregate(**buckets)
+        return [counts['bucket_{}'.format(index)] or 0 for index in xrange(bucket_count)]
+
+
+class DeferredBlobsManager(models.Manager):
+    """
+    Manager whose querysets leave the serialized blobs out unless with_summaries() is called,
+    for the queries reading grades only
+    """
+
+    def get_queryset(self):
+        return super(DeferredBlobsManager, self).get_queryset().without_summaries()
+
+
+class GradebookBlobsMixin(object):
+    """
+    Blob handling shared by the models holding serialized progress summaries, grade summaries
+    and grading policies. Rows whose blobs were moved into GradebookBlob keep an empty text
+    column next to the content hash.
+    """
+    BLOB_FIELDS = ('progress_summary', 'grade_summary', 'grading_policy')
+
+    parsed_progress_summary = ParsedBlob('progress_summary')
+    parsed_grade_summary = ParsedBlob('grade_summary')
+    parsed_grading_policy = ParsedBlob('grading_policy')
+
+    def get_blob_text(self, name):
+        """
+        Returns the serialized blob, whether it is stored inline or in GradebookBlob
+        """
+        text = getattr(self, name)
+        text_hash = getattr(self, '{}_hash'.format(name))
+        if text or not text_hash or text_hash == EMPTY_BLOB_HASH:
+            return text
+        fetched_blobs = self.__dict__.get('_fetched_blobs', {})
+        if text_hash in fetched_blobs:
+            return fetched_blobs[text_hash]
+        return GradebookBlob.fetch(text_hash)
+
+    @classmethod
+    def prefetch_blobs(cls, entries, name):
+        """
+        Fetches the given blob of the entries held in GradebookBlob with a single query, so that
+        reading it from any of them through get_blob_text() or get_blob() costs no query of its own
+        """
+        hash_name = '{}_hash'.format(name)
+        fetched_blobs = GradebookBlob.fetch_many(
+            getattr(entry, hash_name) for entry in entries
+            if not getattr(entry, name) and getattr(entry, hash_name) and getattr(entry, hash_name) != EMPTY_BLOB_HASH
+        )
+        for entry in entries:
+            entry.__dict__.setdefault('_fetched_blobs', {}).update(fetched_blobs)
+
+    def get_blob(self, name):
+        """
+        Returns the parsed blob, or None when it is empty. The blob is parsed on first access and
+        the parsed value kept on the instance until the blob text changes, so it must be treated
+        as read-only.
+        """
+        parsed_blobs = self.__dict__.setdefault('_parsed_blobs', {})
+        text = getattr(self, name)
+        # Blobs held in GradebookBlob are identified by their content hash
+        key = text or getattr(self, '{}_hash'.format(name))
+        if name not in parsed_blobs or parsed_blobs[name][0] is not key:
+            text = self.get_blob_text(name)
+            parsed_blobs[name] = (key, json.loads(text) if text else None)
+        return parsed_blobs[name][1]
+
+    @classmethod
+    def _offload_blobs(cls, entries):
+        """
+        When GRADEBOOK_BLOB_STORE is enabled, moves the blobs of the given entries into
+        GradebookBlob and blanks their text columns for the upcoming write. Returns the
+        blanked values, to be put back with _restore_blobs once the entries are written.
+        """
+        if not getattr(settings, 'GRADEBOOK_BLOB_STORE', False):
+            return []
+        offloaded_blobs = [
+            (entry, name, getattr(entry, name))
+            for entry in entries
+            for name in cls.BLOB_FIELDS
+            if name in entry.__dict__ and getattr(entry, name)
+        ]
+        GradebookBlob.store_many(text for __, __, text in offloaded_blobs)
+        for entry, name, __ in offloaded_blobs:
+            setattr(entry, name, '')
+        return offloaded_blobs
+
+    @staticmethod
+    def _restore_blobs(offloaded_blobs):
+        """
+        Puts back the blob texts blanked by _offload_blobs
+        """
+        for entry, name, text in offloaded_blobs:
+            setattr(entry, name, text)
+
 
-class StudentGradebook(models.Model):
+class StudentGradebook(GradebookBlobsMixin, models.Model):
     """
     StudentGradebook is essentially a container used to cache calculated
     grades (see courseware.grades.grade), which can be an expensive operation.
@@ -28,18 +360,419 @@ class StudentGradebook(models.Model):
     progress_summary = models.TextField(blank=True)
     grade_summary = models.TextField(blank=True)
     grading_policy = models.TextField(blank=True)
+    progress_summary_hash = models.CharField(max_length=40, blank=True)
+    grade_summary_hash = models.CharField(max_length=40, blank=True)
+    grading_policy_hash = models.CharField(max_length=40, blank=True)
+    # Mirrors GradebookExclusion, so that excluded users are filtered out through an index
+    exclude_from_aggregates = models.BooleanField(default=False)
+    # Mirrors the user's active status and active enrollment in the course, so that leaderboard,
+    # position and completion queries don't need to join the user and enrollment tables
+    is_active_enrolled = models.BooleanField(default=False)
+    # Whether the proforma grade is matched by the grade (see is_completed_grade), stored at write time
+    is_complete = models.BooleanField(default=False)
     # We can't use TimeStampedModel here because those fields are not indexed.
     created = AutoCreatedField(_('created'), db_index=True)
     modified = AutoLastModifiedField(_('modified'), db_index=True)
 
+    objects = models.Manager.from_queryset(StudentGradebookQuerySet)()
+    deferred = DeferredBlobsManager.from_queryset(StudentGradebookQuerySet)()
+
     class Meta:
         """
         Meta information for this Django model
         """
         unique_together = (('user', 'course_id'),)
+        index_together = (
+            ('course_id', 'grade', 'modified'),
+            ('course_id', 'exclude_from_aggregates'),
+            ('course_id', 'is_active_enrolled', 'grade', 'modified'),
+            ('course_id', 'is_active_enrolled', 'is_complete'),
+        )
+
+    # Maintained by their own receivers and only written when an entry is created, so that saving
+    # an entry loaded earlier can't undo a concurrent enrollment or exclusion change
+    DENORMALIZED_FIELDS = ('exclude_from_aggregates', 'is_active_enrolled')
+
+    def __init__(self, *args, **kwargs):
+        super(StudentGradebook, self).__init__(*args, **kwargs)
+        # Remember the stored grade so post_save receivers can maintain aggregates incrementally
+        self._stored_grade = self.__dict__.get('grade') if self.pk else None
+        self._stored_is_complete = self.__dict__.get('is_complete') if self.pk else None
+        # Remember the loaded blobs so their stored hashes are only recomputed when they change
+        self._loaded_blobs = {name: self.__dict__.get(name) for name in self.BLOB_FIELDS} if self.pk else {}
+
+    def save(self, *args, **kwargs):  # pylint: disable=arguments-differ
+        if 'grade' in self.__dict__ and 'proforma_grade' in self.__dict__:
+            self.is_complete = self.is_completed_grade(self.grade, self.proforma_grade)
+        if self._state.adding and self.pk is None:
+            self.exclude_from_aggregates = GradebookExclusion.objects.filter(
+                course_id=self.course_id, user__id=self.user_id
+            ).exists()
+            self.is_active_enrolled = CourseEnrollment.objects.filter(
+                user__id=self.user_id,
+                user__is_active=True,
+                course_id__exact=self.course_id,
+                is_active=True
+            ).exists()
+        elif 'update_fields' not in kwargs:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname in self.__dict__ and
+                field.name not in self.DENORMALIZED_FIELDS
+            ]
+        self._update_blob_hashes()
+        with transaction.atomic():
+            offloaded_blobs = self._offload_blobs([self])
+            try:
+                super(StudentGradebook, self).save(*args, **kwargs)
+            finally:
+                self._restore_blobs(offloaded_blobs)
+        # Bumped by a post_save receiver too, before the write was committed
+        invalidate_course_cache(self.course_id)
+        self._stored_grade = self.grade
+        self._stored_is_complete = self.__dict__.get('is_complete')
+        self._loaded_blobs = {name: self.__dict__.get(name) for name in self.BLOB_FIELDS}
+
+    @staticmethod
+    def completion_match_range():
+        """
+        Returns how far below the proforma grade a grade may be for the course to count as completed
+        """
+        return getattr(settings, 'GRADEBOOK_GRADE_COMPLETE_PROFORMA_MATCH_RANGE', 0.01)
+
+    @classmethod
+    def is_completed_grade(cls, grade, proforma_grade):
+        """
+        Returns whether a learner holding the given grades completed the course
+        """
+        return 0 < proforma_grade <= grade + cls.completion_match_range()
+
+    @classmethod
+    def refresh_completion_flags(cls, course_key):
+        """
+        Recomputes the is_complete flags of the course gradebook entries, e.g. after
+        GRADEBOOK_GRADE_COMPLETE_PROFORMA_MATCH_RANGE changed. Returns how many changed.
+        """
+        completed = Q(proforma_grade__gt=0, proforma_grade__lte=F('grade') + cls.completion_match_range())
+        entries = cls.objects.filter(course_id__exact=course_key)
+        with transaction.atomic():
+            changed = entries.filter(completed, is_complete=False).update(is_complete=True)
+            changed += entries.filter(is_complete=True).exclude(completed).update(is_complete=False)
+        return changed
+
+    def _update_blob_hashes(self):
+        """
+        Refreshes the content hashes of the blob fields changed since the entry was loaded
+        """
+        for name in self.BLOB_FIELDS:
+            if name in self.__dict__:
+                text = getattr(self, name)
+                if self._loaded_blobs.get(name) != text or not getattr(self, '{}_hash'.format(name)):
+                    setattr(self, '{}_hash'.format(name), blob_hash(text))
+
+    def update_values(self, values):
+        """
+        Applies freshly calculated values (grade, proforma_grade and the serialized blobs)
+        to the entry and returns whether any of them changed, i.e. whether the entry needs
+        to be saved. Blobs are compared through their stored content hashes.
+        """
+        changed = False
+        for name in ('grade', 'proforma_grade'):
+            if getattr(self, name) != values[name]:
+                setattr(self, name, values[name])
+                changed = True
+
+        for name in self.BLOB_FIELDS:
+            text = values[name]
+            stored_hash = getattr(self, '{}_hash'.format(name))
+            if stored_hash:
+                is_changed = stored_hash != blob_hash(text)
+            else:
+                # Entries written before hashes were stored
+                is_changed = getattr(self, name) != text
+            if is_changed:
+                setattr(self, name, text)
+                changed = True
+        return changed
+
+    @classmethod
+    def enrolled_entries(cls, course_key):
+        """
+        Returns the gradebook entries of the active users actively enrolled in the course
+        """
+        return cls.objects.filter(course_id__exact=course_key, is_active_enrolled=True)
+
+    @staticmethod
+    def filter_members(queryset, org_ids=None, group_ids=None):
+        """
+        Restricts the gradebook entries to the members of the given organizations and groups.
+        Membership is matched with a subquery rather than a join, so that users belonging to
+        several of them don't duplicate entries and the results don't need a DISTINCT.
+        """
+        if org_ids:
+            queryset = queryset.filter(user__in=User.objects.filter(organizations__in=org_ids).values('id'))
+        if group_ids:
+            queryset = queryset.filter(user__in=User.objects.filter(groups__in=group_ids).values('id'))
+        return queryset
+
+    @classmethod
+    def refresh_enrollment_flags(cls, course_key=None, user_id=None):
+        """
+        Recomputes the is_active_enrolled flags of the gradebook entries of the given course
+        and/or user from the users and enrollments. Returns the course keys of the entries
+        whose flag changed.
+        """
+        entries = cls.objects.all()
+        enrollments = CourseEnrollment.objects.filter(user__is_active=True, is_active=True)
+        if course_key is not None:
+            entries = entries.filter(course_id__exact=course_key)
+            enrollments = enrollments.filter(course_id__exact=course_key)
+        if user_id is not None:
+            entries = entries.filter(user__id=user_id)
+            enrollments = enrollments.filter(user__id=user_id)
+
+        active_enrollments = set(enrollments.values_list('user__id', 'course_id'))
+        changes = {True: [], False: []}
+        for entry_id, entry_user_id, entry_course_id, is_active_enrolled in entries.values_list(
+                'id', 'user__id', 'course_id', 'is_active_enrolled'):
+            if ((entry_user_id, entry_course_id) in active_enrollments) != is_active_enrolled:
+                changes[not is_active_enrolled].append((entry_id, entry_course_id))
+        with transaction.atomic():
+            for is_active_enrolled, changed_entries in changes.iteritems():
+                if changed_entries:
+                    cls.objects.filter(id__in=[entry_id for entry_id, __ in changed_entries])\
+                        .update(is_active_enrolled=is_active_enrolled)
+        return set(course_id for changed_entries in changes.itervalues() for __, course_id in changed_entries)
+
+    @classmethod
+    def _prepare_new_entries(cls, entries):
+        """
+        Sets the denormalized flags, completion and blob hashes of unsaved gradebook entries
+        about to be inserted without save()
+        """
+        if not entries:
+            return
+        course_keys = set(entry.course_id for entry in entries)
+        user_ids = [entry.user_id for entry in entries]
+        excluded_users = set(GradebookExclusion.objects.filter(
+            course_id__in=course_keys,
+            user__in=user_ids
+        ).values_list('course_id', 'user_id'))
+        active_enrollments = set(CourseEnrollment.objects.filter(
+            course_id__in=course_keys,
+            user__in=user_ids,
+            user__is_active=True,
+            is_active=True
+        ).values_list('course_id', 'user__id'))
+        for entry in entries:
+            entry.exclude_from_aggregates = (entry.course_id, entry.user_id) in excluded_users
+            entry.is_active_enrolled = (entry.course_id, entry.user_id) in active_enrollments
+            entry.is_complete = cls.is_completed_grade(entry.grade, entry.proforma_grade)
+            entry._update_blob_hashes()  # pylint: disable=protected-access
+
+    @classmethod
+    def bulk_upsert_entries(cls, entries, update_fields=('grade', 'proforma_grade')):
+        """
+        Writes the given unsaved gradebook entries: the update_fields of the stored entries of the
+        same users and courses are overwritten, one UPDATE per entry, and the other entries are
+        inserted with a single INSERT. Their changes are appended to the change log, but no history
+        is recorded and post_save is not sent, so the caller rebuilds the leaderboards and
+        aggregates of the returned course keys afterwards.
+        """
+        # The last entry of a user and course wins
+        entries = {(entry.user_id, unicode(entry.course_id)): entry for entry in entries}.values()
+        if not entries:
+            return set()
+        course_keys = set(entry.course_id for entry in entries)
+        stored_ids = {
+            (user_id, unicode(course_id)): entry_id for entry_id, user_id, course_id in cls.objects.filter(
+                course_id__in=course_keys,
+                user__in=set(entry.user_id for entry in entries)
+            ).values_list('id', 'user__id', 'course_id')
+        }
+        new_entries = []
+        stored_entries = []
+        for entry in entries:
+            entry_id = stored_ids.get((entry.user_id, unicode(entry.course_id)))
+            if entry_id is None:
+                new_entries.append(entry)
+            else:
+                entry._update_blob_hashes()  # pylint: disable=protected-access
+                stored_entries.append((entry_id, entry))
+        cls._prepare_new_entries(new_entries)
+
+        update_fields = list(update_fields)
+        for name in cls.BLOB_FIELDS:
+            if name in update_fields:
+                update_fields.append('{}_hash'.format(name))
+        modified = timezone.now()
+        with transaction.atomic():
+            offloaded_blobs = cls._offload_blobs(entries)
+            try:
+                cls.objects.bulk_create(new_entries)
+                for entry_id, entry in stored_entries:
+                    entry.is_complete = cls.is_completed_grade(entry.grade, entry.proforma_grade)
+                    values = {name: getattr(entry, name) for name in update_fields}
+                    cls.objects.filter(id=entry_id).update(
+                        is_complete=entry.is_complete,
+                        modified=modified,
+                        **values
+                    )
+            finally:
+                cls._restore_blobs(offloaded_blobs)
+            StudentGradebookChange.record_many(entries)
+        return course_keys
+
+    @staticmethod
+    def rebuild_courses(course_keys):
+        """
+        Rebuilds the leaderboards and aggregates of the given courses from scratch, once their
+        gradebook entries were written without post_save
+        """
+        for course_key in course_keys:
+            StudentGradebookRank.rebuild(course_key)
+            CourseGradebookAggregate.refresh(course_key)
+
+    @staticmethod
+    def _case_values(entries, name, output_field):
+        """
+        Returns the CASE expression setting the given field of every entry to its own value, for
+        updating the rows of several entries with a single UPDATE
+        """
+        return Case(*[When(id=entry.id, then=Value(getattr(entry, name))) for entry in entries], output_field=output_field)
 
     @classmethod
-    def generate_leaderboard(cls, course_key, user_id=None, group_ids=None, count=3, exclude_users=None):
+    def bulk_create_entries(cls, entries, refresh_courses=True):
+        """
+        Inserts the given unsaved gradebook entries, and their initial history entries, with
+        one query per table. Note that post_save is not sent for rows created this way: unless
+        refresh_courses is False, in which case the caller takes care of it, the leaderboards and
+        aggregates of their courses are rebuilt.
+        """
+        if not entries:
+            return
+        cls._prepare_new_entries(entries)
+        with transaction.atomic():
+            offloaded_blobs = cls._offload_blobs(entries)
+            try:
+                cls.objects.bulk_create(entries)
+                StudentGradebookHistory.objects.bulk_create([
+                    StudentGradebookHistory.from_gradebook_entry(entry) for entry in entries
+                ])
+                StudentGradebookSnapshot.objects.bulk_create([
+                    StudentGradebookSnapshot.from_gradebook_entry(entry) for entry in entries
+                ])
+                StudentGradebookChange.record_many(entries)
+            finally:
+                cls._restore_blobs(offloaded_blobs)
+            if refresh_courses:
+                cls.rebuild_courses(set(entry.course_id for entry in entries))
+        if refresh_courses:
+            for course_key in set(entry.course_id for entry in entries):
+                invalidate_course_cache(course_key)
+
+    @classmethod
+    def bulk_update_entries(cls, entries, refresh_courses=True):
+        """
+        Writes the grades and serialized blobs of the given stored gradebook entries, e.g. after
+        update_values(), with a single UPDATE statement, and appends their history entries,
+        snapshots and changes with one INSERT per table. Note that post_save is not sent for rows
+        updated this way: unless refresh_courses is False, in which case the caller takes care of
+        it, the leaderboards and aggregates of their courses are rebuilt.
+        """
+        if not entries:
+            return
+        modified = timezone.now()
+        for entry in entries:
+            entry.is_complete = cls.is_completed_grade(entry.grade, entry.proforma_grade)
+            entry._update_blob_hashes()  # pylint: disable=protected-access
+        complete_ids = [entry.id for entry in entries if entry.is_complete]
+        with transaction.atomic():
+            offloaded_blobs = cls._offload_blobs(entries)
+            try:
+                values = {
+                    name: cls._case_values(entries, name, models.FloatField())
+                    for name in ('grade', 'proforma_grade')
+                }
+                for name in cls.BLOB_FIELDS:
+                    values[name] = cls._case_values(entries, name, models.TextField())
+                    hash_name = '{}_hash'.format(name)
+                    values[hash_name] = cls._case_values(entries, hash_name, models.CharField())
+                cls.objects.filter(id__in=[entry.id for entry in entries]).update(
+                    is_complete=Case(
+                        When(id__in=complete_ids, then=Value(True)),
+                        default=Value(False),
+                        output_field=models.BooleanField()
+                    ) if complete_ids else False,
+                    modified=modified,
+                    **values
+                )
+                StudentGradebookHistory.objects.bulk_create([
+                    StudentGradebookHistory.from_gradebook_entry(entry) for entry in entries
+                ])
+            finally:
+                cls._restore_blobs(offloaded_blobs)
+            StudentGradebookSnapshot.objects.bulk_create([
+                StudentGradebookSnapshot.from_gradebook_entry(entry) for entry in entries
+            ])
+            StudentGradebookChange.record_many(entries)
+            if refresh_courses:
+                cls.rebuild_courses(set(entry.course_id for entry in entries))
+        if refresh_courses:
+            for course_key in set(entry.course_id for entry in entries):
+                invalidate_course_cache(course_key)
+        for entry in entries:
+            entry.modified = modified
+            entry._stored_grade = entry.grade  # pylint: disable=protected-access
+            entry._stored_is_complete = entry.is_complete  # pylint: disable=protected-access
+            entry._loaded_blobs = {name: entry.__dict__.get(name) for name in cls.BLOB_FIELDS}  # pylint: disable=protected-access
+
+    @classmethod
+    def bulk_update_grades(cls, entries, refresh_courses=True):
+        """
+        Writes the grade and proforma_grade of the given gradebook entries with a single UPDATE
+        statement and appends their history entries with a single INSERT. Note that post_save is
+        not sent for rows updated this way: unless refresh_courses is False, in which case the
+        caller takes care of it, the leaderboards and aggregates of their courses are rebuilt.
+        """
+        if not entries:
+            return
+        modified = timezone.now()
+        for entry in entries:
+            entry.is_complete = cls.is_completed_grade(entry.grade, entry.proforma_grade)
+        complete_ids = [entry.id for entry in entries if entry.is_complete]
+        with transaction.atomic():
+            cls.objects.filter(id__in=[entry.id for entry in entries]).update(
+                grade=cls._case_values(entries, 'grade', models.FloatField()),
+                proforma_grade=cls._case_values(entries, 'proforma_grade', models.FloatField()),
+                is_complete=Case(
+                    When(id__in=complete_ids, then=Value(True)),
+                    default=Value(False),
+                    output_field=models.BooleanField()
+                ) if complete_ids else False,
+                modified=modified
+            )
+            StudentGradebookHistory.objects.bulk_create([
+                StudentGradebookHistory.from_gradebook_entry(entry) for entry in entries
+            ])
+            StudentGradebookSnapshot.objects.bulk_create([
+                StudentGradebookSnapshot.from_gradebook_entry(entry) for entry in entries
+            ])
+            StudentGradebookChange.record_many(entries)
+            if refresh_courses:
+                cls.rebuild_courses(set(entry.course_id for entry in entries))
+        if refresh_courses:
+            for course_key in set(entry.course_id for entry in entries):
+                invalidate_course_cache(course_key)
+        for entry in entries:
+            entry.modified = modified
+            entry._stored_grade = entry.grade  # pylint: disable=protected-access
+            entry._stored_is_complete = entry.is_complete  # pylint: disable=protected-access
+
+    @classmethod
+    @cached_course_query('leaderboard')
+    def generate_leaderboard(cls, course_key, user_id=None, group_ids=None, count=3, exclude_users=None,
+                             exclude_aggregate_users=False):
         """
         Assembles a data set representing the Top N users, by grade, for a given course.
         Optionally provide a user_id to include user-specific info.  For example, you
@@ -63,6 +796,10 @@ class StudentGradebook(models.Model):
         users (excluding any users who should be excluded), then we modify the course average to account for
         those users who currently lack gradebook entries.  We assume zero grades for these users because they
         have not yet submitted a response to a scored assessment which means no grade has been calculated.
+
+        Set exclude_aggregate_users to leave out the course's GradebookExclusion members (the users
+        of get_aggregate_exclusion_user_ids) through an indexed filter, rather than passing their
+        ids in exclude_users.
         """
         exclude_users = exclude_users or []
         data = {}
@@ -72,43 +809,56 @@ class StudentGradebook(models.Model):
         data['course_count'] = 0
         data['queryset'] = []
 
-        enrolled_users_not_excluded = CourseEnrollment.objects.users_enrolled_in(course_key).exclude(id__in=exclude_users)
-        total_user_count = enrolled_users_not_excluded.count()
+        course_aggregate = CourseGradebookAggregate.get_for_course(course_key)
+        total_user_count = course_aggregate.enrolled_count
+        gradebook_user_count = course_aggregate.grade_count
+        grade_sum = course_aggregate.grade_sum
+        grade_max = course_aggregate.grade_max
+        grade_min = course_aggregate.grade_min
 
-        if total_user_count:
-            # Generate the base data set we're going to work with
-            queryset = StudentGradebook.objects.select_related('user')\
-                .filter(course_id__exact=course_key, user__is_active=True, user__courseenrollment__is_active=True,
-                        user__courseenrollment__course_id__exact=course_key).exclude(user__id__in=exclude_users)
+        # Generate the base data set we're going to work with
+        queryset = cls.enrolled_entries(course_key).exclude(user__id__in=exclude_users)
+        if exclude_aggregate_users:
+            queryset = queryset.filter(exclude_from_aggregates=False)
 
-            aggregates = queryset.aggregate(Avg('grade'), Max('grade'), Min('grade'), Count('user'))
-            gradebook_user_count = aggregates['user__count']
+        if exclude_users or exclude_aggregate_users:
+            # Take the excluded users back out of the course aggregate
+            excluded_users = Q(id__in=exclude_users)
+            excluded_entries = Q(user__id__in=exclude_users)
+            if exclude_aggregate_users:
+                excluded_users |= Q(gradebookexclusion__course_id=course_key)
+                excluded_entries |= Q(exclude_from_aggregates=True)
+            total_user_count -= CourseEnrollment.objects.users_enrolled_in(course_key)\
+                .filter(excluded_users).distinct().count()
+            excluded = cls.enrolled_entries(course_key).filter(excluded_entries)\
+                .aggregate(Sum('grade'), Max('grade'), Min('grade'), Count('user'))
+            if excluded['user__count']:
+                gradebook_user_count -= excluded['user__count']
+                grade_sum -= excluded['grade__sum']
+                if excluded['grade__max'] >= grade_max or excluded['grade__min'] <= grade_min:
+                    extremes = queryset.aggregate(Max('grade'), Min('grade'))
+                    grade_max = extremes['grade__max']
+                    grade_min = extremes['grade__min']
 
+        if total_user_count:
             if gradebook_user_count:
-                # Calculate the class average
-                course_avg = aggregates['grade__avg']
-                if course_avg is not None:
-                    # Take into account any ungraded students (assumes zeros for grades...)
-                    course_avg = course_avg / total_user_count * gradebook_user_count
+                # Calculate the class average, taking into account any ungraded
+                # students (assumes zeros for grades...)
+                course_avg = grade_sum / total_user_count
 
-                    # Fill up the response container
-                    data['course_avg'] = float("{0:.3f}".format(course_avg))
-                    data['course_max'] = aggregates['grade__max']
-                    data['course_min'] = aggregates['grade__min']
-                    data['course_count'] = gradebook_user_count
+                # Fill up the response container
+                data['course_avg'] = float("{0:.3f}".format(course_avg))
+                data['course_max'] = grade_max
+                data['course_min'] = grade_min
+                data['course_count'] = gradebook_user_count
 
-                if group_ids:
-                    queryset = queryset.filter(user__groups__in=group_ids).distinct()
+                queryset = cls.filter_members(queryset, group_ids=group_ids)
 
                 # Construct the leaderboard as a queryset
-                data['queryset'] = queryset.values(
-                    'user__id',
-                    'user__username',
-                    'user__profile__title',
-                    'user__profile__avatar_url',
-                    'grade',
-                    'modified')\
-                    .order_by('-grade', 'modified')[:count]
+                if not exclude_users and not group_ids and not exclude_aggregate_users:
+                    data['queryset'] = StudentGradebookRank.get_leaderboard(course_key, count)
+                else:
+                    data['queryset'] = queryset.ranking()[:count]
                 # If a user_id value was provided, we need to provide some additional user-specific data to the caller
                 if user_id:
                     result = cls.get_user_position(
@@ -116,74 +866,702 @@ class StudentGradebook(models.Model):
                         user_id,
                         exclude_users=exclude_users,
                         group_ids=group_ids,
+                        exclude_aggregate_users=exclude_aggregate_users,
                     )
                     data.update(result)
 
         return data
 
     @classmethod
-    def get_user_position(cls, course_key, user_id, exclude_users=None, group_ids=None):
+    @cached_course_query('user_position')
+    def get_user_position(cls, course_key, user_id, exclude_users=None, group_ids=None, exclude_aggregate_users=False):
         """
         Helper method to return the user's position in the leaderboard for Proficiency
         """
         exclude_users = exclude_users or []
-        data = {'user_position': 0, 'user_grade': 0}
+        if not exclude_users and not group_ids and not exclude_aggregate_users:
+            return StudentGradebookRank.get_user_position(course_key, user_id)
+
+        queryset = cls.enrolled_entries(course_key).exclude(user__in=exclude_users)
+        if exclude_aggregate_users:
+            queryset = queryset.filter(exclude_from_aggregates=False)
+        queryset = cls.filter_members(queryset, group_ids=group_ids)
+
         user_grade = 0
-        users_above = 0
         user_time_scored = timezone.now()
-        try:
-            user_queryset = StudentGradebook.objects.get(course_id__exact=course_key, user__id=user_id)
-        except StudentGradebook.DoesNotExist:
-            user_queryset = None
+        user_entry = StudentGradebook.objects.filter(course_id__exact=course_key, user__id=user_id)\
+            .values_list('grade', 'created').first()
+        if user_entry:
+            user_grade, user_time_scored = user_entry
+        users_above = queryset.filter(counted_above(user_grade, user_time_scored)).exclude(user__id=user_id)
+        return {'user_position': users_above.count() + 1, 'user_grade': user_grade}
+
+    @classmethod
+    def generate_leaderboards(cls, course_keys, count=3, exclude_users=None, exclude_aggregate_users=False):
+        """
+        Batch variant of generate_leaderboard, without the user specific data and group filters,
+        for dashboards spanning several courses. Returns the generate_leaderboard data of every
+        course, keyed by course key, from a fixed number of grouped queries however many courses
+        are asked for: the course aggregates, the contributions of the excluded users and the
+        top entries of every course, read from the leaderboard rank table.
+        """
+        exclude_users = exclude_users or []
+        course_keys = list(course_keys)
+        course_keys_by_id = {unicode(course_key): course_key for course_key in course_keys}
+        course_aggregates = CourseGradebookAggregate.get_for_courses(course_keys)
 
-        if user_queryset:
-            user_grade = user_queryset.grade
-            user_time_scored = user_queryset.created
+        excluded_enrollments = {}
+        excluded_grades = {}
+        excluded_members = set()
+        if exclude_users or exclude_aggregate_users:
+            excluded_users = Q(user__id__in=exclude_users)
+            excluded_entries = Q(user__id__in=exclude_users)
+            if exclude_aggregate_users:
+                excluded_users |= Q(user__gradebookexclusion__course_id=F('course_id'))
+                excluded_entries |= Q(exclude_from_aggregates=True)
+                excluded_members = set(
+                    (unicode(course_id), user_id) for course_id, user_id in GradebookExclusion.objects.filter(
+                        course_id__in=course_keys
+                    ).values_list('course_id', 'user_id')
+                )
+            excluded_enrollments = {
+                unicode(course_id): users for course_id, users in CourseEnrollment.objects.filter(
+                    course_id__in=course_keys, is_active=True
+                ).filter(excluded_users).values_list('course_id').annotate(users=Count('user', distinct=True))
+                .order_by()
+            }
+            excluded_grades = {
+                unicode(aggregates['course_id']): aggregates for aggregates in cls.objects.filter(
+                    course_id__in=course_keys,
+                    is_active_enrolled=True
+                ).filter(excluded_entries).values('course_id')
+                .annotate(Sum('grade'), Max('grade'), Min('grade'), Count('user')).order_by()
+            }
 
-        queryset = StudentGradebook.objects.select_related('user').filter(
-            course_id__exact=course_key,
-            user__is_active=True,
-            user__courseenrollment__is_active=True,
-            user__courseenrollment__course_id__exact=course_key
-        ).exclude(
-            user__in=exclude_users
-        )
+        # Excluded users take at most as many of the top positions of a course as there are of them
+        members_per_course = Counter(course_id for course_id, __ in excluded_members)
+        excluded_positions = len(exclude_users) + max(members_per_course.values() or [0])
+        top_entries = {}
+        for entry in StudentGradebookRank.objects.filter(
+                course_id__in=course_keys,
+                rank__lte=count + excluded_positions
+        ).exclude(user__id__in=exclude_users).values('course_id', *LEADERBOARD_FIELDS).order_by('course_id', 'rank'):
+            course_id = unicode(entry.pop('course_id'))
+            course_entries = top_entries.setdefault(course_id, [])
+            if len(course_entries) < count and (course_id, entry['user__id']) not in excluded_members:
+                course_entries.append(entry)
 
-        if group_ids:
-            queryset = queryset.filter(user__groups__in=group_ids).distinct()
+        leaderboards = {}
+        extremes_to_recompute = []
+        for course_key in course_keys:
+            course_aggregate = course_aggregates[course_key]
+            total_user_count = course_aggregate.enrolled_count - excluded_enrollments.get(unicode(course_key), 0)
+            gradebook_user_count = course_aggregate.grade_count
+            grade_sum = course_aggregate.grade_sum
+            grade_max = course_aggregate.grade_max
+            grade_min = course_aggregate.grade_min
+            excluded = excluded_grades.get(unicode(course_key))
+            if excluded:
+                gradebook_user_count -= excluded['user__count']
+                grade_sum -= excluded['grade__sum']
+                if excluded['grade__max'] >= grade_max or excluded['grade__min'] <= grade_min:
+                    extremes_to_recompute.append(course_key)
 
-        users_above = queryset.filter(grade__gte=user_grade)\
-            .exclude(user__id=user_id)\
-            .exclude(grade=user_grade, modified__gt=user_time_scored)
+            data = {'course_avg': 0, 'course_max': 0, 'course_min': 0, 'course_count': 0, 'queryset': []}
+            if total_user_count and gradebook_user_count:
+                data['course_avg'] = float("{0:.3f}".format(grade_sum / total_user_count))
+                data['course_max'] = grade_max
+                data['course_min'] = grade_min
+                data['course_count'] = gradebook_user_count
+                data['queryset'] = top_entries.get(unicode(course_key), [])
+            leaderboards[course_key] = data
 
-        data['user_position'] = len(users_above) + 1
-        data['user_grade'] = user_grade
+        if extremes_to_recompute:
+            remaining_entries = cls.objects.filter(
+                course_id__in=extremes_to_recompute,
+                is_active_enrolled=True
+            ).exclude(user__id__in=exclude_users)
+            if exclude_aggregate_users:
+                remaining_entries = remaining_entries.filter(exclude_from_aggregates=False)
+            for extremes in remaining_entries.values('course_id').annotate(Max('grade'), Min('grade')).order_by():
+                data = leaderboards[course_keys_by_id[unicode(extremes['course_id'])]]
+                if data['course_count']:
+                    data['course_max'] = extremes['grade__max']
+                    data['course_min'] = extremes['grade__min']
+        return leaderboards
 
-        return data
+    @classmethod
+    def get_leaderboard_page(cls, course_key, cursor=None, count=100, group_ids=None, exclude_users=None,
+                             exclude_aggregate_users=False):
+        """
+        Returns a page of the full course leaderboard, in the generate_leaderboard order (grade
+        descending, then modified and user id ascending), along with the cursor of the next page:
+
+        data = {
+            'queryset': [
+                {'user__id': 123, 'user__username': 'testuser1', 'user__profile__title': 'Engineer', 'user__profile__avatar_url': 'http://gravatar.com/123/', 'grade': 0.92, 'modified': '2014-01-15 06:27:54'},
+                ...
+            ],
+            'next_cursor': 'WzAuOTIsIHsiZGF0ZXRpbWUiOiAiMjAxNC0wMS0xNVQwNjoyNzo1NCswMDowMCJ9LCAxMjNd',
+        }
+
+        next_cursor is None on the last page. Pages are selected with a (grade, modified, user id)
+        keyset condition instead of an offset, so every page costs the same however deep it is.
+        """
+        exclude_users = exclude_users or []
+        if not exclude_users and not group_ids and not exclude_aggregate_users:
+            queryset = StudentGradebookRank.objects.filter(course_id__exact=course_key)
+        else:
+            queryset = cls.enrolled_entries(course_key).exclude(user__id__in=exclude_users)
+            if exclude_aggregate_users:
+                queryset = queryset.filter(exclude_from_aggregates=False)
+            queryset = cls.filter_members(queryset, group_ids=group_ids)
+
+        if cursor:
+            grade, modified, user_id = decode_keyset_cursor(cursor)
+            queryset = queryset.filter(
+                Q(grade__lt=grade) |
+                Q(grade=grade, modified__gt=modified) |
+                Q(grade=grade, modified=modified, user__id__gt=user_id)
+            )
+
+        entries = list(queryset.ranking()[:count + 1])
+        next_cursor = None
+        if len(entries) > count:
+            entries = entries[:count]
+            next_cursor = encode_keyset_cursor(entries[-1]['grade'], entries[-1]['modified'], entries[-1]['user__id'])
+        return {'queryset': entries, 'next_cursor': next_cursor}
+
+    @classmethod
+    def iter_leaderboard(cls, course_key, page_size=100, group_ids=None, exclude_users=None,
+                         exclude_aggregate_users=False):
+        """
+        Iterates over the whole course leaderboard, page_size entries per query
+        """
+        cursor = None
+        while True:
+            page = cls.get_leaderboard_page(
+                course_key,
+                cursor=cursor,
+                count=page_size,
+                group_ids=group_ids,
+                exclude_users=exclude_users,
+                exclude_aggregate_users=exclude_aggregate_users
+            )
+            for entry in page['queryset']:
+                yield entry
+            cursor = page['next_cursor']
+            if cursor is None:
+                return
+
+    @classmethod
+    def get_num_users_completed(cls, course_key, exclude_users=None, org_ids=None, group_ids=None,
+                                exclude_aggregate_users=False):
+        """
+        Returns count of users those who completed given course. Without filters, the count is
+        read from the course aggregates.
+        """
+        if not exclude_users and not org_ids and not group_ids and not exclude_aggregate_users:
+            return CourseGradebookAggregate.get_for_course(course_key).completed_count
+
+        queryset = cls.enrolled_entries(course_key).filter(is_complete=True).exclude(user__id__in=exclude_users or [])
+        if exclude_aggregate_users:
+            queryset = queryset.filter(exclude_from_aggregates=False)
+        queryset = cls.filter_members(queryset, org_ids=org_ids, group_ids=group_ids)
+
+        return queryset.count()
 
     @classmethod
-    def get_num_users_completed(cls, course_key, exclude_users=None, org_ids=None, group_ids=None):
+    def get_num_users_completed_by_course(cls, course_keys, exclude_users=None, org_ids=None, group_ids=None,
+                                          exclude_aggregate_users=False):
         """
-        Returns count of users those who completed given course.
+        Batch variant of get_num_users_completed: returns the count of users who completed each
+        of the given courses, keyed by course key, with a single grouped query (or, without filters,
+        from the course aggregates)
         """
-        grade_complete_match_range = getattr(settings, 'GRADEBOOK_GRADE_COMPLETE_PROFORMA_MATCH_RANGE', 0.01)
+        course_keys = list(course_keys)
+        if not exclude_users and not org_ids and not group_ids and not exclude_aggregate_users:
+            return {
+                course_key: course_aggregate.completed_count
+                for course_key, course_aggregate in CourseGradebookAggregate.get_for_courses(course_keys).iteritems()
+            }
+
         queryset = cls.objects.filter(
-            course_id__exact=course_key,
-            user__is_active=True,
-            user__courseenrollment__is_active=True,
-            user__courseenrollment__course_id__exact=course_key,
-            proforma_grade__lte=F('grade') + grade_complete_match_range,
-            proforma_grade__gt=0
-        ).exclude(user__id__in=exclude_users)
-        if org_ids:
-            queryset = queryset.filter(user__organizations__in=org_ids)
-        if group_ids:
-            queryset = queryset.filter(user__groups__in=group_ids)
+            course_id__in=course_keys,
+            is_active_enrolled=True,
+            is_complete=True
+        ).exclude(user__id__in=exclude_users or [])
+        if exclude_aggregate_users:
+            queryset = queryset.filter(exclude_from_aggregates=False)
+        queryset = cls.filter_members(queryset, org_ids=org_ids, group_ids=group_ids)
+
+        completions = {
+            unicode(course_id): users for course_id, users in queryset
+            .values_list('course_id').annotate(users=Count('user')).order_by()
+        }
+        return {course_key: completions.get(unicode(course_key), 0) for course_key in course_keys}
+
+    @classmethod
+    def get_grade_histogram(cls, course_key, exclude_users=None, org_ids=None, group_ids=None,
+                            exclude_aggregate_users=False):
+        """
+        Returns the number of learners of the course per grade bucket, GRADEBOOK_GRADE_HISTOGRAM_BUCKETS
+        buckets from the lowest grades up. Without filters, the histogram is read from the course
+        aggregates; otherwise it is counted by a single aggregate query.
+        """
+        if not exclude_users and not org_ids and not group_ids and not exclude_aggregate_users:
+            return CourseGradebookAggregate.get_for_course(course_key).get_histogram()
+
+        queryset = cls.enrolled_entries(course_key).exclude(user__id__in=exclude_users or [])
+        if exclude_aggregate_users:
+            queryset = queryset.filter(exclude_from_aggregates=False)
+        queryset = cls.filter_members(queryset, org_ids=org_ids, group_ids=group_ids)
+        return queryset.grade_histogram(CourseGradebookAggregate.histogram_bucket_count())
+
+    @classmethod
+    def get_grade_percentile(cls, course_key, percentile, **filters):
+        """
+        Returns the approximate grade below which the given percentage of the course learners
+        fall, interpolated from the grade histogram (see get_grade_histogram for the filters),
+        or None when the course has no graded learner
+        """
+        return histogram_percentile(cls.get_grade_histogram(course_key, **filters), percentile)
+
+    @classmethod
+    def get_median_grade(cls, course_key, **filters):
+        """
+        Returns the approximate median grade of the course learners (see get_grade_percentile)
+        """
+        return cls.get_grade_percentile(course_key, 50, **filters)
+
+
+class StudentGradebookRankQuerySet(models.QuerySet):
+    """
+    QuerySet of the leaderboard rank entries
+    """
+
+    def ranking(self):
+        """
+        Returns the leaderboard rows of the rank entries, in the StudentGradebookQuerySet.ranking format
+        """
+        return self.values(*LEADERBOARD_FIELDS).order_by('rank')
+
+
+class StudentGradebookRank(models.Model):
+    """
+    Denormalized leaderboard of a course: the position of every active, enrolled user holding a
+    gradebook entry, ordered by grade (descending), then modified and user id (ascending).
+    Positions are shifted incrementally as gradebook entries are saved, so the unfiltered top-N
+    and user position lookups become index reads instead of joins over the whole course.
+    """
+    user = models.ForeignKey(User, db_index=True)
+    course_id = CourseKeyField(max_length=255, blank=True)
+    grade = models.FloatField()
+    modified = models.DateTimeField()
+    rank = models.PositiveIntegerField()
+
+    objects = models.Manager.from_queryset(StudentGradebookRankQuerySet)()
+
+    class Meta:
+        """
+        Meta information for this Django model
+        """
+        unique_together = (('user', 'course_id'),)
+        index_together = (('course_id', 'rank'), ('course_id', 'grade', 'modified'))
+
+    @classmethod
+    def _ranked_above(cls, course_key, grade, modified, user_id):
+        """
+        Returns the rank entries ordered before the given grade, modified and user id
+        """
+        return cls.objects.filter(course_id__exact=course_key).filter(ranked_before(grade, modified, user_id))
+
+    @classmethod
+    def _remove(cls, rank_entry):
+        """
+        Deletes the rank entry and closes the gap it leaves behind
+        """
+        rank_entry.delete()
+        cls.objects.filter(course_id__exact=rank_entry.course_id, rank__gt=rank_entry.rank).update(rank=F('rank') - 1)
+
+    @classmethod
+    def update_entry(cls, gradebook_entry):
+        """
+        Moves the gradebook entry's user to its current position in the course leaderboard, or
+        removes it when the user is no longer active or enrolled in the course. Only the entries
+        between the old and the new position are shifted. Updates of the same course are
+        serialized on its aggregate row, so that concurrent saves can't both count and shift
+        against the same leaderboard.
+        """
+        course_key = gradebook_entry.course_id
+        user_id = gradebook_entry.user_id
+        with transaction.atomic():
+            CourseGradebookAggregate.lock_course(course_key)
+            rank_entry = cls.objects.filter(course_id__exact=course_key, user__id=user_id).first()
+
+            is_ranked = StudentGradebook.objects.filter(id=gradebook_entry.id, is_active_enrolled=True).exists()
+            if not is_ranked:
+                if rank_entry is not None:
+                    cls._remove(rank_entry)
+                return
+
+            rank = cls._ranked_above(
+                course_key,
+                gradebook_entry.grade,
+                gradebook_entry.modified,
+                user_id
+            ).exclude(user__id=user_id).count() + 1
+            ranks = cls.objects.filter(course_id__exact=course_key)
+            if rank_entry is None:
+                ranks.filter(rank__gte=rank).update(rank=F('rank') + 1)
+                cls.objects.create(
+                    user_id=user_id,
+                    course_id=course_key,
+                    grade=gradebook_entry.grade,
+                    modified=gradebook_entry.modified,
+                    rank=rank
+                )
+                return
+
+            if rank < rank_entry.rank:
+                ranks.filter(rank__gte=rank, rank__lt=rank_entry.rank).update(rank=F('rank') + 1)
+            elif rank > rank_entry.rank:
+                ranks.filter(rank__gt=rank_entry.rank, rank__lte=rank).update(rank=F('rank') - 1)
+            cls.objects.filter(id=rank_entry.id).update(
+                grade=gradebook_entry.grade,
+                modified=gradebook_entry.modified,
+                rank=rank
+            )
+
+    @classmethod
+    def remove_user(cls, course_key, user_id):
+        """
+        Drops the user from the course leaderboard, if present
+        """
+        with transaction.atomic():
+            CourseGradebookAggregate.lock_course(course_key)
+            for rank_entry in cls.objects.filter(course_id__exact=course_key, user__id=user_id):
+                cls._remove(rank_entry)
+
+    @classmethod
+    def rebuild(cls, course_key):
+        """
+        Recomputes the whole course leaderboard from the gradebook entries
+        """
+        gradebook_entries = StudentGradebook.enrolled_entries(course_key)\
+            .order_by('-grade', 'modified', 'user__id').values_list('user__id', 'grade', 'modified')
+        with transaction.atomic():
+            CourseGradebookAggregate.lock_course(course_key)
+            cls.objects.filter(course_id__exact=course_key).delete()
+            cls.objects.bulk_create([
+                cls(user_id=user_id, course_id=course_key, grade=grade, modified=modified, rank=rank)
+                for rank, (user_id, grade, modified) in enumerate(gradebook_entries, start=1)
+            ], batch_size=1000)
+
+    @classmethod
+    def get_leaderboard(cls, course_key, count):
+        """
+        Returns the Top N users of the course, in the format used by StudentGradebook.generate_leaderboard
+        """
+        return cls.objects.filter(course_id__exact=course_key).ranking()[:count]
+
+    @classmethod
+    def get_user_position(cls, course_key, user_id):
+        """
+        Returns the user's position in the course leaderboard, in the format used by
+        StudentGradebook.get_user_position. Positions count the ranked users above the user's
+        entry (see counted_above), off the (course_id, grade, modified) index, rather than reading
+        the stored rank, which breaks ties by modified time and user id instead.
+        """
+        user_grade = 0
+        user_time_scored = timezone.now()
+        gradebook_entry = StudentGradebook.objects.filter(course_id__exact=course_key, user__id=user_id)\
+            .values_list('grade', 'created').first()
+        if gradebook_entry:
+            user_grade, user_time_scored = gradebook_entry
+        users_above = cls.objects.filter(course_id__exact=course_key)\
+            .filter(counted_above(user_grade, user_time_scored)).exclude(user__id=user_id)
+        return {'user_position': users_above.count() + 1, 'user_grade': user_grade}
+
+    @staticmethod
+    def update_rank(sender, instance, **kwargs):  # pylint: disable=unused-argument
+        """
+        Event hook for keeping the course leaderboard up to date
+        """
+        StudentGradebookRank.update_entry(instance)
+
+
+class CourseGradebookAggregate(models.Model):
+    """
+    Running grade aggregates (sum, count, min, max and histogram) and completion count over the
+    gradebook entries of the active, enrolled users of a course, along with the number of those enrolled users. Kept
+    up to date as gradebook entries are saved and enrollments change, so course averages and grade distributions can
+    be read without scanning the course. The reconcile_gradebook_aggregates job recomputes them from scratch.
+    """
+    course_id = CourseKeyField(unique=True, max_length=255)
+    grade_sum = models.FloatField(default=0)
+    grade_count = models.PositiveIntegerField(default=0)
+    grade_min = models.FloatField(null=True)
+    grade_max = models.FloatField(null=True)
+    enrolled_count = models.PositiveIntegerField(default=0)
+    completed_count = models.PositiveIntegerField(default=0)
+    # JSON list of the number of entries per grade bucket, see histogram_bucket_count()
+    grade_histogram = models.TextField(blank=True)
+    modified = AutoLastModifiedField(_('modified'))
+
+    @staticmethod
+    def histogram_bucket_count():
+        """
+        Returns the number of equal width grade buckets of the course histograms
+        """
+        return getattr(settings, 'GRADEBOOK_GRADE_HISTOGRAM_BUCKETS', 20)
+
+    def get_histogram(self):
+        """
+        Returns the stored grade histogram as a list of counts, or None when it is missing or
+        was counted with another number of buckets
+        """
+        if not self.grade_histogram:
+            return None
+        histogram = json.loads(self.grade_histogram)
+        return histogram if len(histogram) == self.histogram_bucket_count() else None
+
+    @classmethod
+    def refresh(cls, course_key):
+        """
+        Recomputes the course aggregates from the gradebook entries and enrollments
+        """
+        aggregates = StudentGradebook.enrolled_entries(course_key)\
+            .aggregate(Sum('grade'), Max('grade'), Min('grade'), Count('user'))
+        course_aggregate, __ = cls.objects.update_or_create(
+            course_id=course_key,
+            defaults={
+                'grade_sum': aggregates['grade__sum'] or 0,
+                'grade_count': aggregates['user__count'],
+                'grade_min': aggregates['grade__min'],
+                'grade_max': aggregates['grade__max'],
+                'enrolled_count': CourseEnrollment.objects.users_enrolled_in(course_key).count(),
+                'completed_count': StudentGradebook.enrolled_entries(course_key).filter(is_complete=True).count(),
+                'grade_histogram': json.dumps(
+                    StudentGradebook.enrolled_entries(course_key).grade_histogram(cls.histogram_bucket_count())
+                ),
+            }
+        )
+        return course_aggregate
+
+    @classmethod
+    def lock_course(cls, course_key):
+        """
+        Locks the aggregate row of the course until the end of the current transaction, computing
+        the aggregates first if needed. Serializes the leaderboard updates of the course.
+        """
+        if not cls.objects.select_for_update().filter(course_id=course_key).values_list('id', flat=True):
+            cls.refresh(course_key)
+            list(cls.objects.select_for_update().filter(course_id=course_key).values_list('id', flat=True))
+
+    @classmethod
+    def refresh_histogram(cls, course_key):
+        """
+        Recounts the grade histogram of the course only, e.g. after GRADEBOOK_GRADE_HISTOGRAM_BUCKETS
+        changed. Returns the histogram.
+        """
+        histogram = StudentGradebook.enrolled_entries(course_key).grade_histogram(cls.histogram_bucket_count())
+        if not cls.objects.filter(course_id=course_key).update(grade_histogram=json.dumps(histogram)):
+            cls.refresh(course_key)
+        return histogram
+
+    @classmethod
+    def get_for_course(cls, course_key):
+        """
+        Returns the course aggregates, computing them on first use (or when their histogram is
+        missing)
+        """
+        try:
+            course_aggregate = cls.objects.get(course_id=course_key)
+        except cls.DoesNotExist:
+            return cls.refresh(course_key)
+        if course_aggregate.get_histogram() is None:
+            course_aggregate.grade_histogram = json.dumps(cls.refresh_histogram(course_key))
+        return course_aggregate
+
+    @classmethod
+    def get_for_courses(cls, course_keys):
+        """
+        Returns the aggregates of several courses, keyed by course key, with a single query
+        (plus one refresh per course never aggregated before)
+        """
+        aggregates = {
+            unicode(course_aggregate.course_id): course_aggregate
+            for course_aggregate in cls.objects.filter(course_id__in=course_keys)
+        }
+        return {
+            course_key: aggregates.get(unicode(course_key)) or cls.refresh(course_key)
+            for course_key in course_keys
+        }
+
+    @classmethod
+    def apply_enrollment_change(cls, course_key, enrolled_delta, gradebook_entry=None):
+        """
+        Folds the enrollment change of a single user into the course aggregates: enrolled_delta is
+        added to the enrolled count and the user's gradebook entry, when given, is counted in or
+        out of the grade aggregates following its is_active_enrolled flag
+        """
+        with transaction.atomic():
+            try:
+                course_aggregate = cls.objects.select_for_update().get(course_id=course_key)
+            except cls.DoesNotExist:
+                # The first computation already accounts for this change
+                cls.refresh(course_key)
+                return
+
+            course_aggregate.enrolled_count = max(course_aggregate.enrolled_count + enrolled_delta, 0)
+            if gradebook_entry is not None:
+                grade = gradebook_entry.grade
+                delta = 1 if gradebook_entry.is_active_enrolled else -1
+                course_aggregate.grade_sum += delta * grade
+                course_aggregate.grade_count = max(course_aggregate.grade_count + delta, 0)
+                course_aggregate.completed_count = max(
+                    course_aggregate.completed_count + delta * int(gradebook_entry.is_complete), 0
+                )
+                histogram = course_aggregate.get_histogram()
+                if histogram is None:
+                    histogram = StudentGradebook.enrolled_entries(course_key)\
+                        .grade_histogram(cls.histogram_bucket_count())
+                else:
+                    bucket = grade_bucket(grade, len(histogram))
+                    histogram[bucket] = max(histogram[bucket] + delta, 0)
+                course_aggregate.grade_histogram = json.dumps(histogram)
+
+                if delta > 0:
+                    if course_aggregate.grade_max is None or grade > course_aggregate.grade_max:
+                        course_aggregate.grade_max = grade
+                    if course_aggregate.grade_min is None or grade < course_aggregate.grade_min:
+                        course_aggregate.grade_min = grade
+                elif grade in (course_aggregate.grade_max, course_aggregate.grade_min):
+                    extremes = StudentGradebook.enrolled_entries(course_key).aggregate(Max('grade'), Min('grade'))
+                    course_aggregate.grade_max = extremes['grade__max']
+                    course_aggregate.grade_min = extremes['grade__min']
+            course_aggregate.save()
+
+    @classmethod
+    def apply_grade_change(cls, gradebook_entry, previous_grade, previous_is_complete=False):
+        """
+        Folds a saved gradebook entry into the course aggregates. previous_grade and
+        previous_is_complete are the grade and completion stored before the save, or None
+        and False for a new entry.
+        """
+        course_key = gradebook_entry.course_id
+        is_counted = StudentGradebook.objects.filter(id=gradebook_entry.id, is_active_enrolled=True).exists()
+        if not is_counted:
+            return
+
+        grade = gradebook_entry.grade
+        with transaction.atomic():
+            try:
+                course_aggregate = cls.objects.select_for_update().get(course_id=course_key)
+            except cls.DoesNotExist:
+                # The first computation already accounts for this entry
+                cls.refresh(course_key)
+                return
+
+            if previous_grade is None:
+                course_aggregate.grade_sum += grade
+                course_aggregate.grade_count += 1
+            else:
+                course_aggregate.grade_sum += grade - previous_grade
+            course_aggregate.completed_count += int(gradebook_entry.is_complete) - int(previous_is_complete)
+
+            histogram = course_aggregate.get_histogram()
+            if histogram is None:
+                # Counted from scratch, this entry included
+                histogram = StudentGradebook.enrolled_entries(course_key).grade_histogram(cls.histogram_bucket_count())
+            else:
+                bucket_count = len(histogram)
+                if previous_grade is not None:
+                    previous_bucket = grade_bucket(previous_grade, bucket_count)
+                    histogram[previous_bucket] = max(histogram[previous_bucket] - 1, 0)
+                histogram[grade_bucket(grade, bucket_count)] += 1
+            course_aggregate.grade_histogram = json.dumps(histogram)
+
+            extremes_outdated = previous_grade is not None and (
+                (previous_grade == course_aggregate.grade_max and grade < previous_grade) or
+                (previous_grade == course_aggregate.grade_min and grade > previous_grade)
+            )
+            if extremes_outdated:
+                extremes = StudentGradebook.enrolled_entries(course_key).aggregate(Max('grade'), Min('grade'))
+                course_aggregate.grade_max = extremes['grade__max']
+                course_aggregate.grade_min = extremes['grade__min']
+            else:
+                if course_aggregate.grade_max is None or grade > course_aggregate.grade_max:
+                    course_aggregate.grade_max = grade
+                if course_aggregate.grade_min is None or grade < course_aggregate.grade_min:
+                    course_aggregate.grade_min = grade
+            course_aggregate.save()
+
+    @receiver(post_save, sender=StudentGradebook)
+    def update_aggregate(sender, instance, created, **kwargs):  # pylint: disable=no-self-argument, unused-argument
+        """
+        Event hook for keeping the course aggregates up to date
+        """
+        previous_grade = instance._stored_grade  # pylint: disable=protected-access
+        previous_is_complete = instance._stored_is_complete  # pylint: disable=protected-access
+        if created:
+            CourseGradebookAggregate.apply_grade_change(instance, None)
+        elif previous_grade is None or previous_is_complete is None:
+            # The stored values are unknown, so the delta can't be applied
+            CourseGradebookAggregate.refresh(instance.course_id)
+        else:
+            CourseGradebookAggregate.apply_grade_change(instance, previous_grade, previous_is_complete)
 
-        return queryset.distinct().count()
 
+# Connected after CourseGradebookAggregate.update_aggregate: the leaderboard updates lock the course
+# aggregate row, which then already exists and accounts for the saved entry
+post_save.connect(StudentGradebookRank.update_rank, sender=StudentGradebook)
 
-class StudentGradebookHistory(TimeStampedModel):
+
+class GradebookExclusion(models.Model):
+    """
+    Per-course membership of the users left out of the leaderboards and aggregates when
+    exclude_aggregate_users is requested, i.e. the users of get_aggregate_exclusion_user_ids
+    (course staff, observers, ...). Kept in sync with course access role changes and mirrored
+    onto StudentGradebook.exclude_from_aggregates.
+    """
+    user = models.ForeignKey(User)
+    course_id = CourseKeyField(max_length=255, db_index=True)
+
+    class Meta:
+        """
+        Meta information for this Django model
+        """
+        unique_together = (('course_id', 'user'),)
+
+    @classmethod
+    def sync_course(cls, course_key):
+        """
+        Brings the course exclusion membership, and the flags of the course gradebook entries,
+        in line with get_aggregate_exclusion_user_ids. Returns whether anything changed.
+        """
+        excluded_user_ids = set(get_aggregate_exclusion_user_ids(course_key))
+        member_ids = set(cls.objects.filter(course_id=course_key).values_list('user_id', flat=True))
+        added_ids = excluded_user_ids - member_ids
+        removed_ids = member_ids - excluded_user_ids
+        if not added_ids and not removed_ids:
+            return False
+
+        with transaction.atomic():
+            if removed_ids:
+                cls.objects.filter(course_id=course_key, user__in=removed_ids).delete()
+                StudentGradebook.objects.filter(course_id=course_key, user__in=removed_ids)\
+                    .update(exclude_from_aggregates=False)
+            if added_ids:
+                cls.objects.bulk_create([cls(course_id=course_key, user_id=user_id) for user_id in added_ids])
+                StudentGradebook.objects.filter(course_id=course_key, user__in=added_ids)\
+                    .update(exclude_from_aggregates=True)
+        invalidate_course_cache(course_key)
+        return True
+
+
+class StudentGradebookHistory(GradebookBlobsMixin, TimeStampedModel):
     """
     A running audit trail for the StudentGradebook model.  Listens for
     post_save events and creates/stores copies of gradebook entries.
@@ -195,38 +1573,310 @@ class StudentGradebookHistory(TimeStampedModel):
     progress_summary = models.TextField(blank=True)
     grade_summary = models.TextField(blank=True)
     grading_policy = models.TextField(blank=True)
+    progress_summary_hash = models.CharField(max_length=40, blank=True)
+    grade_summary_hash = models.CharField(max_length=40, blank=True)
+    grading_policy_hash = models.CharField(max_length=40, blank=True)
+
+    objects = models.Manager.from_queryset(GradebookBlobsQuerySet)()
+    deferred = DeferredBlobsManager.from_queryset(GradebookBlobsQuerySet)()
+
+    class Meta:
+        """
+        Meta information for this Django model
+        """
+        index_together = (('user', 'course_id', 'created'),)
+
+    @classmethod
+    def from_gradebook_entry(cls, gradebook_entry):
+        """
+        Returns an unsaved history entry copying the given gradebook entry
+        """
+        return cls(
+            user_id=gradebook_entry.user_id,
+            course_id=gradebook_entry.course_id,
+            grade=gradebook_entry.grade,
+            proforma_grade=gradebook_entry.proforma_grade,
+            progress_summary=gradebook_entry.progress_summary,
+            grade_summary=gradebook_entry.grade_summary,
+            grading_policy=gradebook_entry.grading_policy,
+            progress_summary_hash=gradebook_entry.progress_summary_hash,
+            grade_summary_hash=gradebook_entry.grade_summary_hash,
+            grading_policy_hash=gradebook_entry.grading_policy_hash
+        )
+
+    @classmethod
+    def bulk_create_entries(cls, entries):
+        """
+        Inserts the given unsaved history entries, and their grade snapshots, with one query per
+        table. The snapshots take the created time of their history entry.
+        """
+        if not entries:
+            return
+        for entry in entries:
+            for name in cls.BLOB_FIELDS:
+                setattr(entry, '{}_hash'.format(name), blob_hash(getattr(entry, name)))
+        with transaction.atomic():
+            offloaded_blobs = cls._offload_blobs(entries)
+            try:
+                cls.objects.bulk_create(entries)
+            finally:
+                cls._restore_blobs(offloaded_blobs)
+            StudentGradebookSnapshot.objects.bulk_create([
+                StudentGradebookSnapshot(
+                    user_id=entry.user_id,
+                    course_id=entry.course_id,
+                    grade=entry.grade,
+                    proforma_grade=entry.proforma_grade,
+                    created=entry.created
+                )
+                for entry in entries
+            ])
+
+    @classmethod
+    def _matches_latest(cls, gradebook_entry):
+        """
+        Returns whether the latest history entry of the user and course already holds the
+        gradebook entry's values. Only the latest row is read, and its blobs only when it
+        predates the stored content hashes.
+        """
+        hash_fields = ['{}_hash'.format(name) for name in StudentGradebook.BLOB_FIELDS]
+        latest_history_entry = cls.objects.filter(
+            user__id=gradebook_entry.user_id,
+            course_id=gradebook_entry.course_id
+        ).order_by('-created', '-id').values('id', 'grade', 'proforma_grade', *hash_fields).first()
+
+        if latest_history_entry is None:
+            return False
+        if (
+            latest_history_entry['grade'] != gradebook_entry.grade or
+            latest_history_entry['proforma_grade'] != gradebook_entry.proforma_grade
+        ):
+            return False
+        if all(latest_history_entry[name] for name in hash_fields):
+            return all(latest_history_entry[name] == getattr(gradebook_entry, name) for name in hash_fields)
+
+        blobs = cls.objects.filter(id=latest_history_entry['id']).values(*StudentGradebook.BLOB_FIELDS).get()
+        return all(blobs[name] == getattr(gradebook_entry, name) for name in StudentGradebook.BLOB_FIELDS)
 
     @receiver(post_save, sender=StudentGradebook)
     def save_history(sender, instance, **kwargs):  # pylint: disable=no-self-argument, unused-argument
         """
-        Event hook for creating gradebook entry copies
-        """
-        history_entries = StudentGradebookHistory.objects.filter(user=instance.user, course_id=instance.course_id)
-        latest_history_entry = None
-        if len(history_entries):
-            latest_history_entry = history_entries[0]
-
-        create_history_entry = False
-        if latest_history_entry is not None:
-            if (
-                latest_history_entry.grade != instance.grade or
-                latest_history_entry.proforma_grade != instance.proforma_grade or
-                latest_history_entry.progress_summary != instance.progress_summary or
-                latest_history_entry.grade_summary != instance.grade_summary or
-                latest_history_entry.grading_policy != instance.grading_policy
-            ):
-                create_history_entry = True
-        else:
-            create_history_entry = True
-
-        if create_history_entry:
-            new_history_entry = StudentGradebookHistory(
-                user=instance.user,
-                course_id=instance.course_id,
-                grade=instance.grade,
-                proforma_grade=instance.proforma_grade,
-                progress_summary=instance.progress_summary,
-                grade_summary=instance.grade_summary,
-                grading_policy=instance.grading_policy
+        Event hook for creating gradebook entry copies, and their grade snapshots
+        """
+        if not StudentGradebookHistory._matches_latest(instance):  # pylint: disable=protected-access
+            StudentGradebookHistory.from_gradebook_entry(instance).save()
+            StudentGradebookSnapshot.from_gradebook_entry(instance).save()
+
+
+class StudentGradebookSnapshot(models.Model):
+    """
+    Narrow time series of the grades recorded in StudentGradebookHistory, without the serialized
+    blobs, so that grade distributions and learner trajectories are read from indexed rows of a
+    few dozen bytes. A snapshot is written along with every history entry.
+    """
+    user = models.ForeignKey(User)
+    course_id = CourseKeyField(max_length=255)
+    grade = models.FloatField()
+    proforma_grade = models.FloatField()
+    created = AutoCreatedField(_('created'))
+
+    class Meta:
+        """
+        Meta information for this Django model
+        """
+        index_together = (('course_id', 'created'), ('user', 'course_id', 'created'))
+
+    @classmethod
+    def from_gradebook_entry(cls, gradebook_entry):
+        """
+        Returns an unsaved snapshot of the given gradebook entry
+        """
+        return cls(
+            user_id=gradebook_entry.user_id,
+            course_id=gradebook_entry.course_id,
+            grade=gradebook_entry.grade,
+            proforma_grade=gradebook_entry.proforma_grade
+        )
+
+    @classmethod
+    def get_course_grades(cls, course_key, as_of):
+        """
+        Returns the latest (grade, proforma_grade) of every learner of the course recorded up to
+        the given time, keyed by user id. The snapshot with the greatest created time of each
+        learner, ties broken by id, is selected in SQL by probing the (user, course_id, created)
+        index, so that only one row per learner is read back. Ids alone don't order snapshots:
+        backfilled and imported ones are older than live snapshots with smaller ids.
+        """
+        table = connection.ops.quote_name(cls._meta.db_table)
+        later_snapshot = (
+            'NOT EXISTS (SELECT 1 FROM {table} later WHERE later.user_id = {table}.user_id'
+            ' AND later.course_id = {table}.course_id AND later.created <= %s'
+            ' AND (later.created > {table}.created OR (later.created = {table}.created AND later.id > {table}.id)))'
+        ).format(table=table)
+        snapshots = cls.objects.filter(course_id__exact=course_key, created__lte=as_of).extra(
+            where=[later_snapshot], params=[cls._meta.get_field('created').get_db_prep_value(as_of, connection)]
+        ).values_list('user__id', 'grade', 'proforma_grade')
+        return {user_id: (grade, proforma_grade) for user_id, grade, proforma_grade in snapshots.iterator()}
+
+    @classmethod
+    def get_grade_distribution(cls, course_key, as_of, bucket_count=10):
+        """
+        Returns the number of learners of the course per grade bucket as of the given time: a
+        list of bucket_count counts, the first one for the grades in [0, 1 / bucket_count)
+        """
+        distribution = [0] * bucket_count
+        for grade, __ in cls.get_course_grades(course_key, as_of).itervalues():
+            distribution[grade_bucket(grade, bucket_count)] += 1
+        return distribution
+
+    @classmethod
+    def get_learner_trajectory(cls, course_key, user_id, start=None, end=None):
+        """
+        Returns the grades recorded for the learner in the course, oldest first, as a list of
+        {'created', 'grade', 'proforma_grade'} dicts, optionally limited to a time range
+        """
+        snapshots = cls.objects.filter(user__id=user_id, course_id__exact=course_key)
+        if start is not None:
+            snapshots = snapshots.filter(created__gte=start)
+        if end is not None:
+            snapshots = snapshots.filter(created__lte=end)
+        return list(snapshots.order_by('created', 'id').values('created', 'grade', 'proforma_grade'))
+
+
+class StudentGradebookChange(models.Model):
+    """
+    Append-only change log of the gradebook entries, for downstream systems to sync from. Every
+    write of a gradebook entry appends a row, whose id is its sequence number: read the changes
+    following the last sequence number processed with get_changes() instead of polling the
+    gradebook on its modified time, which can't tell apart entries modified at the same instant.
+    """
+    user = models.ForeignKey(User)
+    course_id = CourseKeyField(max_length=255)
+    grade = models.FloatField()
+    proforma_grade = models.FloatField()
+    is_complete = models.BooleanField(default=False)
+    # Set on the last change of an entry removed along with its course
+    is_deleted = models.BooleanField(default=False)
+    created = AutoCreatedField(_('created'), db_index=True)
+
+    class Meta:
+        """
+        Meta information for this Django model
+        """
+        index_together = (('course_id', 'id'),)
+
+    FEED_FIELDS = ('id', 'user_id', 'course_id', 'grade', 'proforma_grade', 'is_complete', 'is_deleted', 'created')
+
+    @classmethod
+    def from_gradebook_entry(cls, gradebook_entry, is_deleted=False):
+        """
+        Returns an unsaved change recording the current values of the given gradebook entry
+        """
+        return cls(
+            user_id=gradebook_entry.user_id,
+            course_id=gradebook_entry.course_id,
+            grade=gradebook_entry.grade,
+            proforma_grade=gradebook_entry.proforma_grade,
+            is_complete=gradebook_entry.is_complete,
+            is_deleted=is_deleted
+        )
+
+    @classmethod
+    def record_many(cls, gradebook_entries):
+        """
+        Appends the changes of the given gradebook entries with a single INSERT
+        """
+        cls.objects.bulk_create([cls.from_gradebook_entry(entry) for entry in gradebook_entries])
+
+    @classmethod
+    def record_course_deletion(cls, course_key):
+        """
+        Appends a deletion change for every gradebook entry of the course, before they are removed
+        """
+        cls.objects.bulk_create([
+            cls(
+                user_id=user_id,
+                course_id=course_key,
+                grade=grade,
+                proforma_grade=proforma_grade,
+                is_complete=is_complete,
+                is_deleted=True
+            )
+            for user_id, grade, proforma_grade, is_complete in StudentGradebook.objects.filter(
+                course_id=course_key
+            ).values_list('user__id', 'grade', 'proforma_grade', 'is_complete').iterator()
+        ])
+
+    @classmethod
+    def get_changes(cls, after=0, count=1000, course_key=None):
+        """
+        Returns up to count changes following the given sequence number, oldest first, as dicts
+        of FEED_FIELDS where 'id' is the sequence number to pass as after for the next batch.
+        Changes younger than GRADEBOOK_CHANGE_FEED_SETTLE_SECONDS are held back, so that a change
+        committed after one with a greater sequence number isn't skipped by the reader.
+        """
+        changes = cls.objects.filter(id__gt=after)
+        if course_key is not None:
+            changes = changes.filter(course_id__exact=course_key)
+        settle_seconds = getattr(settings, 'GRADEBOOK_CHANGE_FEED_SETTLE_SECONDS', 5)
+        if settle_seconds:
+            changes = changes.filter(created__lte=timezone.now() - timedelta(seconds=settle_seconds))
+        return list(changes.order_by('id').values(*cls.FEED_FIELDS)[:count])
+
+    @classmethod
+    def compact(cls, before, batch_size=1000):
+        """
+        Removes the changes created before the given time that are superseded by a later change
+        of the same user and course, batch_size rows per query, and returns how many were removed.
+        The latest change of every entry is kept, so a reader starting over from sequence number 0
+        still ends up with the current grades.
+        """
+        removed = 0
+        last_id = 0
+        while True:
+            changes = list(
+                cls.objects.filter(id__gt=last_id, created__lt=before).order_by('id')
+                .values_list('id', 'user', 'course_id')[:batch_size]
+            )
+            if not changes:
+                break
+            last_id = changes[-1][0]
+            latest_changes = cls.objects.filter(
+                user__in=set(user_id for __, user_id, __ in changes),
+                course_id__in=set(course_id for __, __, course_id in changes)
+            ).values('user', 'course_id').annotate(latest_id=Max('id'))
+            latest_ids = dict(
+                ((change['user'], unicode(change['course_id'])), change['latest_id']) for change in latest_changes
+            )
+            superseded_ids = [
+                change_id for change_id, user_id, course_id in changes
+                if latest_ids[(user_id, unicode(course_id))] != change_id
+            ]
+            if superseded_ids:
+                cls.objects.filter(id__in=superseded_ids).delete()
+            removed += len(superseded_ids)
+        return removed
+
+    @classmethod
+    def expire(cls, before, batch_size=1000):
+        """
+        Removes all the changes created before the given time, batch_size rows per query, and
+        returns how many were removed. Readers behind the oldest remaining change must resync.
+        """
+        removed = 0
+        while True:
+            expired_ids = list(
+                cls.objects.filter(created__lt=before).order_by('id').values_list('id', flat=True)[:batch_size]
             )
-            new_history_entry.save()
+            if not expired_ids:
+                break
+            cls.objects.filter(id__in=expired_ids).delete()
+            removed += len(expired_ids)
+        return removed
+
+    @receiver(post_save, sender=StudentGradebook)
+    def record_change(sender, instance, **kwargs):  # pylint: disable=no-self-argument, unused-argument
+        """
+        Event hook appending the change of a saved gradebook entry
+        """
+        StudentGradebookChange.from_gradebook_entry(instance).save()
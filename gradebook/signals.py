@@ -7,14 +7,25 @@ import sys
 from django.dispatch import receiver
 from django.conf import settings
 from django.db import transaction
-from django.db.models.signals import post_save, pre_save
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save, pre_save
 
 from courseware.signals import score_changed
 from util.signals import course_deleted
+from student.models import CourseAccessRole, CourseEnrollment
 from student.roles import get_aggregate_exclusion_user_ids
 
-from gradebook.models import StudentGradebook, StudentGradebookHistory
-from gradebook.tasks import update_user_gradebook
+from gradebook.caching import invalidate_course_cache
+from gradebook.models import (
+    CourseGradebookAggregate,
+    GradebookExclusion,
+    StudentGradebook,
+    StudentGradebookChange,
+    StudentGradebookHistory,
+    StudentGradebookRank,
+    StudentGradebookSnapshot,
+)
+from gradebook.tasks import schedule_user_gradebook_update
 
 
 log = logging.getLogger(__name__)
@@ -28,7 +39,8 @@ def on_score_changed(sender, **kwargs):
     """
     user_id = kwargs['user'].id
     course_key = unicode(kwargs['course_key'])
-    update_user_gradebook.delay(course_key, user_id)
+    usage_id = kwargs.get('usage_id')
+    schedule_user_gradebook_update(course_key, user_id, unicode(usage_id) if usage_id else None)
 
 
 @receiver(course_deleted)
@@ -38,8 +50,114 @@ def on_course_deleted(sender, **kwargs):  # pylint: disable=W0613
     removes model entries for the specified course
     """
     course_key = kwargs['course_key']
+    StudentGradebookChange.record_course_deletion(course_key)
     StudentGradebook.objects.filter(course_id=course_key).delete()
     StudentGradebookHistory.objects.filter(course_id=course_key).delete()
+    StudentGradebookSnapshot.objects.filter(course_id=course_key).delete()
+    StudentGradebookRank.objects.filter(course_id=course_key).delete()
+    CourseGradebookAggregate.objects.filter(course_id=course_key).delete()
+    GradebookExclusion.objects.filter(course_id=course_key).delete()
+    invalidate_course_cache(course_key)
+
+
+@receiver(post_save, sender=StudentGradebook)
+def on_gradebook_change(sender, instance, **kwargs):  # pylint: disable=W0613
+    """
+    Listens for gradebook entry changes and invalidates the cached queries of the course
+    """
+    invalidate_course_cache(instance.course_id)
+
+
+@receiver(pre_save, sender=CourseEnrollment)
+def on_course_enrollment_pre_save(sender, instance, **kwargs):  # pylint: disable=W0613
+    """
+    Remembers whether the enrollment was active before the save, for the enrolled count delta
+    """
+    instance._gradebook_was_active = bool(  # pylint: disable=protected-access
+        instance.pk and CourseEnrollment.objects.filter(id=instance.pk, is_active=True).exists()
+    )
+
+
+@receiver(post_save, sender=CourseEnrollment)
+def on_course_enrollment_change(sender, instance, **kwargs):  # pylint: disable=W0613
+    """
+    Listens for enrollment changes and moves the user in or out of the course leaderboard
+    and aggregates. Only this user's share of the aggregates is applied; the periodic
+    reconcile_gradebook_aggregates job recomputes them from scratch.
+    """
+    was_active = getattr(instance, '_gradebook_was_active', False)
+    enrolled_delta = int(bool(instance.is_active)) - int(was_active)
+    flag_changed = bool(
+        StudentGradebook.refresh_enrollment_flags(course_key=instance.course_id, user_id=instance.user_id)
+    )
+    if not enrolled_delta and not flag_changed:
+        return
+
+    gradebook_entry = StudentGradebook.objects.grades_only()\
+        .filter(user__id=instance.user_id, course_id=instance.course_id).first()
+    CourseGradebookAggregate.apply_enrollment_change(
+        instance.course_id, enrolled_delta, gradebook_entry if flag_changed else None
+    )
+    if gradebook_entry is not None:
+        StudentGradebookRank.update_entry(gradebook_entry)
+    invalidate_course_cache(instance.course_id)
+
+
+@receiver(pre_save, sender=User)
+def on_user_pre_save(sender, instance, update_fields=None, **kwargs):  # pylint: disable=W0613
+    """
+    Remembers whether the user was active before the save, so that only activation changes are
+    handled. Saves leaving is_active out of their update_fields, like the last_login update of
+    every login, don't query it.
+    """
+    if update_fields is not None and 'is_active' not in update_fields:
+        was_active = instance.is_active
+    elif instance.pk:
+        was_active = User.objects.filter(id=instance.pk).values_list('is_active', flat=True).first()
+    else:
+        was_active = None
+    instance._gradebook_was_active = was_active  # pylint: disable=protected-access
+
+
+@receiver(post_save, sender=User)
+def on_user_change(sender, instance, created=False, **kwargs):  # pylint: disable=W0613
+    """
+    Listens for user changes and moves deactivated and reactivated users out of and back into
+    the course leaderboards and aggregates
+    """
+    if created or getattr(instance, '_gradebook_was_active', None) == instance.is_active:
+        return
+    course_keys = StudentGradebook.refresh_enrollment_flags(user_id=instance.id)
+    if not instance.is_active:
+        course_keys.update(StudentGradebookRank.objects.filter(user=instance).values_list('course_id', flat=True))
+    for course_key in course_keys:
+        if instance.is_active:
+            gradebook_entry = StudentGradebook.objects.grades_only().get(user=instance, course_id=course_key)
+            StudentGradebookRank.update_entry(gradebook_entry)
+        else:
+            StudentGradebookRank.remove_user(course_key, instance.id)
+        CourseGradebookAggregate.refresh(course_key)
+        invalidate_course_cache(course_key)
+
+
+@receiver(post_save, sender=CourseAccessRole)
+@receiver(post_delete, sender=CourseAccessRole)
+def on_course_access_role_change(sender, instance, **kwargs):  # pylint: disable=W0613
+    """
+    Listens for role grants and revocations and resyncs the aggregate exclusions of the
+    affected courses: the role's course, or for organization-wide and global roles, every
+    course of the organization the user is enrolled in
+    """
+    if instance.course_id:
+        course_keys = [instance.course_id]
+    else:
+        course_keys = [
+            course_key for course_key in
+            CourseEnrollment.objects.filter(user_id=instance.user_id).values_list('course_id', flat=True)
+            if not instance.org or course_key.org == instance.org
+        ]
+    for course_key in course_keys:
+        GradebookExclusion.sync_course(course_key)
 
 
 score_changed.connect(receiver=on_score_changed, dispatch_uid="lms.courseware.score_changed")
\ No newline at end of file
@@ -1,76 +1,387 @@
 """
 This module has implementation of celery tasks for learner gradebook use cases
 """
-import json
 import logging
+import uuid
+from collections import defaultdict
 
 from celery.task import task  # pylint: disable=import-error,no-name-in-module
 
+from django.conf import settings
+from django.core.cache import cache
 from courseware import grades
+from courseware.models import StudentModule
 from courseware.views.views import progress_summary_wrapped
 from util.request import RequestMockWithoutMiddleware
 from xmodule.modulestore.django import modulestore
-from xmodule.modulestore import EdxJSONEncoder
 from django.db import transaction
 from django.contrib.auth.models import User
-from opaque_keys.edx.keys import CourseKey
+from opaque_keys.edx.keys import CourseKey, UsageKey
 
-from gradebook.models import StudentGradebook
+from gradebook.caching import invalidate_course_cache
+from gradebook.grading import get_compiled_grading_policy, graded_sections, section_score_arrays, totaled_scores
+from gradebook.models import CourseGradebookAggregate, StudentGradebook
+from gradebook.utils import serialize_blob
 
 log = logging.getLogger('edx.celery.task')
 
 
+def _pending_update_cache_key(course_key, user_id):
+    """
+    Returns the cache key marking a scheduled recalculation for the given user and course
+    """
+    return u'gradebook.pending_update.{}.{}'.format(course_key, user_id)
+
+
+def schedule_user_gradebook_update(course_key, user_id, usage_id=None):
+    """
+    Schedules a recalculation of the user's gradebook entry.
+
+    When GRADEBOOK_RECALCULATION_DEBOUNCE_WINDOW (seconds) is set, score changes arriving
+    within the window are coalesced: only the first one dispatches a delayed task, and the
+    others are absorbed by it because the task reads the scores only once the window elapsed.
+
+    When GRADEBOOK_INCREMENTAL_REGRADE is set, the changed block (usage_id) is passed on so
+    the task regrades it alone. Coalesced updates may span several blocks and always run
+    a full recalculation.
+    """
+    debounce_window = getattr(settings, 'GRADEBOOK_RECALCULATION_DEBOUNCE_WINDOW', 0)
+    if not debounce_window:
+        if usage_id is not None and getattr(settings, 'GRADEBOOK_INCREMENTAL_REGRADE', False):
+            update_user_gradebook.delay(course_key, user_id, usage_id=usage_id)
+        else:
+            update_user_gradebook.delay(course_key, user_id)
+        return
+
+    token = uuid.uuid4().hex
+    # Keep the marker around long enough to cover a worker backlog; if it expires anyway
+    # the next score change simply schedules a new task and the stale one is skipped.
+    timeout = max(debounce_window * 10, 300)
+    if cache.add(_pending_update_cache_key(course_key, user_id), token, timeout):
+        update_user_gradebook.apply_async((course_key, user_id), {'token': token}, countdown=debounce_window)
+
+
+def _claim_pending_update(course_key, user_id, token):
+    """
+    Releases the pending marker for a coalesced recalculation. Returns False when the
+    marker belongs to another task, meaning this one has been superseded.
+    """
+    cache_key = _pending_update_cache_key(course_key, user_id)
+    pending_token = cache.get(cache_key)
+    if pending_token is not None and pending_token != token:
+        return False
+    cache.delete(cache_key)
+    return True
+
+
 @task(name=u'lms.djangoapps.gradebook.tasks.update_user_gradebook')
-def update_user_gradebook(course_key, user_id):
+def update_user_gradebook(course_key, user_id, token=None, usage_id=None):
     """
     Taks to recalculate user's gradebook entry
     """
     log.info('Dosa do kraja!')
     if not isinstance(course_key, basestring):
         raise ValueError('course_key must be a string. {} is not acceptable.'.format(type(course_key)))
+    if token is not None and not _claim_pending_update(course_key, user_id, token):
+        log.info('Skipping superseded gradebook update -- Course: %s, User: %s', course_key, user_id)
+        return
     course_key = CourseKey.from_string(course_key)
     try:
         user = User.objects.get(id=user_id)
-        _generate_user_gradebook(course_key, user)
+        if usage_id is None or not _regrade_user_gradebook_block(course_key, user, usage_id):
+            _generate_user_gradebook(course_key, user)
     except Exception as ex:
         log.exception('An error occurred while generating gradebook: %s', ex.message)
         raise
     log.info('Dosa do kraja!')
 
 
-def _generate_user_gradebook(course_key, user):
+@task(name=u'lms.djangoapps.gradebook.tasks.update_users_gradebook')
+def update_users_gradebook(course_key, user_ids):
     """
-    Recalculates the specified user's gradebook entry
+    Task to recalculate the gradebook entries of several users of the same course in one pass
+    """
+    if not isinstance(course_key, basestring):
+        raise ValueError('course_key must be a string. {} is not acceptable.'.format(type(course_key)))
+    course_key = CourseKey.from_string(course_key)
+    try:
+        users = User.objects.filter(id__in=user_ids)
+        _generate_users_gradebook(course_key, users)
+    except Exception as ex:
+        log.exception('An error occurred while generating gradebooks: %s', ex.message)
+        raise
+
+
+def schedule_users_gradebook_update(course_key, user_ids, chunk_size=None):
+    """
+    Dispatches update_users_gradebook tasks for the given users, GRADEBOOK_BATCH_SIZE users at a time
+    """
+    chunk_size = chunk_size or getattr(settings, 'GRADEBOOK_BATCH_SIZE', 100)
+    user_ids = list(user_ids)
+    for index in xrange(0, len(user_ids), chunk_size):
+        update_users_gradebook.delay(course_key, user_ids[index:index + chunk_size])
+
+
+@task(name=u'lms.djangoapps.gradebook.tasks.regrade_course_gradebook')
+def regrade_course_gradebook(course_key):
+    """
+    Task to regrade a whole course, e.g. after a grading policy change, from the stored
+    progress summaries, falling back to full recalculations where they cannot be used
+    """
+    if not isinstance(course_key, basestring):
+        raise ValueError('course_key must be a string. {} is not acceptable.'.format(type(course_key)))
+    course_key = CourseKey.from_string(course_key)
+    try:
+        user_ids = _regrade_course_from_summaries(course_key)
+        if user_ids:
+            schedule_users_gradebook_update(unicode(course_key), user_ids)
+    except Exception as ex:
+        log.exception('An error occurred while regrading course gradebook: %s', ex.message)
+        raise
+
+
+@task(name=u'lms.djangoapps.gradebook.tasks.reconcile_gradebook_aggregates')
+def reconcile_gradebook_aggregates(course_ids=None):
+    """
+    Periodic task recomputing the course aggregates from scratch, to correct any drift
+    of their incremental maintenance
+    """
+    if course_ids is not None:
+        course_keys = [CourseKey.from_string(course_id) for course_id in course_ids]
+    else:
+        course_keys = set(StudentGradebook.objects.values_list('course_id', flat=True).distinct())
+        course_keys.update(CourseGradebookAggregate.objects.values_list('course_id', flat=True))
+
+    for course_key in course_keys:
+        CourseGradebookAggregate.refresh(course_key)
+        log.info('Gradebook aggregates reconciled -- Course: %s', course_key)
+
+
+def _get_course_descriptor(course_key, depth=None):
+    """
+    Loads the course tree needed for grading (the full tree by default)
     """
     # import is local to avoid recursive import
     from courseware.courses import get_course
-    course_descriptor = get_course(course_key, depth=None)
-    grading_policy = course_descriptor.grading_policy
+    return get_course(course_key, depth=depth)
+
+
+def _calculate_user_gradebook(course_descriptor, grading_policy, user):
+    """
+    Grades the user against an already loaded course and its compiled grading policy, and
+    returns the gradebook field values
+    """
     request = RequestMockWithoutMiddleware().get('/')
     request.user = user
     request.course_descriptor = course_descriptor
-    progress_summary = progress_summary_wrapped(request, course_id)
-    log.info(progress_summary)
+    progress_summary = progress_summary_wrapped(request, unicode(course_descriptor.id))
     grade_summary = grades.grade(user, course_descriptor)
-    grade = grade_summary['percent']
-    proforma_grade = grades.calculate_proforma_grade(grade_summary, grading_policy)
+    return {
+        'grade': grade_summary['percent'],
+        'proforma_grade': grading_policy.proforma_grade(grade_summary),
+        'progress_summary': serialize_blob(progress_summary),
+        'grade_summary': serialize_blob(grade_summary),
+        'grading_policy': grading_policy.grading_policy_json,
+    }
+
 
+def _generate_user_gradebook(course_key, user):
+    """
+    Recalculates the specified user's gradebook entry
+    """
+    course_descriptor = _get_course_descriptor(course_key)
+    grading_policy = get_compiled_grading_policy(course_descriptor)
+    values = _calculate_user_gradebook(course_descriptor, grading_policy, user)
+
+    # The change log entry is appended by a post_save receiver, in the same transaction
+    with transaction.atomic():
+        try:
+            gradebook_entry = StudentGradebook.objects.get(user=user, course_id=course_key)
+            if gradebook_entry.update_values(values):
+                gradebook_entry.save()
+        except StudentGradebook.DoesNotExist:
+            StudentGradebook.objects.create(user=user, course_id=course_key, **values)
+    # Once the transaction is over, so that no reader caches the data it replaced
+    invalidate_course_cache(course_key)
+
+
+def _find_block_score(progress_summary, usage_id):
+    """
+    Returns the progress summary section holding the score of the given block, along with
+    the index of that score, or (None, None)
+    """
+    if not isinstance(progress_summary, list):
+        return None, None
+    for chapter in progress_summary:
+        for section in chapter.get('sections', []):
+            for index, score in enumerate(section.get('scores', [])):
+                if score[4] == usage_id:
+                    return section, index
+    return None, None
+
+
+def _calculate_block_regrade(grading_policy, gradebook_entry, usage_id):
+    """
+    Regrades the block changed by a score_changed signal on top of the stored progress and
+    grade summaries, without walking the course tree. Returns the gradebook field values, or
+    None when the stored summaries cannot be reused. The parsed summaries of the entry are
+    updated in place: the caller applies the returned values to the entry right after, which
+    replaces them.
+    """
     try:
-        gradebook_entry = StudentGradebook.objects.get(user=user, course_id=course_key)
-        if gradebook_entry.grade != grade:
-            gradebook_entry.grade = grade
-            gradebook_entry.proforma_grade = proforma_grade
-            gradebook_entry.progress_summary = json.dumps(progress_summary, cls=EdxJSONEncoder)
-            gradebook_entry.grade_summary = json.dumps(grade_summary, cls=EdxJSONEncoder)
-            gradebook_entry.grading_policy = json.dumps(grading_policy, cls=EdxJSONEncoder)
+        progress_summary = gradebook_entry.parsed_progress_summary
+        grade_summary = gradebook_entry.parsed_grade_summary
+    except ValueError:
+        return None
+    section, index = _find_block_score(progress_summary, usage_id)
+    if section is None or not isinstance(grade_summary, dict):
+        return None
+
+    student_module = StudentModule.objects.filter(
+        student_id=gradebook_entry.user_id,
+        course_id=gradebook_entry.course_id,
+        module_state_key=UsageKey.from_string(usage_id)
+    ).values('grade', 'max_grade').first()
+    score = section['scores'][index]
+    if not student_module or student_module['grade'] is None or not student_module['max_grade'] or not score[1]:
+        return None
+    # The stored possible points already account for the problem weight
+    if score[1] == student_module['max_grade']:
+        score[0] = student_module['grade']
+    else:
+        score[0] = student_module['grade'] * score[1] / float(student_module['max_grade'])
+    section['section_total'][0] = float(sum(block_score[0] for block_score in section['scores']))
+    for raw_score in grade_summary.get('raw_scores', []):
+        if raw_score[4] == usage_id:
+            raw_score[0] = score[0]
+
+    grade_summary.update(grading_policy.grade(totaled_scores(progress_summary)))
+    return {
+        'grade': grade_summary['percent'],
+        'proforma_grade': grading_policy.proforma_grade(grade_summary),
+        'progress_summary': serialize_blob(progress_summary),
+        'grade_summary': serialize_blob(grade_summary),
+        'grading_policy': grading_policy.grading_policy_json,
+    }
+
+
+def _regrade_user_gradebook_block(course_key, user, usage_id):
+    """
+    Incrementally updates the user's gradebook entry after a score change of a single block.
+    Returns False when a full recalculation is needed instead: incremental regrading is
+    disabled, the entry does not exist yet or was graded under another grading policy.
+    The entry is locked from the read of its summaries until the save, so that concurrent
+    regrades of other blocks of the same learner can't overwrite each other's scores.
+    """
+    if not getattr(settings, 'GRADEBOOK_INCREMENTAL_REGRADE', False):
+        return False
+    # The course root is enough: the grader and policy live on it, the scores in the summaries
+    grading_policy = get_compiled_grading_policy(_get_course_descriptor(course_key, depth=0))
+
+    with transaction.atomic():
+        try:
+            gradebook_entry = StudentGradebook.objects.select_for_update().get(user=user, course_id=course_key)
+        except StudentGradebook.DoesNotExist:
+            return False
+        if gradebook_entry.grading_policy_hash != grading_policy.grading_policy_hash:
+            return False
+        values = _calculate_block_regrade(grading_policy, gradebook_entry, usage_id)
+        if values is None:
+            return False
+        if gradebook_entry.update_values(values):
             gradebook_entry.save()
-    except StudentGradebook.DoesNotExist:
-        StudentGradebook.objects.create(
-            user=user,
-            course_id=course_key,
-            grade=grade,
-            proforma_grade=proforma_grade,
-            progress_summary=json.dumps(progress_summary, cls=EdxJSONEncoder),
-            grade_summary=json.dumps(grade_summary, cls=EdxJSONEncoder),
-            grading_policy=json.dumps(grading_policy, cls=EdxJSONEncoder)
-        )
+    invalidate_course_cache(course_key)
+    return True
+
+
+def _generate_users_gradebook(course_key, users, course_descriptor=None, refresh_course=True):
+    """
+    Recalculates the gradebook entries of the specified users, loading the course descriptor
+    (unless an already loaded one is given) and its grading policy only once. Existing entries
+    are fetched with a single query, and the changed and missing ones are written in bulk. The
+    course leaderboard and aggregates are then rebuilt, unless refresh_course is False because
+    the caller rebuilds them once after grading all of its chunks of the course.
+    """
+    if course_descriptor is None:
+        course_descriptor = _get_course_descriptor(course_key)
+    grading_policy = get_compiled_grading_policy(course_descriptor)
+
+    calculated = []
+    for user in users:
+        values = _calculate_user_gradebook(course_descriptor, grading_policy, user)
+        calculated.append((user, values))
+
+    gradebook_entries = {
+        entry.user_id: entry
+        for entry in StudentGradebook.objects.filter(course_id=course_key, user__in=[user.id for user, __ in calculated])
+    }
+    new_entries = []
+    changed_entries = []
+    for user, values in calculated:
+        gradebook_entry = gradebook_entries.get(user.id)
+        if gradebook_entry is None:
+            new_entries.append(StudentGradebook(user=user, course_id=course_key, **values))
+        elif gradebook_entry.update_values(values):
+            changed_entries.append(gradebook_entry)
+    if not new_entries and not changed_entries:
+        return
+    with transaction.atomic():
+        StudentGradebook.bulk_update_entries(changed_entries, refresh_courses=False)
+        StudentGradebook.bulk_create_entries(new_entries, refresh_courses=False)
+        if refresh_course:
+            StudentGradebook.rebuild_courses([course_key])
+    invalidate_course_cache(course_key)
+
+
+def _regrade_course_from_summaries(course_key, user_ids=None, batch_size=1000):
+    """
+    Recomputes the grade and proforma grade of the course gradebook entries (optionally only
+    those of the given users) under the current grading policy, from the section scores of
+    their stored progress summaries instead of walking the course tree for every learner.
+    Entries are graded batch_size at a time with the vectorized policy evaluator and written
+    back with one UPDATE per batch. Returns the ids of the users whose stored progress summary
+    is unusable, who need a full recalculation.
+    """
+    grading_policy = get_compiled_grading_policy(_get_course_descriptor(course_key, depth=0))
+    gradebook_entries = StudentGradebook.objects.filter(course_id=course_key)
+    if user_ids is not None:
+        gradebook_entries = gradebook_entries.filter(user__in=user_ids)
+
+    unusable_user_ids = []
+    last_id = 0
+    while True:
+        entries = list(gradebook_entries.filter(id__gt=last_id).order_by('id')[:batch_size])
+        if not entries:
+            break
+        last_id = entries[-1].id
+        StudentGradebook.prefetch_blobs(entries, 'progress_summary')
+
+        # Learners graded together must share the same graded sections
+        layouts = defaultdict(list)
+        for entry in entries:
+            try:
+                progress_summary = entry.parsed_progress_summary
+                layout = tuple(section['format'] for section, __, __ in graded_sections(progress_summary))
+            except (ValueError, TypeError, KeyError, IndexError, AttributeError):
+                unusable_user_ids.append(entry.user_id)
+                continue
+            layouts[layout].append((entry, progress_summary))
+
+        changed_entries = []
+        for layout_entries in layouts.itervalues():
+            percents, proforma_grades = grading_policy.grade_arrays(
+                section_score_arrays([layout_summary for __, layout_summary in layout_entries]),
+                len(layout_entries)
+            )
+            for (entry, __), grade, proforma_grade in zip(layout_entries, percents, proforma_grades):
+                if entry.grade != float(grade) or entry.proforma_grade != float(proforma_grade):
+                    entry.grade = float(grade)
+                    entry.proforma_grade = float(proforma_grade)
+                    changed_entries.append(entry)
+        StudentGradebook.bulk_update_grades(changed_entries, refresh_courses=False)
+        log.info('Course gradebook regraded from summaries -- Course: %s, %s entries changed (last id %s)',
+                 course_key, len(changed_entries), last_id)
+
+    StudentGradebook.rebuild_courses([course_key])
+    invalidate_course_cache(course_key)
+    return unusable_user_ids
@@ -8,21 +8,39 @@ import uuid
 import json
 
 from collections import OrderedDict
-from datetime import datetime
+from datetime import datetime, timedelta
 from django.utils.timezone import UTC
 
 from django.conf import settings
+from django.contrib.auth.models import Group
 from django.test.utils import override_settings
 
 from capa.tests.response_xml_factory import StringResponseXMLFactory
 from courseware import module_render
 from courseware.model_data import FieldDataCache
 from xmodule.modulestore.tests.django_utils import ModuleStoreTestCase, mixed_store_config
-from student.tests.factories import UserFactory, AdminFactory
+from student.models import CourseEnrollment
+from student.roles import CourseStaffRole, get_aggregate_exclusion_user_ids
+from student.tests.factories import UserFactory, AdminFactory, CourseEnrollmentFactory
 from courseware.tests.factories import StaffFactory
 from xmodule.modulestore.tests.factories import CourseFactory, ItemFactory
 
-from gradebook.models import StudentGradebook, StudentGradebookHistory
+from gradebook.management.commands import backfill_gradebook_snapshots
+from gradebook.grading import (
+    clear_compiled_grading_policies, get_compiled_grading_policy, graded_sections, section_score_arrays, totaled_scores
+)
+from gradebook.models import (
+    CourseGradebookAggregate,
+    GradebookBlob,
+    StudentGradebook,
+    StudentGradebookChange,
+    StudentGradebookHistory,
+    StudentGradebookRank,
+    StudentGradebookSnapshot,
+)
+from gradebook.tasks import (
+    update_user_gradebook, update_users_gradebook, _get_course_descriptor, _regrade_course_from_summaries
+)
 from util.signals import course_deleted
 
 
@@ -474,10 +492,140 @@ class GradebookTests(ModuleStoreTestCase):
         user = UserFactory()
         module = self.get_module_for_user(user, self.course, self.problem)
         grade_dict = {'value': 0.75, 'max_value': 1, 'user_id': user.id}
-        with patch('gradebook.signals.update_user_gradebook.delay') as mock_task:
+        with patch('gradebook.tasks.update_user_gradebook.delay') as mock_task:
             module.system.publish(module, 'grade', grade_dict)
             mock_task.assert_called_with(unicode(self.course.id), user.id)
 
+    @override_settings(GRADEBOOK_RECALCULATION_DEBOUNCE_WINDOW=30)
+    def test_update_user_gradebook_coalesced(self):
+        """
+        Tests a burst of score changes dispatches a single delayed update_user_gradebook task
+        """
+        self._create_course()
+        user = UserFactory()
+        with patch('gradebook.tasks.update_user_gradebook.apply_async') as mock_task:
+            for problem in [self.problem, self.problem2, self.problem3]:
+                module = self.get_module_for_user(user, self.course, problem)
+                grade_dict = {'value': 0.75, 'max_value': 1, 'user_id': user.id}
+                module.system.publish(module, 'grade', grade_dict)
+            self.assertEqual(mock_task.call_count, 1)
+            args, kwargs = mock_task.call_args
+            self.assertEqual(args[0], (unicode(self.course.id), user.id))
+            self.assertEqual(kwargs['countdown'], 30)
+            token = args[1]['token']
+
+        with patch('gradebook.tasks._generate_user_gradebook') as mock_generate:
+            update_user_gradebook(unicode(self.course.id), user.id, token='superseded')
+            self.assertFalse(mock_generate.called)
+            update_user_gradebook(unicode(self.course.id), user.id, token=token)
+            self.assertEqual(mock_generate.call_count, 1)
+
+    def test_update_users_gradebook(self):
+        """
+        Tests update_users_gradebook grades a batch of users against a single course load
+        """
+        self._create_course()
+        users = [UserFactory() for __ in xrange(3)]
+        for user in users:
+            CourseEnrollmentFactory.create(user=user, course_id=self.course.id)
+        with patch('gradebook.signals.schedule_user_gradebook_update'):
+            for user in users[:2]:
+                module = self.get_module_for_user(user, self.course, self.problem)
+                grade_dict = {'value': 0.75, 'max_value': 1, 'user_id': user.id}
+                module.system.publish(module, 'grade', grade_dict)
+
+        with patch('gradebook.tasks._get_course_descriptor', wraps=_get_course_descriptor) as mock_get_course:
+            update_users_gradebook(unicode(self.course.id), [user.id for user in users])
+            self.assertEqual(mock_get_course.call_count, 1)
+
+        self.assertEqual(StudentGradebook.objects.filter(course_id=self.course.id).count(), 3)
+        self.assertEqual(StudentGradebookHistory.objects.filter(course_id=self.course.id).count(), 3)
+        for user in users[:2]:
+            gradebook = StudentGradebook.objects.get(user=user, course_id=self.course.id)
+            self.assertEqual(gradebook.grade, 0.01)
+            self.assertEqual(gradebook.proforma_grade, 0.75)
+            self.assertIn(json.dumps(self.problem_progress_summary), gradebook.progress_summary)
+            self.assertEquals(json.loads(gradebook.grading_policy), self.grading_policy)
+        gradebook = StudentGradebook.objects.get(user=users[2], course_id=self.course.id)
+        self.assertEqual(gradebook.grade, 0)
+
+        # Running the batch again leaves unchanged entries alone
+        update_users_gradebook(unicode(self.course.id), [user.id for user in users])
+        self.assertEqual(StudentGradebookHistory.objects.filter(course_id=self.course.id).count(), 3)
+
+        # Changed entries are written back in bulk, along with the leaderboard and aggregates
+        StudentGradebook.objects.filter(user=users[2], course_id=self.course.id).update(grade=0.5)
+        StudentGradebook.rebuild_courses([self.course.id])
+        update_users_gradebook(unicode(self.course.id), [user.id for user in users])
+        self.assertEqual(StudentGradebook.objects.get(user=users[2], course_id=self.course.id).grade, 0)
+        self.assertEqual(StudentGradebookHistory.objects.filter(course_id=self.course.id).count(), 4)
+        self.assertEqual(
+            list(StudentGradebookRank.objects.filter(course_id=self.course.id).order_by('rank')
+                 .values_list('user__id', flat=True)),
+            list(StudentGradebook.enrolled_entries(self.course.id).order_by('-grade', 'modified', 'user__id')
+                 .values_list('user__id', flat=True))
+        )
+        self.assertEqual(CourseGradebookAggregate.objects.get(course_id=self.course.id).grade_max, 0.01)
+
+    @patch.dict(settings.FEATURES, {
+        'ALLOW_STUDENT_STATE_UPDATES_ON_CLOSED_COURSE': False,
+        'SIGNAL_ON_SCORE_CHANGED': True
+    })
+    def test_regrade_course_from_summaries(self):
+        """
+        Tests the vectorized course regrade reproduces the grades computed by walking the course
+        """
+        self._create_course()
+        for problem, value in [(self.problem, 0.75), (self.problem2, 0.95), (self.problem3, 0.86), (self.problem4, 0.92)]:
+            module = self.get_module_for_user(self.user, self.course, problem)
+            grade_dict = {'value': value, 'max_value': 1, 'user_id': self.user.id}
+            module.system.publish(module, 'grade', grade_dict)
+        user = UserFactory()
+        StudentGradebook.objects.create(user=user, course_id=self.course.id, grade=0.1, proforma_grade=0.1)
+        StudentGradebook.objects.filter(user=self.user).update(grade=0, proforma_grade=0)
+        history_count = StudentGradebookHistory.objects.count()
+
+        unusable_user_ids = _regrade_course_from_summaries(self.course.id)
+
+        self.assertEqual(unusable_user_ids, [user.id])
+        gradebook = StudentGradebook.objects.get(user=self.user, course_id=self.course.id)
+        self.assertEqual(gradebook.grade, 0.31)
+        self.assertAlmostEqual(gradebook.proforma_grade, 0.8831666666666667)
+        self.assertEqual(StudentGradebookHistory.objects.count(), history_count + 1)
+
+    @override_settings(GRADEBOOK_INCREMENTAL_REGRADE=True)
+    def test_update_user_gradebook_incremental(self):
+        """
+        Tests a single block score change is regraded from the stored summaries, matching a full recalculation
+        """
+        self._create_course()
+        user = UserFactory()
+        module = self.get_module_for_user(user, self.course, self.problem)
+        grade_dict = {'value': 0.75, 'max_value': 1, 'user_id': user.id}
+        module.system.publish(module, 'grade', grade_dict)
+
+        with patch('gradebook.signals.schedule_user_gradebook_update'):
+            module = self.get_module_for_user(user, self.course, self.problem2)
+            grade_dict = {'value': 0.95, 'max_value': 1, 'user_id': user.id}
+            module.system.publish(module, 'grade', grade_dict)
+
+        with patch('gradebook.tasks._generate_user_gradebook') as mock_generate:
+            update_user_gradebook(unicode(self.course.id), user.id, usage_id=unicode(self.problem2.location))
+            self.assertFalse(mock_generate.called)
+        incremental_entry = StudentGradebook.objects.get(user=user, course_id=self.course.id)
+
+        update_user_gradebook(unicode(self.course.id), user.id)
+        full_entry = StudentGradebook.objects.get(user=user, course_id=self.course.id)
+        self.assertEqual(incremental_entry.grade, full_entry.grade)
+        self.assertEqual(incremental_entry.proforma_grade, full_entry.proforma_grade)
+        self.assertIn(json.dumps(self.problem2_progress_summary), incremental_entry.progress_summary)
+
+        # A grading policy change forces a full recalculation
+        StudentGradebook.objects.filter(id=full_entry.id).update(grading_policy_hash='')
+        with patch('gradebook.tasks._generate_user_gradebook') as mock_generate:
+            update_user_gradebook(unicode(self.course.id), user.id, usage_id=unicode(self.problem2.location))
+            self.assertEqual(mock_generate.call_count, 1)
+
     @patch.dict(settings.FEATURES, {
         'ALLOW_STUDENT_STATE_UPDATES_ON_CLOSED_COURSE': False,
         'SIGNAL_ON_SCORE_CHANGED': True
@@ -511,3 +659,747 @@ class GradebookTests(ModuleStoreTestCase):
 
         history = StudentGradebookHistory.objects.all()
         self.assertEqual(len(history), 0)
+
+
+class GradebookEntriesTestMixin(object):
+    """
+    Creates the course, learners and gradebook entries shared by the gradebook model tests
+    """
+
+    def _create_course_users(self, user_count, enroll=True):
+        """ Creates self.course and user_count learners in self.users, enrolled in it unless told otherwise """
+        self.course = CourseFactory.create()
+        self.users = [UserFactory() for __ in xrange(user_count)]
+        if enroll:
+            for user in self.users:
+                CourseEnrollmentFactory.create(user=user, course_id=self.course.id)
+
+    def _create_entry(self, user, grade, proforma_grade=None, course_id=None, timestamp=None):
+        """
+        Creates the gradebook entry of the user, in self.course unless another course is given. The
+        proforma grade defaults to the grade, and the entry is optionally backdated to timestamp.
+        """
+        gradebook = StudentGradebook.objects.create(
+            user=user,
+            course_id=course_id or self.course.id,
+            grade=grade,
+            proforma_grade=grade if proforma_grade is None else proforma_grade
+        )
+        if timestamp is not None:
+            StudentGradebook.objects.filter(id=gradebook.id).update(created=timestamp, modified=timestamp)
+        return gradebook
+
+    def _create_entries(self, grades, timestamps=None):
+        """ Creates the gradebook entries of the first learners of self.users with the given grades """
+        for index, (user, grade) in enumerate(zip(self.users, grades)):
+            self._create_entry(user, grade, timestamp=timestamps[index] if timestamps else None)
+
+
+@override_settings(MODULESTORE=MODULESTORE_CONFIG)
+class StudentGradebookRankTests(GradebookEntriesTestMixin, ModuleStoreTestCase):
+    """ Test suite for the denormalized course leaderboard """
+
+    def setUp(self):
+        super(StudentGradebookRankTests, self).setUp()
+        self._create_course_users(5)
+        self._create_entries([0.5, 0.9, 0.2, 0.7, 0.9])
+
+    def _ranking(self):
+        """ Returns the (user id, rank) pairs of the course leaderboard """
+        return list(
+            StudentGradebookRank.objects.filter(course_id=self.course.id).order_by('rank').values_list('user__id', 'rank')
+        )
+
+    def _expected_ranking(self, *indexes):
+        """ Returns the (user id, rank) pairs for the given user indexes, best first """
+        return [(self.users[index].id, rank) for rank, index in enumerate(indexes, start=1)]
+
+    def test_ranks_follow_gradebook_changes(self):
+        self.assertEqual(self._ranking(), self._expected_ranking(1, 4, 3, 0, 2))
+
+        gradebook = StudentGradebook.objects.get(user=self.users[2], course_id=self.course.id)
+        gradebook.grade = 0.95
+        gradebook.save()
+        self.assertEqual(self._ranking(), self._expected_ranking(2, 1, 4, 3, 0))
+
+        CourseEnrollment.unenroll(self.users[1], self.course.id)
+        self.assertEqual(self._ranking(), self._expected_ranking(2, 4, 3, 0))
+
+        StudentGradebookRank.rebuild(self.course.id)
+        self.assertEqual(self._ranking(), self._expected_ranking(2, 4, 3, 0))
+
+    def test_ranks_stay_contiguous(self):
+        def _assert_ranks():
+            ranking = self._ranking()
+            self.assertEqual([rank for __, rank in ranking], range(1, len(ranking) + 1))
+            StudentGradebookRank.rebuild(self.course.id)
+            self.assertEqual(self._ranking(), ranking)
+
+        for index, grade in [(2, 0.95), (1, 0.1), (0, 0.9), (4, 0.9), (2, 0.3), (3, 0.7), (0, 0.0)]:
+            gradebook = StudentGradebook.objects.get(user=self.users[index], course_id=self.course.id)
+            gradebook.grade = grade
+            gradebook.save()
+            _assert_ranks()
+
+        user = UserFactory()
+        CourseEnrollmentFactory.create(user=user, course_id=self.course.id)
+        self._create_entry(user, 0.7)
+        _assert_ranks()
+        CourseEnrollment.unenroll(self.users[3], self.course.id)
+        _assert_ranks()
+
+    def test_active_enrollment_flags(self):
+        def _flagged_users():
+            return set(StudentGradebook.objects.filter(
+                course_id=self.course.id, is_active_enrolled=True
+            ).values_list('user__id', flat=True))
+
+        self.assertEqual(_flagged_users(), set(user.id for user in self.users))
+        stale_gradebook = StudentGradebook.objects.get(user=self.users[1], course_id=self.course.id)
+
+        CourseEnrollment.unenroll(self.users[1], self.course.id)
+        self.users[3].is_active = False
+        self.users[3].save()
+        self.assertEqual(_flagged_users(), set(user.id for user in [self.users[0], self.users[2], self.users[4]]))
+        self.assertEqual(self._ranking(), self._expected_ranking(4, 0, 2))
+
+        # Saving an entry loaded before the enrollment change keeps the user out of the leaderboard
+        stale_gradebook.grade = 0.95
+        stale_gradebook.save()
+        self.assertEqual(self._ranking(), self._expected_ranking(4, 0, 2))
+
+        # Saves which leave is_active unchanged don't touch the gradebook
+        with patch('gradebook.signals.StudentGradebook.refresh_enrollment_flags') as refresh_enrollment_flags:
+            self.users[3].last_login = datetime.now(UTC())
+            self.users[3].save(update_fields=['last_login'])
+            self.users[3].first_name = 'Inactive'
+            self.users[3].save()
+            self.assertFalse(refresh_enrollment_flags.called)
+
+        self.users[3].is_active = True
+        self.users[3].save()
+        self.assertEqual(self._ranking(), self._expected_ranking(4, 3, 0, 2))
+        self.assertEqual(StudentGradebook.refresh_enrollment_flags(course_key=self.course.id), set())
+
+    def test_slim_projections(self):
+        self.assertEqual(
+            list(StudentGradebook.enrolled_entries(self.course.id).ranking()),
+            list(StudentGradebookRank.objects.filter(course_id=self.course.id).ranking())
+        )
+        gradebook = StudentGradebook.objects.grades_only().get(user=self.users[0], course_id=self.course.id)
+        self.assertEqual(gradebook.grade, 0.5)
+        for name in ['progress_summary', 'grade_summary', 'grading_policy', 'grade_summary_hash']:
+            self.assertNotIn(name, gradebook.__dict__)
+
+    def test_leaderboard_matches_unranked_queries(self):
+        data = StudentGradebook.generate_leaderboard(self.course.id, user_id=self.users[0].id, count=3)
+        self.assertEqual([row['user__id'] for row in data['queryset']], [self.users[1].id, self.users[4].id, self.users[3].id])
+        self.assertEqual(data['user_position'], 4)
+        self.assertEqual(data['user_grade'], 0.5)
+
+        # Excluding a user outside of the course takes the unranked path and gives the same answer
+        filtered_data = StudentGradebook.generate_leaderboard(
+            self.course.id, user_id=self.users[0].id, count=3, exclude_users=[AdminFactory().id]
+        )
+        self.assertEqual(list(filtered_data['queryset']), list(data['queryset']))
+        self.assertEqual(filtered_data['user_position'], data['user_position'])
+
+
+@override_settings(MODULESTORE=MODULESTORE_CONFIG)
+class StudentGradebookPositionTests(GradebookEntriesTestMixin, ModuleStoreTestCase):
+    """ Regression tests pinning the leaderboard position semantics, with and without filters """
+
+    def setUp(self):
+        super(StudentGradebookPositionTests, self).setUp()
+        self._create_course_users(4)
+        # A user outside of the course, excluded to exercise the filtered queries
+        self.exclude_users = [AdminFactory().id]
+        base_time = datetime(2015, 1, 1, tzinfo=UTC())
+        self._create_entries(
+            [0.8, 0.8, 0.9, 0.5], timestamps=[base_time + timedelta(hours=hours) for hours in xrange(4)]
+        )
+
+    def _position(self, user_id, group_ids=None):
+        """ Returns the filtered leaderboard position of the given user """
+        return StudentGradebook.get_user_position(
+            self.course.id, user_id, exclude_users=self.exclude_users, group_ids=group_ids
+        )
+
+    def test_positions(self):
+        self.assertEqual(self._position(self.users[2].id), {'user_position': 1, 'user_grade': 0.9})
+        # Same grade: the entry scored earlier wins the tie
+        self.assertEqual(self._position(self.users[0].id), {'user_position': 2, 'user_grade': 0.8})
+        self.assertEqual(self._position(self.users[1].id), {'user_position': 3, 'user_grade': 0.8})
+        self.assertEqual(self._position(self.users[3].id), {'user_position': 4, 'user_grade': 0.5})
+        # Users without a gradebook entry come after everybody else
+        self.assertEqual(self._position(UserFactory().id), {'user_position': 5, 'user_grade': 0})
+
+    def test_tie_compares_modified_against_user_created(self):
+        # The tied entry is compared by its modified time against the user's created time
+        StudentGradebook.objects.filter(user=self.users[0]).update(modified=datetime(2015, 1, 2, tzinfo=UTC()))
+        self.assertEqual(self._position(self.users[0].id)['user_position'], 2)
+        self.assertEqual(self._position(self.users[1].id)['user_position'], 2)
+
+    def test_filter_without_effect_matches_unfiltered_position(self):
+        for modified in [None, datetime(2015, 1, 2, tzinfo=UTC())]:
+            if modified is not None:
+                StudentGradebook.objects.filter(user__in=self.users[:2]).update(modified=modified)
+            StudentGradebookRank.rebuild(self.course.id)
+            for user_id in [user.id for user in self.users] + [UserFactory().id]:
+                self.assertEqual(
+                    self._position(user_id),
+                    StudentGradebook.get_user_position(self.course.id, user_id)
+                )
+
+    def test_positions_within_groups(self):
+        group = Group.objects.create(name='gradebook-position-group')
+        for user in [self.users[0], self.users[1], self.users[3]]:
+            user.groups.add(group)
+        self.assertEqual(self._position(self.users[0].id, group_ids=[group.id])['user_position'], 1)
+        self.assertEqual(self._position(self.users[1].id, group_ids=[group.id])['user_position'], 2)
+        self.assertEqual(self._position(self.users[3].id, group_ids=[group.id])['user_position'], 3)
+
+    def test_leaderboard_pages(self):
+        expected_order = [self.users[2].id, self.users[0].id, self.users[1].id, self.users[3].id]
+        StudentGradebookRank.rebuild(self.course.id)
+        for exclude_users in [None, self.exclude_users]:
+            page = StudentGradebook.get_leaderboard_page(self.course.id, count=3, exclude_users=exclude_users)
+            self.assertEqual([entry['user__id'] for entry in page['queryset']], expected_order[:3])
+            page = StudentGradebook.get_leaderboard_page(
+                self.course.id, cursor=page['next_cursor'], count=3, exclude_users=exclude_users
+            )
+            self.assertEqual([entry['user__id'] for entry in page['queryset']], expected_order[3:])
+            self.assertIsNone(page['next_cursor'])
+
+            leaderboard = StudentGradebook.iter_leaderboard(self.course.id, page_size=1, exclude_users=exclude_users)
+            self.assertEqual([entry['user__id'] for entry in leaderboard], expected_order)
+
+    def test_leaderboard_pages_tie_on_modified(self):
+        StudentGradebook.objects.filter(user__in=self.users[:2]).update(modified=datetime(2015, 1, 2, tzinfo=UTC()))
+        leaderboard = StudentGradebook.iter_leaderboard(self.course.id, page_size=1, exclude_users=self.exclude_users)
+        self.assertEqual(
+            [entry['user__id'] for entry in leaderboard],
+            [self.users[2].id] + sorted(user.id for user in self.users[:2]) + [self.users[3].id]
+        )
+
+
+@override_settings(MODULESTORE=MODULESTORE_CONFIG)
+class CourseGradebookAggregateTests(GradebookEntriesTestMixin, ModuleStoreTestCase):
+    """ Test suite for the running course gradebook aggregates """
+
+    def setUp(self):
+        super(CourseGradebookAggregateTests, self).setUp()
+        self._create_course_users(4)
+        self._create_entries([0.5, 0.9, 0.2])
+
+    def _assert_aggregate(self, grade_sum, grade_count, grade_min, grade_max, enrolled_count):
+        """ Checks both the incrementally maintained and the recomputed aggregates """
+        for course_aggregate in [
+                CourseGradebookAggregate.objects.get(course_id=self.course.id),
+                CourseGradebookAggregate.refresh(self.course.id)
+        ]:
+            self.assertAlmostEqual(course_aggregate.grade_sum, grade_sum)
+            self.assertEqual(course_aggregate.grade_count, grade_count)
+            self.assertEqual(course_aggregate.grade_min, grade_min)
+            self.assertEqual(course_aggregate.grade_max, grade_max)
+            self.assertEqual(course_aggregate.enrolled_count, enrolled_count)
+
+    def test_aggregate_follows_gradebook_changes(self):
+        self._assert_aggregate(1.6, 3, 0.2, 0.9, 4)
+
+        gradebook = StudentGradebook.objects.get(user=self.users[1], course_id=self.course.id)
+        gradebook.grade = 0.4
+        gradebook.save()
+        self._assert_aggregate(1.1, 3, 0.2, 0.5, 4)
+
+        self._create_entry(self.users[3], 0.1)
+        self._assert_aggregate(1.2, 4, 0.1, 0.5, 4)
+
+        CourseEnrollment.unenroll(self.users[0], self.course.id)
+        self._assert_aggregate(0.7, 3, 0.1, 0.4, 3)
+
+    def test_completion_counter(self):
+        def _completions():
+            counted = StudentGradebook.get_num_users_completed(self.course.id)
+            self.assertEqual(counted, CourseGradebookAggregate.refresh(self.course.id).completed_count)
+            self.assertEqual(counted, StudentGradebook.get_num_users_completed(self.course.id, exclude_users=[0]))
+            return counted
+
+        self.assertEqual(_completions(), 3)
+
+        gradebook = StudentGradebook.objects.get(user=self.users[1], course_id=self.course.id)
+        gradebook.grade = 0.4
+        gradebook.save()
+        self.assertFalse(gradebook.is_complete)
+        self.assertEqual(_completions(), 2)
+
+        CourseEnrollment.unenroll(self.users[0], self.course.id)
+        self.assertEqual(_completions(), 1)
+
+        with override_settings(GRADEBOOK_GRADE_COMPLETE_PROFORMA_MATCH_RANGE=0.5):
+            self.assertEqual(StudentGradebook.refresh_completion_flags(self.course.id), 1)
+            self.assertEqual(_completions(), 2)
+
+    @override_settings(GRADEBOOK_GRADE_HISTOGRAM_BUCKETS=4)
+    def test_grade_histogram(self):
+        def _histogram():
+            histogram = StudentGradebook.get_grade_histogram(self.course.id)
+            self.assertEqual(histogram, CourseGradebookAggregate.refresh_histogram(self.course.id))
+            return histogram
+
+        # Counted with the default number of buckets, so recounted on first read
+        self.assertEqual(_histogram(), [1, 0, 1, 1])
+
+        gradebook = StudentGradebook.objects.get(user=self.users[1], course_id=self.course.id)
+        gradebook.grade = 0.4
+        gradebook.save()
+        self.assertEqual(_histogram(), [1, 1, 1, 0])
+        self.assertAlmostEqual(StudentGradebook.get_median_grade(self.course.id), 0.375)
+        self.assertAlmostEqual(StudentGradebook.get_grade_percentile(self.course.id, 100), 0.75)
+
+        self._create_entry(self.users[3], 0.25, proforma_grade=0.5)
+        self.assertEqual(_histogram(), [1, 2, 1, 0])
+
+        CourseEnrollment.unenroll(self.users[0], self.course.id)
+        self.assertEqual(_histogram(), [1, 2, 0, 0])
+
+        group = Group.objects.create(name='histogram')
+        self.users[1].groups.add(group)
+        self.assertEqual(StudentGradebook.get_grade_histogram(self.course.id, group_ids=[group.id]), [0, 1, 0, 0])
+        self.assertIsNone(StudentGradebook.get_median_grade(self.course.id, exclude_users=[
+            self.users[1].id, self.users[2].id, self.users[3].id
+        ]))
+
+    def test_leaderboard_aggregates(self):
+        data = StudentGradebook.generate_leaderboard(self.course.id)
+        self.assertEqual(data['course_avg'], 0.4)
+        self.assertEqual(data['course_max'], 0.9)
+        self.assertEqual(data['course_min'], 0.2)
+        self.assertEqual(data['course_count'], 3)
+
+        data = StudentGradebook.generate_leaderboard(self.course.id, exclude_users=[self.users[1].id])
+        self.assertEqual(data['course_avg'], 0.233)
+        self.assertEqual(data['course_max'], 0.5)
+        self.assertEqual(data['course_min'], 0.2)
+        self.assertEqual(data['course_count'], 2)
+
+    def test_leaderboard_cache(self):
+        data = StudentGradebook.generate_leaderboard(self.course.id, count=2, exclude_users=[self.users[3].id])
+        with self.assertNumQueries(0):
+            cached_data = StudentGradebook.generate_leaderboard(self.course.id, count=2, exclude_users=[self.users[3].id])
+        self.assertEqual(cached_data['course_avg'], data['course_avg'])
+        self.assertEqual(list(cached_data['queryset']), list(data['queryset']))
+
+        gradebook = StudentGradebook.objects.get(user=self.users[2], course_id=self.course.id)
+        gradebook.grade = 1.0
+        gradebook.save()
+        data = StudentGradebook.generate_leaderboard(self.course.id, count=2, exclude_users=[self.users[3].id])
+        self.assertEqual(data['course_max'], 1.0)
+        self.assertEqual([row['user__id'] for row in data['queryset']], [self.users[2].id, self.users[1].id])
+
+    def test_multi_course_leaderboards(self):
+        other_course = CourseFactory.create()
+        for user, grade in zip(self.users[:2], [0.7, 0.3]):
+            CourseEnrollmentFactory.create(user=user, course_id=other_course.id)
+            self._create_entry(user, grade, course_id=other_course.id)
+        course_keys = [self.course.id, other_course.id]
+
+        for exclude_users in [None, [self.users[1].id]]:
+            leaderboards = StudentGradebook.generate_leaderboards(course_keys, count=2, exclude_users=exclude_users)
+            for course_key in course_keys:
+                data = StudentGradebook.generate_leaderboard(course_key, count=2, exclude_users=exclude_users)
+                self.assertEqual(leaderboards[course_key]['course_avg'], data['course_avg'])
+                self.assertEqual(leaderboards[course_key]['course_max'], data['course_max'])
+                self.assertEqual(leaderboards[course_key]['course_min'], data['course_min'])
+                self.assertEqual(leaderboards[course_key]['course_count'], data['course_count'])
+                self.assertEqual(
+                    [row['user__id'] for row in leaderboards[course_key]['queryset']],
+                    [row['user__id'] for row in data['queryset']]
+                )
+
+        completions = StudentGradebook.get_num_users_completed_by_course(course_keys)
+        for course_key in course_keys:
+            self.assertEqual(completions[course_key], StudentGradebook.get_num_users_completed(course_key))
+
+    def test_exclusion_membership(self):
+        CourseStaffRole(self.course.id).add_users(self.users[1])
+        exclude_users = list(get_aggregate_exclusion_user_ids(self.course.id))
+        self.assertIn(self.users[1].id, exclude_users)
+        self.assertTrue(StudentGradebook.objects.get(user=self.users[1], course_id=self.course.id).exclude_from_aggregates)
+
+        data = StudentGradebook.generate_leaderboard(self.course.id, user_id=self.users[0].id, exclude_users=exclude_users)
+        flagged_data = StudentGradebook.generate_leaderboard(
+            self.course.id, user_id=self.users[0].id, exclude_aggregate_users=True
+        )
+        for key in ['course_avg', 'course_max', 'course_min', 'course_count', 'user_position', 'user_grade']:
+            self.assertEqual(flagged_data[key], data[key])
+        self.assertEqual(list(flagged_data['queryset']), list(data['queryset']))
+        self.assertEqual(
+            StudentGradebook.get_num_users_completed(self.course.id, exclude_aggregate_users=True),
+            StudentGradebook.get_num_users_completed(self.course.id, exclude_users=exclude_users)
+        )
+        leaderboards = StudentGradebook.generate_leaderboards([self.course.id], exclude_aggregate_users=True)
+        self.assertEqual(leaderboards[self.course.id]['course_avg'], data['course_avg'])
+
+        CourseStaffRole(self.course.id).remove_users(self.users[1])
+        self.assertFalse(StudentGradebook.objects.get(user=self.users[1], course_id=self.course.id).exclude_from_aggregates)
+        self.assertEqual(
+            StudentGradebook.generate_leaderboard(self.course.id, exclude_aggregate_users=True)['course_count'], 3
+        )
+
+
+@override_settings(MODULESTORE=MODULESTORE_CONFIG)
+class StudentGradebookChangeDetectionTests(ModuleStoreTestCase):
+    """ Test suite for the shared gradebook change detection """
+
+    def setUp(self):
+        super(StudentGradebookChangeDetectionTests, self).setUp()
+        self.course = CourseFactory.create()
+        self.values = {
+            'grade': 0.5,
+            'proforma_grade': 0.75,
+            'progress_summary': json.dumps({'progress': 'summary'}),
+            'grade_summary': json.dumps({'grade': 'summary'}),
+            'grading_policy': json.dumps({'grading': 'policy'}),
+        }
+        self.gradebook = StudentGradebook.objects.create(user=self.user, course_id=self.course.id, **self.values)
+
+    def test_unchanged_values(self):
+        self.assertTrue(self.gradebook.grade_summary_hash)
+        gradebook = StudentGradebook.objects.get(id=self.gradebook.id)
+        self.assertFalse(gradebook.update_values(dict(self.values)))
+
+    def test_changed_summary_with_same_grade(self):
+        gradebook = StudentGradebook.objects.get(id=self.gradebook.id)
+        values = dict(self.values, grade_summary=json.dumps({'grade': 'updated summary'}))
+        self.assertTrue(gradebook.update_values(values))
+        gradebook.save()
+
+        gradebook = StudentGradebook.objects.get(id=self.gradebook.id)
+        self.assertEqual(gradebook.grade_summary, values['grade_summary'])
+        self.assertFalse(gradebook.update_values(values))
+        self.assertEqual(StudentGradebookHistory.objects.filter(user=self.user, course_id=self.course.id).count(), 2)
+
+    def test_entry_without_stored_hashes(self):
+        StudentGradebook.objects.filter(id=self.gradebook.id).update(
+            progress_summary_hash='', grade_summary_hash='', grading_policy_hash=''
+        )
+        gradebook = StudentGradebook.objects.get(id=self.gradebook.id)
+        self.assertFalse(gradebook.update_values(dict(self.values)))
+        self.assertTrue(gradebook.update_values(dict(self.values, grading_policy=json.dumps({}))))
+
+    def test_history_compares_latest_entry(self):
+        gradebook = StudentGradebook.objects.get(id=self.gradebook.id)
+        gradebook.grade = 0.6
+        gradebook.save()
+        # Reverting to the first values is a change compared to the latest history entry
+        gradebook.grade = 0.5
+        gradebook.save()
+        gradebook.save()
+        history = StudentGradebookHistory.objects.filter(user=self.user, course_id=self.course.id).order_by('id')
+        self.assertEqual([entry.grade for entry in history], [0.5, 0.6, 0.5])
+        self.assertEqual(history[2].grade_summary_hash, gradebook.grade_summary_hash)
+
+    def test_parsed_blobs(self):
+        gradebook = StudentGradebook.objects.get(id=self.gradebook.id)
+        progress_summary = gradebook.parsed_progress_summary
+        self.assertEqual(progress_summary, {'progress': 'summary'})
+        self.assertIs(gradebook.parsed_progress_summary, progress_summary)
+        gradebook.progress_summary = json.dumps({'progress': 'updated summary'})
+        self.assertEqual(gradebook.parsed_progress_summary, {'progress': 'updated summary'})
+
+    def test_deferred_blobs(self):
+        gradebook = StudentGradebook.deferred.get(id=self.gradebook.id)
+        self.assertNotIn('progress_summary', gradebook.__dict__)
+        self.assertEqual(gradebook.grade, 0.5)
+        with self.assertNumQueries(1):
+            self.assertEqual(gradebook.parsed_grading_policy, {'grading': 'policy'})
+
+        gradebook = StudentGradebook.deferred.with_summaries().get(id=self.gradebook.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(gradebook.parsed_grade_summary, {'grade': 'summary'})
+
+    def test_deferred_blobs_with_named_summaries(self):
+        gradebook = StudentGradebook.deferred.with_summaries('progress_summary').get(id=self.gradebook.id)
+        self.assertNotIn('grade_summary', gradebook.__dict__)
+        self.assertNotIn('grading_policy', gradebook.__dict__)
+        with self.assertNumQueries(0):
+            self.assertEqual(gradebook.parsed_progress_summary, {'progress': 'summary'})
+
+
+@override_settings(MODULESTORE=MODULESTORE_CONFIG)
+class StudentGradebookSnapshotTests(GradebookEntriesTestMixin, ModuleStoreTestCase):
+    """ Test suite for the gradebook grade time series """
+
+    def setUp(self):
+        super(StudentGradebookSnapshotTests, self).setUp()
+        self._create_course_users(3, enroll=False)
+        self.base_time = datetime(2015, 1, 1, tzinfo=UTC())
+        self._create_entries([0.25, 0.55])
+        gradebook = StudentGradebook.objects.get(user=self.users[0], course_id=self.course.id)
+        gradebook.grade = 0.85
+        gradebook.save()
+        self._create_entry(self.users[2], 1.0)
+        for day, (user, grade) in enumerate([(self.users[0], 0.25), (self.users[1], 0.55), (self.users[0], 0.85),
+                                             (self.users[2], 1.0)]):
+            StudentGradebookSnapshot.objects.filter(user=user, course_id=self.course.id, grade=grade)\
+                .update(created=self.base_time + timedelta(days=day))
+
+    def test_snapshots_follow_history(self):
+        self.assertEqual(
+            StudentGradebookSnapshot.objects.filter(course_id=self.course.id).count(),
+            StudentGradebookHistory.objects.filter(course_id=self.course.id).count()
+        )
+
+    def test_grade_distribution(self):
+        as_of = self.base_time + timedelta(days=1, hours=12)
+        self.assertEqual(
+            StudentGradebookSnapshot.get_course_grades(self.course.id, as_of),
+            {self.users[0].id: (0.25, 0.25), self.users[1].id: (0.55, 0.55)}
+        )
+        self.assertEqual(StudentGradebookSnapshot.get_grade_distribution(self.course.id, as_of, 4), [0, 1, 1, 0])
+        later = self.base_time + timedelta(days=10)
+        self.assertEqual(StudentGradebookSnapshot.get_grade_distribution(self.course.id, later, 4), [0, 0, 1, 2])
+
+    def test_backfilled_snapshots_are_older(self):
+        # Backfilled snapshots get greater ids than the live ones recorded after them
+        StudentGradebookHistory.objects.filter(user=self.users[1], course_id=self.course.id)\
+            .update(grade=0.1, proforma_grade=0.1, created=self.base_time - timedelta(days=30))
+        backfill_gradebook_snapshots.Command().handle()
+        self.assertEqual(
+            StudentGradebookSnapshot.get_course_grades(self.course.id, self.base_time - timedelta(days=1)),
+            {self.users[1].id: (0.1, 0.1)}
+        )
+        self.assertEqual(
+            StudentGradebookSnapshot.get_course_grades(self.course.id, self.base_time + timedelta(days=10)),
+            {self.users[0].id: (0.85, 0.25), self.users[1].id: (0.55, 0.55), self.users[2].id: (1.0, 1.0)}
+        )
+
+    def test_learner_trajectory(self):
+        trajectory = StudentGradebookSnapshot.get_learner_trajectory(self.course.id, self.users[0].id)
+        self.assertEqual([snapshot['grade'] for snapshot in trajectory], [0.25, 0.85])
+        trajectory = StudentGradebookSnapshot.get_learner_trajectory(
+            self.course.id, self.users[0].id, start=self.base_time + timedelta(days=1)
+        )
+        self.assertEqual([snapshot['grade'] for snapshot in trajectory], [0.85])
+
+
+@override_settings(MODULESTORE=MODULESTORE_CONFIG)
+@override_settings(GRADEBOOK_CHANGE_FEED_SETTLE_SECONDS=0)
+class StudentGradebookChangeTests(GradebookEntriesTestMixin, ModuleStoreTestCase):
+    """ Test suite for the gradebook change log """
+
+    def setUp(self):
+        super(StudentGradebookChangeTests, self).setUp()
+        self._create_course_users(3, enroll=False)
+        self.other_course = CourseFactory.create()
+
+    def test_change_feed(self):
+        gradebook = self._create_entry(self.users[0], 0.2, proforma_grade=0.5)
+        self._create_entry(self.users[1], 0.3, proforma_grade=0.5, course_id=self.other_course.id)
+        gradebook.grade = 0.5
+        gradebook.save()
+        StudentGradebook.bulk_create_entries([
+            StudentGradebook(user=self.users[2], course_id=self.course.id, grade=0.7, proforma_grade=0.7)
+        ])
+        gradebook.grade = 0.6
+        StudentGradebook.bulk_update_grades([gradebook])
+
+        changes = StudentGradebookChange.get_changes()
+        self.assertEqual(
+            [(change['user_id'], change['grade'], change['is_complete']) for change in changes],
+            [(self.users[0].id, 0.2, False), (self.users[1].id, 0.3, False), (self.users[0].id, 0.5, True),
+             (self.users[2].id, 0.7, True), (self.users[0].id, 0.6, True)]
+        )
+        self.assertEqual(sorted(change['id'] for change in changes), [change['id'] for change in changes])
+
+        # Batches resume after the last sequence number read
+        first_batch = StudentGradebookChange.get_changes(count=2)
+        self.assertEqual(first_batch, changes[:2])
+        self.assertEqual(StudentGradebookChange.get_changes(after=first_batch[-1]['id']), changes[2:])
+        self.assertEqual(StudentGradebookChange.get_changes(after=changes[-1]['id']), [])
+        self.assertEqual(len(StudentGradebookChange.get_changes(course_key=self.course.id)), 4)
+
+        with override_settings(GRADEBOOK_CHANGE_FEED_SETTLE_SECONDS=60):
+            self.assertEqual(StudentGradebookChange.get_changes(), [])
+
+    def test_course_deletion(self):
+        self._create_entry(self.users[0], 0.2, proforma_grade=0.5)
+        course_deleted.send(sender=None, course_key=self.course.id)
+        change = StudentGradebookChange.get_changes()[-1]
+        self.assertTrue(change['is_deleted'])
+        self.assertEqual((change['user_id'], change['grade']), (self.users[0].id, 0.2))
+
+    def test_compact_and_expire(self):
+        gradebook = self._create_entry(self.users[0], 0.2, proforma_grade=0.5)
+        for grade in [0.3, 0.4]:
+            gradebook.grade = grade
+            gradebook.save()
+        self._create_entry(self.users[1], 0.1, proforma_grade=0.5)
+        later = datetime.now(UTC()) + timedelta(minutes=1)
+
+        self.assertEqual(StudentGradebookChange.compact(later, batch_size=2), 2)
+        self.assertEqual(
+            sorted((change['user_id'], change['grade']) for change in StudentGradebookChange.get_changes()),
+            [(self.users[0].id, 0.4), (self.users[1].id, 0.1)]
+        )
+        self.assertEqual(StudentGradebookChange.expire(later), 2)
+        self.assertFalse(StudentGradebookChange.objects.exists())
+
+
+@override_settings(MODULESTORE=MODULESTORE_CONFIG)
+@override_settings(GRADEBOOK_BLOB_STORE=True)
+class GradebookBlobStoreTests(ModuleStoreTestCase):
+    """ Test suite for the content-addressed gradebook blob store """
+
+    def setUp(self):
+        super(GradebookBlobStoreTests, self).setUp()
+        self.course = CourseFactory.create()
+        self.grading_policy = json.dumps({'GRADER': [], 'GRADE_CUTOFFS': {'Pass': 0.5}})
+
+    def _create_gradebook(self, user, grade):
+        """ Creates a gradebook entry for the user """
+        return StudentGradebook.objects.create(
+            user=user,
+            course_id=self.course.id,
+            grade=grade,
+            proforma_grade=grade,
+            progress_summary=json.dumps({'progress': grade}),
+            grade_summary=json.dumps({'grade': grade}),
+            grading_policy=self.grading_policy
+        )
+
+    def test_blobs_are_stored_once(self):
+        users = [UserFactory() for __ in xrange(2)]
+        for user, grade in zip(users, [0.5, 0.6]):
+            gradebook = self._create_gradebook(user, grade)
+            self.assertEqual(gradebook.grading_policy, self.grading_policy)
+
+        # Two progress summaries, two grade summaries and a single grading policy
+        self.assertEqual(GradebookBlob.objects.count(), 5)
+        for user, grade in zip(users, [0.5, 0.6]):
+            for model in [StudentGradebook, StudentGradebookHistory]:
+                entry = model.objects.get(user=user, course_id=self.course.id)
+                self.assertEqual(entry.grading_policy, '')
+                self.assertEqual(entry.get_blob_text('grading_policy'), self.grading_policy)
+                self.assertEqual(json.loads(entry.get_blob_text('grade_summary')), {'grade': grade})
+
+    def test_update_offloaded_entry(self):
+        gradebook = self._create_gradebook(self.user, 0.5)
+        gradebook = StudentGradebook.objects.get(id=gradebook.id)
+        gradebook.grade = 0.7
+        gradebook.save()
+
+        gradebook = StudentGradebook.objects.get(id=gradebook.id)
+        self.assertEqual(gradebook.grade, 0.7)
+        self.assertEqual(json.loads(gradebook.get_blob_text('progress_summary')), {'progress': 0.5})
+        self.assertFalse(gradebook.update_values({
+            'grade': 0.7,
+            'proforma_grade': 0.5,
+            'progress_summary': json.dumps({'progress': 0.5}),
+            'grade_summary': json.dumps({'grade': 0.5}),
+            'grading_policy': self.grading_policy,
+        }))
+
+    def test_prefetch_blobs(self):
+        users = [UserFactory() for __ in xrange(3)]
+        for user, grade in zip(users, [0.5, 0.6, 0.7]):
+            self._create_gradebook(user, grade)
+
+        entries = list(StudentGradebook.deferred.with_summaries('progress_summary').filter(user__in=users))
+        with self.assertNumQueries(1):
+            StudentGradebook.prefetch_blobs(entries, 'progress_summary')
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                sorted(entry.parsed_progress_summary['progress'] for entry in entries),
+                [0.5, 0.6, 0.7]
+            )
+
+
+class CompiledGradingPolicyTests(ModuleStoreTestCase):
+    """ Test suite for the compiled grading policy cache """
+
+    def setUp(self):
+        super(CompiledGradingPolicyTests, self).setUp()
+        clear_compiled_grading_policies()
+        self.addCleanup(clear_compiled_grading_policies)
+        self.course = CourseFactory.create()
+        self.course.grading_policy = {
+            "GRADER": [{
+                "type": "Homework",
+                "min_count": 2,
+                "drop_count": 1,
+                "weight": 0.4
+            }, {
+                "type": "Final Exam",
+                "min_count": 1,
+                "drop_count": 0,
+                "weight": 0.6
+            }],
+            "GRADE_CUTOFFS": {"Pass": 0.5, "Distinction": 0.9}
+        }
+        self.course = self.update_course(self.course, self.user.id)
+
+    def test_compiled_policy(self):
+        grading_policy = get_compiled_grading_policy(self.course)
+        self.assertEqual(grading_policy.types, ('Homework', 'Final Exam'))
+        self.assertEqual(grading_policy.weights, (0.4, 0.6))
+        self.assertEqual(grading_policy.drop_counts, (1, 0))
+        self.assertEqual(grading_policy.letter_grades, ('Distinction', 'Pass'))
+        self.assertEqual(grading_policy.letter_grade(0.95), 'Distinction')
+        self.assertEqual(grading_policy.letter_grade(0.5), 'Pass')
+        self.assertIsNone(grading_policy.letter_grade(0.2))
+        self.assertEqual(json.loads(grading_policy.grading_policy_json), self.course.grading_policy)
+
+        grade_summary = grading_policy.grade({})
+        self.assertEqual(grade_summary['percent'], 0)
+        self.assertIsNone(grade_summary['grade'])
+
+    def test_compiled_policy_cache(self):
+        grading_policy = get_compiled_grading_policy(self.course)
+        self.assertIs(get_compiled_grading_policy(_get_course_descriptor(self.course.id)), grading_policy)
+
+        with override_settings(GRADEBOOK_GRADING_POLICY_CACHE_SIZE=1):
+            other_course = CourseFactory.create()
+            get_compiled_grading_policy(other_course)
+            self.assertIsNot(get_compiled_grading_policy(self.course), grading_policy)
+
+    def test_empty_graded_sections_are_ignored(self):
+        def _section(name, assignment_type, scores):
+            """ Builds a graded section of a stored progress summary """
+            return {
+                'display_name': name,
+                'format': assignment_type,
+                'graded': True,
+                'scores': [[earned, possible, True, name, None] for earned, possible in scores],
+                'section_total': [
+                    sum(earned for earned, __ in scores), sum(possible for __, possible in scores), True, name, None
+                ],
+            }
+
+        progress_summaries = [
+            [{'sections': [
+                _section('Homework 1', 'Homework', [(1, 2)]),
+                _section('Homework 2', 'Homework', []),
+                _section('Homework 3', 'Homework', [(2, 2), (0, 0)]),
+                _section('Final Exam', 'Final Exam', [(3, 4)]),
+            ]}],
+            [{'sections': [
+                _section('Homework 1', 'Homework', [(2, 2)]),
+                _section('Homework 2', 'Homework', []),
+                _section('Homework 3', 'Homework', [(0, 2), (0, 0)]),
+                _section('Final Exam', 'Final Exam', [(4, 4)]),
+            ]}],
+        ]
+        self.assertEqual(
+            [section['display_name'] for section, __, __ in graded_sections(progress_summaries[0])],
+            ['Homework 1', 'Homework 3', 'Final Exam']
+        )
+
+        grading_policy = get_compiled_grading_policy(self.course)
+        percents, __ = grading_policy.grade_arrays(section_score_arrays(progress_summaries), 2)
+        for progress_summary, percent in zip(progress_summaries, percents):
+            self.assertEqual(len(totaled_scores(progress_summary)['Homework']), 2)
+            self.assertAlmostEqual(grading_policy.grade(totaled_scores(progress_summary))['percent'], percent)
+        self.assertAlmostEqual(percents[0], 0.85)
+        self.assertAlmostEqual(percents[1], 1.0)
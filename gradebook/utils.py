@@ -0,0 +1,93 @@
+"""
+Helper functions shared by the gradebook models, tasks and management commands
+"""
+import base64
+import hashlib
+import json
+
+from django.utils.dateparse import parse_datetime
+from xmodule.modulestore import EdxJSONEncoder
+
+
+# Shared encoder, rather than the new EdxJSONEncoder json.dumps(cls=...) builds on every call
+BLOB_ENCODER = EdxJSONEncoder()
+
+
+def serialize_blob(value):
+    """
+    Serializes a progress summary, grade summary or grading policy for storage
+    """
+    return BLOB_ENCODER.encode(value)
+
+
+def blob_hash(text):
+    """
+    Returns the content hash of a serialized blob
+    """
+    if isinstance(text, unicode):
+        text = text.encode('utf-8')
+    return hashlib.sha1(text).hexdigest()
+
+
+def encode_keyset_cursor(*values):
+    """
+    Encodes the keyset values (numbers, strings and datetimes) of the last row of a page into
+    an opaque, URL safe cursor
+    """
+    return base64.urlsafe_b64encode(json.dumps([
+        {'datetime': value.isoformat()} if hasattr(value, 'isoformat') else value for value in values
+    ]))
+
+
+def decode_keyset_cursor(cursor):
+    """
+    Returns the keyset values encoded in a cursor. Raises ValueError for a malformed cursor.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(str(cursor)))
+    except (TypeError, ValueError):
+        raise ValueError('Invalid cursor: {}'.format(cursor))
+    return [
+        parse_datetime(value['datetime']) if isinstance(value, dict) else value for value in values
+    ]
+
+
+def grade_bucket_bound(index, bucket_count):
+    """
+    Returns the lower bound of the grade histogram bucket at the given index
+    """
+    return index / float(bucket_count)
+
+
+def grade_bucket(grade, bucket_count):
+    """
+    Returns the index of the histogram bucket holding the grade: bucket i holds the grades in
+    [i / bucket_count, (i + 1) / bucket_count), the first and last buckets also those below 0
+    and from 1 up. The bounds are compared the way the database compares them when histograms
+    are recomputed, so that float rounding can't put a grade in a neighbouring bucket.
+    """
+    index = min(max(int(grade * bucket_count), 0), bucket_count - 1)
+    if index < bucket_count - 1 and grade >= grade_bucket_bound(index + 1, bucket_count):
+        index += 1
+    elif index > 0 and grade < grade_bucket_bound(index, bucket_count):
+        index -= 1
+    return index
+
+
+def histogram_percentile(histogram, percentile):
+    """
+    Returns the approximate grade below which the given percentage of the counted grades fall,
+    interpolated linearly within the histogram bucket where it lies, or None for an empty
+    histogram
+    """
+    total = sum(histogram)
+    if not total:
+        return None
+    rank = total * min(max(percentile, 0), 100) / 100.0
+    bucket_count = len(histogram)
+    cumulated = 0
+    for index, count in enumerate(histogram):
+        if count and cumulated + count >= rank:
+            return grade_bucket_bound(index + (rank - cumulated) / float(count), bucket_count)
+        cumulated += count
+    return 1.0